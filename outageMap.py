@@ -0,0 +1,308 @@
+import argparse
+import sys
+import time
+
+# Command line interface to the OutageMap pipeline. Every stage is imported inside its command
+# so that only the modules a stage needs are loaded.
+
+def importCommand(args):
+    from util.pipeline import importNetwork
+    importNetwork(args.network, plot=not args.no_plot, resume=not args.restart, demPath=args.dem, canopyPath=args.canopy)
+
+def weatherCommand(args):
+    from util.pipeline import loadParameters, collectWeather, collectEdgeWeather
+    hazards = loadParameters(args.params)["hazards"]
+    if args.grid and args.stats_only:
+        from util.streamingStats import collectGriddedStats
+        collectGriddedStats(args.network, args.grid, args.events, args.interpolation, chunkHours=args.chunk_hours, hazards=hazards)
+        return
+    if args.grid:
+        from util.gridWeather import collectGriddedWeather
+        collectGriddedWeather(args.network, args.grid, args.events, args.interpolation, hazards=hazards)
+    elif args.catalog:
+        from util.eventCatalog import collectCatalogWeather
+        collectCatalogWeather(args.network, args.events, args.start, args.end, args.margin, resume=not args.restart, hazards=hazards)
+    else:
+        collectWeather(args.network, args.events, resume=not args.restart, hazards=hazards)
+    if args.edge_files:
+        collectEdgeWeather(args.network)
+
+def impactCommand(args):
+    from util.pipeline import loadParameters, computeWeatherImpact
+    computeWeatherImpact(args.network, loadParameters(args.params))
+
+def outageCommand(args):
+    from util.pipeline import loadParameters, computeOutageProbability, saveOutageProbability
+    if args.chunk_size:
+        from util.chunked import computeOutageProbabilityChunked
+        results = computeOutageProbabilityChunked(args.network, args.event, loadParameters(args.params, sources=args.sources), args.chunk_size)
+        print(f"Mean probability of an outage: {results['prob'].mean():.4f}")
+        return
+    if args.all_events:
+        from util.eventPool import computeOutageProbabilityEvents
+        results = computeOutageProbabilityEvents(args.network, None, loadParameters(args.params, sources=args.sources), args.workers)
+        for eventName, prob in zip(results["events"], results["prob"]):
+            print(f"{eventName}: mean probability of an outage {prob.mean():.4f}")
+        return
+    from util.loadAtRisk import loadAtRiskForEvent
+    results = computeOutageProbability(args.network, args.event, loadParameters(args.params, sources=args.sources))
+    nodeLoadAtRisk, feederLoadAtRisk = loadAtRiskForEvent(args.network, args.event, results)
+    df = saveOutageProbability(args.network, args.event, results, nodeLoadAtRisk)
+    print(f"Mean probability of an outage: {df['mean'].mean():.4f}")
+    for name, (low, high, mean) in feederLoadAtRisk.items():
+        print(f"Feeder {name}: {mean:.2f} (low {low:.2f}, high {high:.2f})")
+
+def sensitivityCommand(args):
+    from util.pipeline import loadParameters
+    from util.sensitivity import computeOutageSensitivities, saveSensitivities
+    results = computeOutageSensitivities(args.network, args.event, loadParameters(args.params), args.groups)
+    df = saveSensitivities(args.network, args.event, results)
+    # Largest sensitivities of the expected kW interrupted first
+    df = df.reindex(df["expectedKW high"].abs().sort_values(ascending=False).index)
+    print(df.head(args.top).to_string(index=False))
+
+def calibrateCommand(args):
+    from util.pipeline import loadParameters, saveParameters
+    from util.calibration import calibrateFragility
+    fitted, report = calibrateFragility(args.network, args.records, loadParameters(args.params), args.groups, args.prior, workers=args.workers)
+    output = args.output or f"{args.network}/fittedParameters.json"
+    saveParameters(fitted, output)
+    print(f"Negative log likelihood of {report['records']} records: {report['initialNLL']:.2f} -> {report['finalNLL']:.2f} ({report['message']})")
+    for name, value in report["values"].items():
+        print(f"{name}: {value:.4f}")
+    print(f"Wrote the fitted parameters to {output}")
+
+def renderCommand(args):
+    from util.pipeline import renderOutageMap
+    renderOutageMap(args.network, args.event, args.title)
+
+def feedersCommand(args):
+    from util.feederRunner import discoverFeeders, runFeeders, rollUp
+    from util.pipeline import loadParameters
+    feeders = args.feeders or discoverFeeders(args.root)
+    print(f"Found {len(feeders)} feeders")
+    status, _ = runFeeders(feeders, args.stages, loadParameters(args.params), args.events, args.workers, args.memory_limit)
+    for row in status:
+        if row["status"] != "done":
+            print(f"{row['feeder']}: {row['stage']} {row['status']} {row['error']}")
+    results, summary = rollUp(feeders, args.root)
+    if len(summary):
+        print(summary.to_string(index=False))
+
+def animateCommand(args):
+    from util.pipeline import loadParameters
+    from util.animation import renderOutageAnimation
+    path = renderOutageAnimation(args.network, args.event, args.output, loadParameters(args.params), args.fps, args.title)
+    print(f"Wrote {path}")
+
+def whatifCommand(args):
+    import json
+    from util.pipeline import loadParameters
+    from util.switching import SwitchingStudy
+    study = SwitchingStudy(args.network, args.event, loadParameters(args.params, sources=args.sources))
+    candidates = []
+    if args.candidates:
+        with open(args.candidates) as f:
+            candidates = json.load(f)
+    if args.open or args.close:
+        candidates.append({"name": "command line", "open": args.open, "close": args.close})
+    print(study.compare(candidates).to_string(index=False))
+
+def tilesCommand(args):
+    from util.tiles import buildOutageTiles
+    written = buildOutageTiles(args.network, args.event, args.output, args.max_zoom, args.min_zoom, args.tile_size, args.layers,
+                               png=not args.no_png, incremental=not args.full)
+    for layer, count in written.items():
+        print(f"{layer}: {count} tiles written")
+
+def queryCommand(args):
+    import pandas as pd
+    from util.pipeline import outageResultsPath
+    from util.spatialIndex import SpatialIndex, topK
+    index = SpatialIndex.forNetwork(args.network)
+    results = pd.read_csv(outageResultsPath(args.network, args.event, args.kind), index_col=0)
+    if args.box:
+        candidates = index.withinBox(*args.box, kind=args.kind)
+    elif args.near and args.radius:
+        candidates = index.withinRadius(*args.near, args.radius, kind=args.kind)
+    elif args.near:
+        candidates, _ = index.nearest(*args.near, k=args.top, kind=args.kind)
+    else:
+        candidates = None
+    weights = results[args.weight].values if args.weight else None
+    for i, score in topK(results["mean"].values, args.top, candidates, weights):
+        print(f"{i}\t{results['name'][i]}\t{score:.4f}")
+
+def exportCommand(args):
+    from util.geoExport import exportResults
+    path, count = exportResults(args.network, args.event, args.output, args.format, args.components, args.chunk_size)
+    print(f"Wrote {count} features to {path}")
+
+def runCommand(args):
+    from util.pipeline import loadParameters
+    from util.stageCache import runCached
+    for row in runCached(args.network, args.stages, loadParameters(args.params), args.events, args.force):
+        print(f"{row['stage']}: {row['status']} ({row['key'][:12]})")
+
+def streamCommand(args):
+    from util.pipeline import loadParameters
+    from util.overlapped import runOverlapped
+    start = time.perf_counter()
+    rows = runOverlapped(args.network, args.events, loadParameters(args.params), queueSize=args.queue_size, resume=not args.restart)
+    for row in rows:
+        print(f"{row['event']}: mean probability of an outage {row['meanProb']:.4f} (fetch {row['fetchSeconds']:.1f}s, compute {row['computeSeconds']:.1f}s)")
+    print(f"Total {time.perf_counter() - start:.1f}s, fetch {sum(row['fetchSeconds'] for row in rows):.1f}s, compute {sum(row['computeSeconds'] for row in rows):.1f}s")
+
+def serveCommand(args):
+    # The service sets the number of threads of the numerical libraries before numpy is imported
+    from util.service import serve
+    from util.pipeline import loadParameters
+    serve(args.networks, loadParameters(args.params), args.host, None if args.no_http else args.port, args.socket, args.workers, args.verbose)
+
+def buildParser():
+    """
+    Creates the argument parser with one subcommand per pipeline stage.
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser(prog="outageMap", description="Generate weather related outage data for a power distribution network.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def addCommand(name, function, help):
+        subparser = subparsers.add_parser(name, help=help)
+        subparser.add_argument("--network", default="P3R", help="Folder name corresponding to the network data")
+        subparser.set_defaults(function=function)
+        return subparser
+
+    subparser = addCommand("import", importCommand, "Extract the network from its OpenDSS files")
+    subparser.add_argument("--no-plot", action="store_true", help="Do not draw the imported network")
+    subparser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of a previous run and query every node again")
+    subparser.add_argument("--dem", default=None, help="Local DEM GeoTIFF in meters, used with --canopy instead of 3DEP and NLCD")
+    subparser.add_argument("--canopy", default=None, help="Local NLCD tree canopy cover GeoTIFF, used with --dem")
+
+    subparser = addCommand("weather", weatherCommand, "Collect the weather of every node and edge")
+    subparser.add_argument("--events", default="32123.xlsx", help="Excel file of the weather events")
+    subparser.add_argument("--grid", default=None, help="Local NetCDF or GRIB file to sample instead of querying NLDAS2")
+    subparser.add_argument("--interpolation", default="bilinear", choices=["bilinear", "nearest"], help="Sampling of the grid at the nodes")
+    subparser.add_argument("--stats-only", action="store_true", help="With --grid, only save the statistics of the weather of every node and edge, read a block of hours at a time")
+    subparser.add_argument("--chunk-hours", type=int, default=24, help="With --stats-only, number of hours read at a time")
+    subparser.add_argument("--catalog", action="store_true", help="Select the events near the feeder and fetch every NLDAS2 cell once per merged span of events")
+    subparser.add_argument("--start", default=None, help="With --catalog, only collect the events ending after this date")
+    subparser.add_argument("--end", default=None, help="With --catalog, only collect the events beginning before this date")
+    subparser.add_argument("--margin", type=float, default=0.25, help="With --catalog, distance in degrees around the feeder within which located events are kept")
+    subparser.add_argument("--restart", action="store_true", help="Ignore the checkpoint of a previous run and query every node again")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters, its hazards are collected besides the rain and wind")
+    subparser.add_argument("--edge-files", action="store_true", help="Also save the weather of the edges, which the other stages derive from the nodes")
+
+    subparser = addCommand("impact", impactCommand, "Convert the weather to weather impact scores")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters")
+
+    subparser = addCommand("outage", outageCommand, "Compute the probability of an outage of every node")
+    subparser.add_argument("--event", default="weatherEvent1.csv", help="Name of the event file")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters")
+    subparser.add_argument("--chunk-size", type=int, default=None, help="Stream the components from the weather files in blocks of this size and write memory-mapped results")
+    subparser.add_argument("--sources", type=int, nargs="+", default=None, help="Source nodes (substations), node 0 by default")
+    subparser.add_argument("--all-events", action="store_true", help="Compute every event in {network}/WI/nodes on a pool of processes sharing the network and weather impact arrays")
+    subparser.add_argument("--workers", type=int, default=None, help="With --all-events, number of worker processes (default: every core)")
+
+    subparser = addCommand("sensitivity", sensitivityCommand, "Compute the derivatives of the outage probabilities with respect to meanWI, stdWI and alpha")
+    subparser.add_argument("--event", default="weatherEvent1.csv", help="Name of the event file")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters")
+    subparser.add_argument("--groups", nargs="+", default=None, choices=["meanWI", "stdWI", "alpha"], help="Parameters to differentiate (all by default)")
+    subparser.add_argument("--top", type=int, default=10, help="Number of parameters to print")
+
+    subparser = addCommand("calibrate", calibrateCommand, "Fit meanWI, stdWI and alpha to historical outage records")
+    subparser.add_argument("--records", required=True, help="CSV of outage records with the columns event, component, id and outage")
+    subparser.add_argument("--params", default=None, help="JSON file of the initial pipeline parameters")
+    subparser.add_argument("--groups", nargs="+", default=None, choices=["meanWI", "stdWI", "alpha"], help="Parameters to fit (all by default)")
+    subparser.add_argument("--prior", type=float, default=0.0, help="Weight of the penalty pulling the parameters towards their initial values")
+    subparser.add_argument("--workers", type=int, default=None, help="Number of threads evaluating the events (default: every core)")
+    subparser.add_argument("--output", default=None, help="JSON file of the fitted parameters (default: {network}/fittedParameters.json)")
+
+    subparser = addCommand("render", renderCommand, "Plot the outage map of an event")
+    subparser.add_argument("--event", default="weatherEvent1.csv", help="Name of the event file")
+    subparser.add_argument("--title", default="", help="Title of the plot")
+
+    subparser = addCommand("animate", animateCommand, "Render the probability of an outage of every node over the hours of an event to a GIF or video")
+    subparser.add_argument("--event", default="weatherEvent1.csv", help="Name of the event file")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters")
+    subparser.add_argument("--output", default=None, help="Output .gif, or video file written with ffmpeg (default: {network}/Outage/animation/{event}.gif)")
+    subparser.add_argument("--fps", type=int, default=8, help="Frames (hours) per second")
+    subparser.add_argument("--title", default="", help="Title of the map")
+
+    subparser = addCommand("whatif", whatifCommand, "Score switching configurations of an event, reusing the fragility of every component")
+    subparser.add_argument("--event", default="weatherEvent1.csv", help="Name of the event file")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters")
+    subparser.add_argument("--sources", type=int, nargs="+", default=None, help="Source nodes (substations), node 0 by default")
+    subparser.add_argument("--open", nargs="*", default=[], help="Names of the lines to open")
+    subparser.add_argument("--close", nargs="*", default=[], help="Names of the lines to close, e.g. the open lines of {network}/switchList.csv")
+    subparser.add_argument("--candidates", default=None, help="JSON list of configurations with the keys name, open and close")
+
+    subparser = addCommand("tiles", tilesCommand, "Build the map tile pyramid of the outage results of an event")
+    subparser.add_argument("--event", default="weatherEvent1.csv", help="Name of the event file")
+    subparser.add_argument("--output", default=None, help="Folder of the pyramid (default: {network}/Outage/tiles/{event})")
+    subparser.add_argument("--max-zoom", type=int, default=16, help="Deepest zoom level")
+    subparser.add_argument("--min-zoom", type=int, default=0, help="Shallowest zoom level")
+    subparser.add_argument("--tile-size", type=int, default=64, help="Number of cells along each side of a tile")
+    subparser.add_argument("--layers", nargs="+", default=["nodes", "edges"], choices=["nodes", "edges"], help="Components to tile")
+    subparser.add_argument("--no-png", action="store_true", help="Only write the binary tiles")
+    subparser.add_argument("--full", action="store_true", help="Rewrite every tile instead of the tiles of the components that changed")
+
+    subparser = addCommand("query", queryCommand, "List the most at-risk components of an event, optionally near a location")
+    subparser.add_argument("--event", default="weatherEvent1.csv", help="Name of the event file")
+    subparser.add_argument("--kind", default="nodes", choices=["nodes", "edges"], help="Components to query")
+    subparser.add_argument("--box", nargs=4, type=float, default=None, metavar=("MIN_LON", "MIN_LAT", "MAX_LON", "MAX_LAT"), help="Only consider components inside a bounding box")
+    subparser.add_argument("--near", nargs=2, type=float, default=None, metavar=("LON", "LAT"), help="Only consider components near a point")
+    subparser.add_argument("--radius", type=float, default=None, help="Distance from --near in km (the --top closest components when omitted)")
+    subparser.add_argument("--top", type=int, default=10, help="Number of components to list")
+    subparser.add_argument("--weight", default=None, help="Result column used to weight the probability (e.g. kW or downstreamKW)")
+
+    subparser = addCommand("export", exportCommand, "Stream the outage results of an event to GeoJSON, newline delimited GeoJSON or binary records")
+    subparser.add_argument("--event", default="weatherEvent1.csv", help="Name of the event file")
+    subparser.add_argument("--format", default="geojson", choices=["geojson", "ndjson", "binary"], help="Output format")
+    subparser.add_argument("--output", default=None, help="Output file (default: {network}/Outage/export/{event}.{extension})")
+    subparser.add_argument("--components", nargs="+", default=["nodes", "edges"], choices=["nodes", "edges"], help="Components to export")
+    subparser.add_argument("--chunk-size", type=int, default=100000, help="Number of components read at a time")
+
+    subparser = addCommand("run", runCommand, "Run stages of the pipeline, reusing the cached outputs of the stages whose inputs did not change")
+    subparser.add_argument("--stages", nargs="*", default=["impact", "outage"], choices=["import", "weather", "impact", "outage"], help="Stages to run")
+    subparser.add_argument("--events", default="32123.xlsx", help="Excel file of the weather events")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters")
+    subparser.add_argument("--force", action="store_true", help="Run every stage even when its outputs are cached")
+
+    subparser = addCommand("stream", streamCommand, "Run the weather, impact and outage stages event by event, collecting the weather of the next events during the computation")
+    subparser.add_argument("--events", default="32123.xlsx", help="Excel file of the weather events")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters")
+    subparser.add_argument("--queue-size", type=int, default=2, help="Number of events whose weather can be collected ahead of the computation")
+    subparser.add_argument("--restart", action="store_true", help="Ignore the checkpoints of a previous run and query every node again")
+
+    subparser = subparsers.add_parser("serve", help="Keep networks in memory and answer outage probability requests over HTTP or a Unix socket")
+    subparser.add_argument("--networks", nargs="+", default=["P3R"], help="Folders of the networks to load")
+    subparser.add_argument("--params", default=None, help="JSON file of the base pipeline parameters")
+    subparser.add_argument("--host", default="127.0.0.1", help="Interface of the HTTP server")
+    subparser.add_argument("--port", type=int, default=8765, help="Port of the HTTP server")
+    subparser.add_argument("--no-http", action="store_true", help="Only listen on the Unix socket")
+    subparser.add_argument("--socket", default=None, help="Path of a Unix socket to listen on")
+    subparser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: every core)")
+    subparser.add_argument("--verbose", action="store_true", help="Log every request")
+    subparser.set_defaults(function=serveCommand)
+
+    subparser = subparsers.add_parser("feeders", help="Run the pipeline for every feeder below a folder in parallel")
+    subparser.add_argument("--root", default=".", help="Folder containing the feeder folders")
+    subparser.add_argument("--feeders", nargs="*", default=None, help="Feeder folders to run instead of discovering them")
+    subparser.add_argument("--stages", nargs="*", default=["impact", "outage"], choices=["import", "weather", "impact", "outage"], help="Stages to run")
+    subparser.add_argument("--events", default="32123.xlsx", help="Excel file of the weather events")
+    subparser.add_argument("--params", default=None, help="JSON file of pipeline parameters")
+    subparser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: every core)")
+    subparser.add_argument("--memory-limit", type=int, default=None, help="Memory budget of all workers in MB")
+    subparser.set_defaults(function=feedersCommand)
+
+    return parser
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    args.function(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
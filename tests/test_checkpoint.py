@@ -0,0 +1,33 @@
+from util.checkpoint import Checkpoint, fingerprint
+
+# Checks of the recovery of the checkpoints of the data collection stages
+
+def test_resume_drops_torn_last_line(tmp_path):
+    path = str(tmp_path / "weather.jsonl")
+    with Checkpoint(path, fingerprint("event", 1)) as checkpoint:
+        checkpoint.put("0", {"prcp": [0.5, 1.0]})
+        checkpoint.put("1", {"prcp": [0.0, 2.0]})
+    # The run stopped while writing the third result
+    with open(path, "a") as f:
+        f.write('{"key": "2", "value": {"prc')
+
+    with Checkpoint(path, fingerprint("event", 1)) as checkpoint:
+        assert checkpoint.records == {"0": {"prcp": [0.5, 1.0]}, "1": {"prcp": [0.0, 2.0]}}
+        checkpoint.put("2", {"prcp": [3.0]})
+
+    with Checkpoint(path, fingerprint("event", 1)) as checkpoint:
+        assert sorted(checkpoint.records) == ["0", "1", "2"]
+        assert checkpoint.get("2") == {"prcp": [3.0]}
+
+def test_fingerprint_mismatch_starts_over(tmp_path):
+    path = str(tmp_path / "weather.jsonl")
+    with Checkpoint(path, fingerprint("event", 1)) as checkpoint:
+        checkpoint.put("0", [1, 2, 3])
+
+    with Checkpoint(path, fingerprint("event", 2)) as checkpoint:
+        assert checkpoint.records == {}
+        assert "0" not in checkpoint
+
+    # The discarded results are gone from the file too
+    with Checkpoint(path, fingerprint("event", 2)) as checkpoint:
+        assert checkpoint.records == {}
@@ -0,0 +1,66 @@
+import numpy as np
+
+import util.reliability
+from util.reliability import Reliability
+from util.topology import Topology
+
+# Checks of the connectivity model against the radial propagation and hand computed probabilities
+
+def randomTree(rng, numNodes):
+    # Every node after the root hangs from a random earlier node
+    target = np.arange(1, numNodes)
+    source = np.array([rng.integers(0, node) for node in target])
+    return source, target
+
+def test_radial_matches_propagate():
+    rng = np.random.default_rng(1)
+    source, target = randomTree(rng, 200)
+    probN = rng.random((200, 2)) * 0.1
+    probE = rng.random((199, 2)) * 0.1
+
+    reliability = Reliability(200, source, target)
+    prob, error = reliability.outage(probN, probE)
+
+    assert reliability.isRadial()
+    np.testing.assert_allclose(prob, Topology.fromEdges(source, target, 200).propagate(probN, probE))
+    assert not error.any()
+
+def test_loop_enumeration_matches_hand_computation():
+    # Loop 0-1-2-3-0 fed at node 0, with node 4 hanging from node 2
+    source = np.array([0, 1, 2, 3, 2])
+    target = np.array([1, 2, 3, 0, 4])
+    q = np.array([0.05, 0.1, 0.2, 0.15, 0.3])
+    pa, pb, pc, pd, pe = 0.1, 0.2, 0.3, 0.25, 0.05
+    w = 1 - q
+
+    # Node 2 is energized through 0-1-2 or 0-3-2, node 1 through edge a or the long way around
+    left = (1 - pa) * w[1] * (1 - pb)
+    right = (1 - pd) * w[3] * (1 - pc)
+    e2 = w[0] * w[2] * (1 - (1 - left) * (1 - right))
+    e1 = w[0] * w[1] * (1 - pa * (1 - right * w[2] * (1 - pb)))
+    e3 = w[0] * w[3] * (1 - pd * (1 - left * w[2] * (1 - pc)))
+    e4 = e2 * w[4] * (1 - pe)
+    expected = 1 - np.array([w[0], e1, e2, e3, e4])
+
+    prob, error = Reliability(5, source, target).outage(q, np.array([pa, pb, pc, pd, pe]))
+
+    np.testing.assert_allclose(prob, expected)
+    assert not error.any()
+
+def test_monte_carlo_within_error(monkeypatch):
+    # Ladder of 2x4 nodes fed at both ends of a rail: 8 nodes and 10 edges, too many to enumerate
+    source = np.array([0, 1, 2, 4, 5, 6, 0, 1, 2, 3])
+    target = np.array([1, 2, 3, 5, 6, 7, 4, 5, 6, 7])
+    rng = np.random.default_rng(2)
+    probN = rng.random((8, 2)) * 0.2
+    probE = rng.random((10, 2)) * 0.3
+    reliability = Reliability(8, source, target, sources=[0, 3])
+    assert len(reliability.coreNodes) + len(reliability.coreEdges) > util.reliability.EXACT_LIMIT
+
+    prob, error = reliability.outage(probN, probE, samples=20000)
+    monkeypatch.setattr(util.reliability, "EXACT_LIMIT", 18)
+    exact, exactError = reliability.outage(probN, probE)
+
+    assert not exactError.any()
+    assert (error > 0).all()
+    assert (np.abs(prob - exact) <= error).all()
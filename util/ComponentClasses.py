@@ -12,7 +12,7 @@ class Bus:
 
 # Load Component Class
 class Load:
-    def __init__(self, name, bus, kV, kW, kvar, vminpu, vmaxpu, phases):
+    def __init__(self, name, bus, kV, kW, kvar, vminpu, vmaxpu, phases, yearly=None):
         # Load Name
         self.name = name
         
@@ -36,6 +36,9 @@ class Load:
         # Number of phases in load
         self.phases = phases
 
+        # Name of the yearly load shape of the load
+        self.yearly = yearly
+
 
 
 # Line Component Class
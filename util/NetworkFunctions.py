@@ -1,7 +1,4 @@
 import re
-import pynldas2 as nldas
-import pygeohydro as gh
-import py3dep
 import numpy as np
 from math import radians, sin, cos, sqrt, atan2, degrees
 from datetime import datetime
@@ -97,6 +94,9 @@ def getWeatherByCoords(lon,lat,start,end):
     data (dict): Dictionary corresponding to the hour climatology data associated with the data and location
     """
 
+    # Imported here so that the geospatial stack is only loaded when weather is collected
+    import pynldas2 as nldas
+
     data =nldas.get_bycoords(list(zip([lon],[lat])),start,end) 
     return data
 
@@ -110,6 +110,8 @@ def getLandCover(coords):
     Returns:
     tcc (float): Value corresponding to the tree canopy coverage in that area
     """
+    import pygeohydro as gh
+
     # Grab latitude and longitude from coords
     lon = coords[0]
     lat = coords[1]
@@ -133,6 +135,8 @@ def getElevationByCoords(coords):
     Returns:
     elevation (float): Value corresponding to the elevation in meters
     """
+   import py3dep
+
    # Elevation Acquisition (in meters)
    elevation = py3dep.elevation_bycoords(coords, crs=4326) 
    return elevation
@@ -360,6 +364,8 @@ def findAvgLineVegetation(bus1,bus2, nodes, n):
     # Interpolate points between the two coordinates
     lat,lon = interpolate_points(start_lat, start_lon, end_lat, end_lon, n)
     
+    import pygeohydro as gh
+
     # Retrieve vegetation data (e.g., canopy cover) for the interpolated points
     tcc = gh.nlcd_bycoords(zip(lon,lat),years={"canopy": [2019]})
     
@@ -0,0 +1,189 @@
+import numpy as np
+
+# Animated outage maps over the hours of an event. The probability of an outage of every node is
+# computed for every hour from the hourly weather (every hour is one more column of the outage
+# model). The network is drawn once on a headless Agg canvas: the lines as one LineCollection and
+# the nodes as one scatter whose pixels are recorded once. Every frame then restores the saved
+# background, paints the pixels of the nodes with the colors of their probabilities and redraws
+# the clock (blitting), and the pixels of the canvas are sent straight to the GIF or video encoder.
+
+def hourlyWeatherImpact(network, component, eventName, params, features):
+    """
+    Weather impact of every component for every hour of an event, scored from the hourly values of
+    every hazard instead of their min and max.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        component (str): "nodes" or "edges".
+        eventName (str): Name of the event file.
+        params (dict): Pipeline parameters.
+        features (List[str]): Features of the components.
+
+    Returns:
+        wi (Dict[str, np.ndarray]): Weather impact of every feature, shape (components, hours).
+        hours (List[str]): Hours of the event.
+    """
+    from util.hazards import DEFAULT_HAZARDS, alphaMatrix, hazardFolder, hazardLevels
+    from util.mainHelper import findWeatherLevels
+    from util.pipeline import readComponentWeather
+
+    hazards = params.get("hazards", DEFAULT_HAZARDS)
+    series = [readComponentWeather(network, hazardFolder(hazard), component, eventName) for hazard in hazards]
+    # Scores of every hazard for every component and hour, shape (hazards, components, hours)
+    scores = np.stack([findWeatherLevels(df.values, levels) for levels, df in zip(hazardLevels(params, hazards), series)])
+    wi = np.round(np.einsum("fh,hct->fct", alphaMatrix(params, features, hazards), scores), 3)
+    return {feature: wi[f] for f, feature in enumerate(features)}, list(series[0].columns)
+
+def hourlyOutageProbability(network, eventName="weatherEvent1.csv", params=None):
+    """
+    Computes the probability of an outage of every node for every hour of an event.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file in {network}/Rain and {network}/Wind (and the other hazards).
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+
+    Returns:
+        prob (np.ndarray): Probability of an outage of every node, shape (nodes, hours).
+        hours (List[str]): Hours of the event.
+    """
+    from util.pipeline import defaultParameters, loadNetwork, prepareOutageModel, evaluateOutageModel
+
+    params = params or defaultParameters()
+    nodes, edges = loadNetwork(network)
+    model = prepareOutageModel(nodes, edges, params)
+    wiNodes, hours = hourlyWeatherImpact(network, "nodes", eventName, params, params["nodeFeatures"])
+    wiEdges, _ = hourlyWeatherImpact(network, "edges", eventName, params, params["edgeFeatures"])
+    return evaluateOutageModel(model, wiNodes, wiEdges)["prob"], hours
+
+# Frame Encoder Class writing the RGBA pixels of frames to a GIF (Pillow) or to a video (ffmpeg)
+class FrameEncoder:
+    def __init__(self, path, width, height, fps):
+        # Output file, its format is taken from the extension
+        self.path = path
+        self.size = (width, height)
+        self.fps = fps
+
+        # GIF frames (palette images) or the ffmpeg process
+        self.frames = []
+        self.process = None
+        if not path.lower().endswith(".gif"):
+            import shutil
+            import subprocess
+            if shutil.which("ffmpeg") is None:
+                raise RuntimeError("ffmpeg is needed to write videos, write a .gif instead")
+            self.process = subprocess.Popen(["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}",
+                                             "-r", str(fps), "-i", "-", "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", path],
+                                            stdin=subprocess.PIPE)
+
+    def write(self, rgba):
+        """
+        Encodes a frame.
+
+        Args:
+            rgba (memoryview or np.ndarray): Pixels of the frame, shape (height, width, 4).
+        """
+        if self.process is not None:
+            self.process.stdin.write(bytes(rgba))
+            return
+        from PIL import Image
+        image = Image.frombuffer("RGBA", self.size, bytes(rgba), "raw", "RGBA", 0, 1).convert("RGB")
+        # Every frame uses the palette of the first one, which holds the whole colormap and the background
+        palette = self.frames[0] if self.frames else image.quantize(colors=256)
+        self.frames.append(palette if not self.frames else image.quantize(palette=palette, dither=Image.Dither.NONE))
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError(f"ffmpeg could not write {self.path}")
+        elif self.frames:
+            # The frames share one palette, so Pillow only has to crop them to the region that changed
+            self.frames[0].save(self.path, save_all=True, append_images=self.frames[1:], duration=int(1000 / self.fps), loop=0, optimize=False)
+
+def renderOutageAnimation(network, eventName="weatherEvent1.csv", path=None, params=None, fps=8, title="", prob=None, hours=None, dpi=100):
+    """
+    Renders the probability of an outage of every node over the hours of an event to a GIF or video.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        path (str or None): Output file, .gif or any video format of ffmpeg (default: {network}/Outage/animation/{event}.gif).
+        params (dict or None): Pipeline parameters, used when prob is not given.
+        fps (int): Frames (hours) per second.
+        title (str): Title of the map.
+        prob (np.ndarray or None): Probability of every node for every frame, shape (nodes, frames), from
+            hourlyOutageProbability when not given.
+        hours (List[str] or None): Label of every frame.
+        dpi (int): Resolution of the frames.
+
+    Returns:
+        path (str): The file written.
+    """
+    import os
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import LinearSegmentedColormap
+    from matplotlib.figure import Figure
+    from util.pipeline import loadNetwork, nodePositions
+
+    if prob is None:
+        prob, hours = hourlyOutageProbability(network, eventName, params)
+    hours = hours if hours is not None else [str(t) for t in range(prob.shape[1])]
+    if path is None:
+        os.makedirs(f"{network}/Outage/animation", exist_ok=True)
+        path = f"{network}/Outage/animation/{os.path.splitext(eventName)[0]}.gif"
+
+    nodes, edges = loadNetwork(network)
+    positions = np.array(list(nodePositions(nodes).values()), dtype=float)
+    segments = np.stack([positions[edges["source"].values], positions[edges["target"].values]], axis=1)
+
+    # Same colors as plotTreeWithProb, nodes without a probability are grey
+    colormap = LinearSegmentedColormap.from_list('GreenRed', ['green', 'red'])
+    colormap.set_bad("lightgrey")
+
+    # The figure is not attached to pyplot, so no display is needed
+    fig = Figure(constrained_layout=True, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.add_collection(LineCollection(segments, colors="black", linewidths=0.8))
+    nodeArtist = ax.scatter(positions[:, 0], positions[:, 1], c=prob[:, 0], cmap=colormap, vmin=0, vmax=1, s=20, zorder=2, animated=True)
+    clock = ax.text(0.01, 0.99, "", transform=ax.transAxes, va="top", animated=True)
+    ax.set_axis_off()
+    ax.set_title(title)
+    fig.colorbar(nodeArtist, ax=ax).set_label('Probability of an Outage')
+
+    # Draw the static parts once and keep them as the background of every frame
+    canvas.draw()
+    fig.set_layout_engine("none")
+    background = canvas.copy_from_bbox(fig.bbox)
+    width, height = canvas.get_width_height()
+
+    # Pixels covered by every node: the scatter is drawn once more, without antialiasing, with the
+    # index of every node (plus one) encoded in its color, and read back from the canvas
+    pixels = np.asarray(canvas.buffer_rgba())
+    pixels[...] = 0
+    index = np.arange(1, len(positions) + 1)
+    nodeArtist.set_array(None)
+    nodeArtist.set_facecolor(np.stack([(index >> 16) & 255, (index >> 8) & 255, index & 255, np.full(len(index), 255)], axis=1) / 255)
+    nodeArtist.set_antialiased(False)
+    ax.draw_artist(nodeArtist)
+    covered = pixels[..., 3] > 0
+    nodeOfPixel = ((pixels[..., 0].astype(np.int64) << 16) | (pixels[..., 1].astype(np.int64) << 8) | pixels[..., 2])[covered] - 1
+
+    # Color of 256 probability levels, and of the nodes without a probability at the end
+    palette = (colormap(np.append(np.linspace(0, 1, 256), np.nan)) * 255).astype(np.uint8)
+
+    encoder = FrameEncoder(path, width, height, fps)
+    try:
+        for t in range(prob.shape[1]):
+            canvas.restore_region(background)
+            # Only the colors of the nodes change: their pixels are painted from the palette
+            levels = np.where(np.isnan(prob[:, t]), 256, np.round(np.clip(np.nan_to_num(prob[:, t]), 0, 1) * 255)).astype(np.int64)
+            pixels[covered] = palette[levels[nodeOfPixel]]
+            clock.set_text(hours[t])
+            ax.draw_artist(clock)
+            encoder.write(canvas.buffer_rgba())
+    finally:
+        encoder.close()
+    return path
@@ -0,0 +1,170 @@
+import copy
+import numpy as np
+
+# Calibration of the fragility curves from historical outage records. Every record says whether a
+# node or edge failed during an event. The weather impact of every component for every event is
+# alpha times the scores of the hazards of the parameters (the wind and rain by default), and its
+# probability of failing is the mean of the low and high fragility probabilities, as in the results
+# of the outage stage. meanWI, stdWI and alpha are fitted by minimizing the negative log likelihood
+# of the records with L-BFGS-B, using the analytic gradients of util/sensitivity.py. The events are
+# stacked on a trailing axis and evaluated in blocks, in parallel threads.
+
+# Allowed range of every group of parameters
+BOUNDS = {"meanWI": (-1.0, 2.0), "stdWI": (1e-3, 2.0), "alpha": (0.0, 1.0)}
+
+# Probabilities are clipped to [EPSILON, 1 - EPSILON] in the likelihood
+EPSILON = 1e-12
+
+def readOutageRecords(path):
+    """
+    Reads historical outage records.
+
+    Args:
+        path (str): CSV file with the columns event (name of the event file, e.g. weatherEvent1.csv),
+            component ("nodes" or "edges", nodes when the column is missing), id (index of the node or
+            edge) and outage (1 when the component failed during the event, 0 otherwise).
+
+    Returns:
+        pd.DataFrame: The records.
+    """
+    import pandas as pd
+
+    records = pd.read_csv(path)
+    if "component" not in records:
+        records["component"] = "nodes"
+    missing = {"event", "id", "outage"} - set(records.columns)
+    if missing:
+        raise ValueError(f"The outage records are missing the columns {sorted(missing)}")
+    return records
+
+def withParameters(params, parameters, theta):
+    """
+    Copies pipeline parameters with new values of some of them.
+
+    Args:
+        params (dict): Pipeline parameters.
+        parameters (List[Tuple[str, str, int]]): Parameters from parameterList.
+        theta (np.ndarray): Value of every parameter.
+
+    Returns:
+        dict: The updated parameters.
+    """
+    params = copy.deepcopy(params)
+    for (group, feature, i), value in zip(parameters, theta):
+        params[group][feature][i] = float(value)
+    return params
+
+# Calibration Data Class holding the scores and records of every component for every event
+class CalibrationData:
+    def __init__(self, network, records, params):
+        from util.pipeline import loadNetwork, computeForecastedRange, componentLevels
+        from util.hazards import eventScores
+
+        # Events of the records, in the order of the trailing axis
+        self.events = sorted(records["event"].unique())
+
+        nodes, edges = loadNetwork(network)
+        self.levels = componentLevels(nodes, edges, params, computeForecastedRange(nodes, edges, params))
+
+        # Scores of every hazard, shape (hazards, components, 2, events), and outcomes, shape (components, events), NaN when unknown
+        source, target = edges["source"].values.astype(int), edges["target"].values.astype(int)
+        scores = [eventScores(network, event, params, source, target) for event in self.events]
+        self.scores, self.outcomes = {}, {}
+        for component, count in [("nodes", len(nodes)), ("edges", len(edges))]:
+            self.scores[component] = np.stack([eventScore[component] for eventScore in scores], axis=-1)
+
+            outcomes = np.full((count, len(self.events)), np.nan)
+            rows = records[records["component"] == component]
+            column = {event: j for j, event in enumerate(self.events)}
+            outcomes[rows["id"].astype(int).values, rows["event"].map(column).values] = rows["outage"].astype(float).values
+            self.outcomes[component] = outcomes
+
+    def negativeLogLikelihood(self, params, parameters, events=slice(None)):
+        """
+        Negative log likelihood of the records of some events and its gradient.
+
+        Args:
+            params (dict): Pipeline parameters.
+            parameters (List[Tuple[str, str, int]]): Parameters from parameterList.
+            events (slice): Events to include.
+
+        Returns:
+            nll (float): Negative log likelihood.
+            grad (np.ndarray): Its derivatives with respect to the parameters.
+            count (int): Number of records used.
+        """
+        from util.hazards import DEFAULT_HAZARDS, alphaMatrix
+        from util.sensitivity import fragilityGradients
+
+        nll, grad, count = 0.0, np.zeros(len(parameters)), 0
+        for component, features in [("nodes", params["nodeFeatures"]), ("edges", params["edgeFeatures"])]:
+            scores = self.scores[component][..., events]
+            outcomes = self.outcomes[component][:, events]
+            # Weather impact of every feature, without the rounding of computeWeatherImpact
+            alpha = alphaMatrix(params, features, params.get("hazards", DEFAULT_HAZARDS))
+            wi = dict(zip(features, np.einsum("fh,hcbe->fcbe", alpha, scores)))
+            prob, probGrad = fragilityGradients(self.levels, wi, features, params, parameters, scores)
+
+            # Mean of the low and high probabilities, shape (components, events)
+            prob, probGrad = prob.mean(axis=1), probGrad.mean(axis=1)
+            known = ~np.isnan(outcomes) & np.isfinite(prob)
+            y = np.where(known, outcomes, 0)
+            p = np.clip(np.where(known, prob, 0.5), EPSILON, 1 - EPSILON)
+            nll -= np.sum(known * (y * np.log(p) + (1 - y) * np.log1p(-p)))
+            dProb = known * ((1 - y) / (1 - p) - y / p)
+            grad += np.einsum("ce,cep->p", dProb, np.nan_to_num(probGrad))
+            count += int(known.sum())
+        return nll, grad, count
+
+def calibrateFragility(network, records, params=None, groups=None, prior=0.0, blockSize=32, workers=None, maxIterations=500):
+    """
+    Fits meanWI, stdWI and alpha to historical outage records.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        records (pd.DataFrame or str): Records from readOutageRecords, or the path of their CSV.
+        params (dict or None): Initial pipeline parameters, defaults to defaultParameters().
+        groups (List[str] or None): Groups of parameters to fit (meanWI, stdWI, alpha), all of them by default.
+        prior (float): Weight of a quadratic penalty pulling the parameters towards their initial values,
+            which keeps the parameters that the records do not constrain in place.
+        blockSize (int): Number of events evaluated at a time.
+        workers (int or None): Number of threads evaluating the blocks of events (default: every core).
+        maxIterations (int): Maximum number of L-BFGS-B iterations.
+
+    Returns:
+        fitted (dict): Pipeline parameters with the fitted values, in the format of defaultParameters.
+        report (dict): Negative log likelihood before (initialNLL) and after (finalNLL) the fit, number of records,
+            iterations, convergence message and the fitted value of every parameter by name.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from scipy.optimize import minimize
+    from util.pipeline import defaultParameters
+    from util.sensitivity import PARAMETER_GROUPS, parameterList, parameterName
+
+    params = params or defaultParameters()
+    if isinstance(records, str):
+        records = readOutageRecords(records)
+    parameters = parameterList(params, groups or PARAMETER_GROUPS)
+    data = CalibrationData(network, records, params)
+    blocks = [slice(start, start + blockSize) for start in range(0, len(data.events), blockSize)]
+
+    theta0 = np.array([params[group][feature][i] for group, feature, i in parameters], dtype=float)
+    bounds = [BOUNDS[group] for group, _, _ in parameters]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def objective(theta):
+            current = withParameters(params, parameters, theta)
+            parts = list(pool.map(lambda block: data.negativeLogLikelihood(current, parameters, block), blocks))
+            nll = sum(part[0] for part in parts) + prior * np.sum((theta - theta0) ** 2)
+            grad = sum(part[1] for part in parts) + 2 * prior * (theta - theta0)
+            return nll, grad
+
+        initial = objective(theta0)[0]
+        result = minimize(objective, np.clip(theta0, *np.array(bounds).T), jac=True, method="L-BFGS-B", bounds=bounds,
+                          options={"maxiter": maxIterations})
+
+    fitted = withParameters(params, parameters, result.x)
+    count = sum(data.negativeLogLikelihood(fitted, [], block)[2] for block in blocks)
+    report = {"initialNLL": float(initial), "finalNLL": float(result.fun), "records": count, "iterations": int(result.nit),
+              "message": str(result.message), "values": {parameterName(parameter): float(value) for parameter, value in zip(parameters, result.x)}}
+    return fitted, report
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+
+# Checkpoints of the data collection stages. Every result fetched from a remote service (elevation,
+# canopy, weather series) is appended to a JSON lines file as soon as it is received, so a run that
+# stops part way resumes from the last stored result. The first line holds a fingerprint of the
+# inputs (network and event definitions), and a checkpoint whose fingerprint differs is discarded.
+
+def fingerprint(*parts):
+    """
+    Hashes the definition of the inputs of a stage.
+
+    Args:
+        *parts: JSON serializable values (e.g. bus names and coordinates, event windows).
+
+    Returns:
+        str: Hex digest of the inputs.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def toJSON(value):
+    # Numpy scalars and arrays returned by the remote services
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Cannot store {type(value)} in a checkpoint")
+
+# Checkpoint Class holding the completed results of a stage, backed by an append-only file
+class Checkpoint:
+    def __init__(self, path, fingerprint, resume=True):
+        # Location of the checkpoint
+        self.path = path
+
+        # Fingerprint of the inputs the results belong to
+        self.fingerprint = fingerprint
+
+        # Completed results by key
+        self.records = {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if resume and os.path.isfile(path):
+            self._read()
+        else:
+            self._start()
+        self.file = open(path, "a")
+
+    def _start(self):
+        # A new checkpoint holding only the header
+        self.records = {}
+        with open(self.path, "w") as f:
+            f.write(json.dumps({"fingerprint": self.fingerprint}) + "\n")
+
+    def _read(self):
+        with open(self.path, "rb") as f:
+            lines = f.read().split(b"\n")
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = {}
+        if header.get("fingerprint") != self.fingerprint:
+            print(f"The inputs changed since {self.path} was written, starting over")
+            self._start()
+            return
+
+        valid = len(lines[0]) + 1
+        # The part after the last newline is empty, or incomplete when the run stopped while writing it
+        for line in lines[1:-1]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            self.records[record["key"]] = record["value"]
+            valid += len(line) + 1
+        # Drop the incomplete line so that new records start on a line of their own
+        with open(self.path, "r+b") as f:
+            f.truncate(valid)
+        print(f"Resuming from {len(self.records)} results stored in {self.path}")
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def get(self, key, default=None):
+        """
+        Returns a stored result.
+
+        Args:
+            key (str): Key of the result.
+            default: Value returned when the result is not stored.
+
+        Returns:
+            The result, as read back from JSON.
+        """
+        return self.records.get(key, default)
+
+    def put(self, key, value):
+        """
+        Stores a result and writes it to disk before returning.
+
+        Args:
+            key (str): Key of the result.
+            value: JSON serializable result (numpy values are converted).
+
+        Returns:
+            The result, as read back from JSON, so that fresh and resumed results are identical.
+        """
+        line = json.dumps({"key": key, "value": value}, default=toJSON)
+        self.file.write(line + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.records[key] = json.loads(line)["value"]
+        return self.records[key]
+
+    def fetch(self, key, function, *args):
+        """
+        Returns a stored result, computing and storing it first when it is missing.
+
+        Args:
+            key (str): Key of the result.
+            function (Callable): Function computing the result.
+            *args: Arguments of the function.
+
+        Returns:
+            The result, as read back from JSON.
+        """
+        if key in self.records:
+            return self.records[key]
+        return self.put(key, function(*args))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
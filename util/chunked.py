@@ -0,0 +1,236 @@
+import os
+import numpy as np
+
+# Out-of-core execution of the weather impact and outage probability stages. Components are
+# streamed from the CSV files in blocks of chunkSize rows, so the peak memory depends on the
+# chunk size and event length instead of the size of the network. Only the compact topology
+# (two integer arrays per node) is held in memory for the propagation through the tree, or the
+# connectivity model of util/reliability.py when the network is not radial.
+
+def featureExtremes(path, columns, chunkSize):
+    """
+    Finds the minimum and maximum of the rounded values of some columns of a CSV in one streaming pass.
+
+    Args:
+        path (str): Path to the CSV.
+        columns (List[str]): Columns to scan.
+        chunkSize (int): Number of rows read at a time.
+
+    Returns:
+        Dict[str, Tuple[float, float]]: Minimum and maximum of every column.
+    """
+    import pandas as pd
+
+    extremes = {column: (np.inf, -np.inf) for column in columns}
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunkSize):
+        for column in columns:
+            vals = np.round(chunk[column].values, 1)
+            low, high = extremes[column]
+            extremes[column] = (min(low, vals.min()), max(high, vals.max()))
+    return extremes
+
+def forecastedRangeFromExtremes(minValue, maxValue, levels, inv=False):
+    """
+    Builds the severity ranges of assign_values_to_ranges from the extremes of the values only.
+
+    Args:
+        minValue (float): Minimum of the values.
+        maxValue (float): Maximum of the values.
+        levels (int): Number of bins.
+        inv (bool): Invert the ranges (higher values are less severe).
+
+    Returns:
+        List[List[float]]: Range of every severity level.
+    """
+    if inv:
+        minValue, maxValue = maxValue, minValue
+    rangeSize = (maxValue - minValue) / levels
+    return [[minValue + i * rangeSize, minValue + (i + 1) * rangeSize] for i in range(levels)]
+
+def streamComponents(staticPath, paths, chunkSize):
+    """
+    Reads the static features and the weather of the same components side by side, one block at a time.
+
+    Args:
+        staticPath (str): Node or edge list.
+        paths (List[str]): Weather of every component for every hazard (e.g. its rain and wind).
+        chunkSize (int): Number of components read at a time.
+
+    Returns:
+        Iterator[Tuple[int, pd.DataFrame, List[np.ndarray]]]: Offset of the block, static features and weather of every hazard.
+    """
+    import pandas as pd
+
+    readers = [pd.read_csv(path, chunksize=chunkSize) for path in [staticPath] + list(paths)]
+    start = 0
+    for static, *series in zip(*readers):
+        series = [block.drop([column for column in block.columns if column.startswith("Unnamed")], axis=1).values.astype(float) for block in series]
+        yield start, static, series
+        start += len(static)
+
+def streamEdgeComponents(staticPath, paths, chunkSize):
+    """
+    Version of streamComponents for the edges when only the weather of the nodes was saved: the weather
+    of every block of edges is the average of the weather of their two nodes, gathered from temporary
+    memory maps of the node series (see weatherMemmap) so that only a block is held in memory.
+
+    Args:
+        staticPath (str): Edge list.
+        paths (List[str]): Weather of every node for every hazard.
+        chunkSize (int): Number of edges read at a time.
+
+    Returns:
+        Iterator[Tuple[int, pd.DataFrame, List[np.ndarray]]]: Offset of the block, static features and weather of every hazard.
+    """
+    import tempfile
+    import pandas as pd
+    from util.pipeline import edgeWeather
+    from util.streamingStats import weatherMemmap
+
+    with tempfile.TemporaryDirectory() as directory:
+        nodeSeries = [weatherMemmap(path, f"{directory}/{i}", chunkSize) for i, path in enumerate(paths)]
+        start = 0
+        for static in pd.read_csv(staticPath, chunksize=chunkSize):
+            source, target = static["source"].astype(int).values, static["target"].astype(int).values
+            yield start, static, [edgeWeather(values, source, target) for values in nodeSeries]
+            start += len(static)
+        del nodeSeries
+
+def componentProbabilities(block, series, features, params, forecastedRange, meanRange, stdRange, alpha, severityLevels):
+    """
+    Computes the severity scores, weather impact and outage probability of a block of components.
+
+    Args:
+        block (pd.DataFrame): Static features of the components.
+        series (List[np.ndarray]): Weather of the components for every hazard, shape (components, hours).
+        features (List[str]): Features of the components.
+        params (dict): Pipeline parameters.
+        forecastedRange (dict): Severity ranges of the physical features.
+        meanRange (dict), stdRange (dict): Fragility curve tables created by createTables.
+        alpha (np.ndarray): Weights of every hazard for every feature, from alphaMatrix.
+        severityLevels (List[list]): Weather severity levels of every hazard, from hazardLevels.
+
+    Returns:
+        wi (Dict[str, np.ndarray]): Low and high weather impact of each feature, shape (components, 2).
+        prob (np.ndarray): Low and high probability of an outage, shape (components, 2).
+    """
+    from util.mainHelper import findLevels
+    from util.correlatedFragility import fragilityProbs
+
+    wi = weatherImpactArrays(series, features, alpha, severityLevels)
+    levels = {feature: findLevels(block[feature.split()[0]].values, feature, forecastedRange, params["numOfBins"]) for feature in features}
+    return wi, fragilityProbs(levels, wi, features, meanRange, stdRange, params.get("correlation"))[0]
+
+def weatherImpactArrays(series, features, alpha, severityLevels):
+    """
+    Array version of weatherImpactMatrix for the hourly series of the hazards (the min and max of the event).
+
+    Args:
+        series (List[np.ndarray]): Weather of the components for every hazard, in the order of the columns of alpha, shape (components, hours).
+        features (List[str]): Features of the components.
+        alpha (np.ndarray): Weights of every hazard for every feature, from alphaMatrix.
+        severityLevels (List[list]): Weather severity levels of every hazard, from hazardLevels.
+
+    Returns:
+        Dict[str, np.ndarray]: Low and high weather impact of each feature, shape (components, 2).
+    """
+    from util.hazards import extremeScores
+
+    # Scores of the min and max of the event, shape (hazards, components, 2)
+    scores = extremeScores([values.min(axis=1) for values in series], [values.max(axis=1) for values in series], severityLevels)
+    wi = np.round(np.einsum("fh,hcb->fcb", alpha, scores), 3)
+    return {feature: wi[f] for f, feature in enumerate(features)}
+
+def computeOutageProbabilityChunked(network, eventName="weatherEvent1.csv", params=None, chunkSize=100000, outputDir=None):
+    """
+    Chunked version of computeWeatherImpact followed by computeOutageProbability for a single event.
+    The results are written to memory-mapped .npy files that can be opened with np.load(path, mmap_mode="r").
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file in {network}/Rain and {network}/Wind (and the other hazards).
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+        chunkSize (int): Number of components processed at a time.
+        outputDir (str or None): Folder of the result arrays, defaults to {network}/Outage/chunked/{event}.
+
+    Returns:
+        Dict[str, np.memmap]: Memory maps of the results
+            - probNodes, probEdges: Low and high probability of an outage of the nodes and edges themselves.
+            - wiNodes, wiEdges: Low and high weather impact of every feature, shape (components, features, 2).
+            - prob: Low and high probability of an outage of every node taking into account its path to the root.
+            - probError: Error bound of prob on the meshed part of the network, None when the network is radial.
+    """
+    import pandas as pd
+    from util.pipeline import defaultParameters
+    from util.hazards import DEFAULT_HAZARDS, alphaMatrix, hazardFolder, hazardLevels
+    from util.mainHelper import createTables
+    from util.topology import Topology
+
+    params = params or defaultParameters()
+    numOfBins = params["numOfBins"]
+    outputDir = outputDir or f"{network}/Outage/chunked/{os.path.splitext(eventName)[0]}"
+    os.makedirs(outputDir, exist_ok=True)
+
+    hazards = params.get("hazards", DEFAULT_HAZARDS)
+    severityLevels = hazardLevels(params, hazards)
+    meanRange, stdRange = createTables(params["stdWI"], params["meanWI"], numOfBins + 1)
+
+    # First pass over the static features to find the severity ranges
+    forecastedRange = {}
+    for component, features in [("nodeList", params["nodeFeatures"]), ("edgeList", params["edgeFeatures"])]:
+        extremes = featureExtremes(f"{network}/{component}.csv", sorted({feature.split()[0] for feature in features}), chunkSize)
+        for feature in features:
+            forecastedRange[feature] = forecastedRangeFromExtremes(*extremes[feature.split()[0]], numOfBins, inv=(feature == "elevation nodes"))
+
+    # Compact topology, the only structure that spans the whole network
+    edgeEnds = pd.read_csv(f"{network}/edgeList.csv", usecols=["source", "target"], dtype=np.int64)
+    numNodes = sum(len(chunk) for chunk in pd.read_csv(f"{network}/nodeList.csv", usecols=["name"], chunksize=chunkSize))
+    sources = params.get("sources", [0])
+    topology = Topology.fromEdges(edgeEnds["source"].values, edgeEnds["target"].values, numNodes, roots=sources)
+    numEdges = len(edgeEnds)
+    # Same test as prepareOutageModel: the tree reaches every node with one edge per node that is not a source
+    radial = len(topology.order) == numNodes and numEdges == numNodes - topology.levelStarts[1]
+    reliability = None
+    if not radial:
+        from util.reliability import Reliability
+        # Loops, several sources or reversed edges need the general connectivity model
+        reliability = Reliability(numNodes, edgeEnds["source"].values, edgeEnds["target"].values, sources)
+    del edgeEnds
+
+    results = {}
+    for key, component, features, count in [("Nodes", "nodes", params["nodeFeatures"], numNodes), ("Edges", "edges", params["edgeFeatures"], numEdges)]:
+        staticPath = f"{network}/{'nodeList' if component == 'nodes' else 'edgeList'}.csv"
+        prob = np.lib.format.open_memmap(f"{outputDir}/prob{key}.npy", mode="w+", dtype=np.float64, shape=(count, 2))
+        wi = np.lib.format.open_memmap(f"{outputDir}/wi{key}.npy", mode="w+", dtype=np.float64, shape=(count, len(features), 2))
+
+        # Second pass streaming the static features and weather of the components
+        alpha = alphaMatrix(params, features, hazards)
+        paths = [f"{network}/{hazardFolder(hazard)}/{component}/{eventName}" for hazard in hazards]
+        stream = streamComponents
+        if component == "edges" and not all(os.path.isfile(path) for path in paths):
+            # The weather of the edges was not saved, it is derived from the nodes
+            paths, stream = [f"{network}/{hazardFolder(hazard)}/nodes/{eventName}" for hazard in hazards], streamEdgeComponents
+        for start, block, series in stream(staticPath, paths, chunkSize):
+            blockWI, blockProb = componentProbabilities(block, series, features, params, forecastedRange, meanRange, stdRange, alpha, severityLevels)
+            end = start + len(block)
+            prob[start:end] = blockProb
+            for f, feature in enumerate(features):
+                wi[start:end, f] = blockWI[feature]
+        prob.flush()
+        wi.flush()
+        results[f"prob{key}"] = prob
+        results[f"wi{key}"] = wi
+
+    # Propagate the outages through the tree, or through the connectivity model when the network is not radial
+    prob = np.lib.format.open_memmap(f"{outputDir}/prob.npy", mode="w+", dtype=np.float64, shape=(numNodes, 2))
+    results["probError"] = None
+    if reliability is None:
+        topology.propagate(results["probNodes"], results["probEdges"], out=prob)
+    else:
+        probError = np.lib.format.open_memmap(f"{outputDir}/probError.npy", mode="w+", dtype=np.float64, shape=(numNodes, 2))
+        prob[:], probError[:] = reliability.outage(results["probNodes"], results["probEdges"], params.get("reliabilitySamples", 10000))
+        probError.flush()
+        results["probError"] = probError
+    prob.flush()
+    results["prob"] = prob
+    return results
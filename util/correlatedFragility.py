@@ -0,0 +1,233 @@
+import numpy as np
+
+# Correlated fragility features. generateProb evaluates a multivariate normal CDF with a diagonal
+# covariance, i.e. the product of the fragility curves of the features. With a correlation between
+# the features the CDF no longer factors, but once the weather impact of every feature is
+# standardized with the mean and standard deviation of its level, every component of a kind shares
+# the same correlation matrix. The components are then evaluated together: in closed form for two
+# features and with randomized quasi-Monte Carlo for more.
+
+# Absolute accuracy of the bivariate normal CDF (Genz, "Numerical computation of rectangular
+# bivariate and trivariate normal and t probabilities", Statistics and Computing, 2004)
+BVN_ERROR = 1e-14
+
+# Standardized weather impacts are clipped to this value, the CDF is 0 or 1 to double precision beyond it
+Z_LIMIT = 38.0
+
+# Gauss-Legendre points and weights on [-1, 1] (positive half) used by the bivariate CDF
+GAUSS_LEGENDRE = {
+    6: ([0.9324695142031522, 0.6612093864662647, 0.2386191860831970],
+        [0.1713244923791705, 0.3607615730481384, 0.4679139345726904]),
+    12: ([0.9815606342467191, 0.9041172563704750, 0.7699026741943050, 0.5873179542866171, 0.3678314989981802, 0.1252334085114692],
+         [0.04717533638651177, 0.1069393259953183, 0.1600783285433464, 0.2031674267230659, 0.2334925365383547, 0.2491470458134029]),
+    20: ([0.9931285991850949, 0.9639719272779138, 0.9122344282513259, 0.8391169718222188, 0.7463319064601508,
+          0.6360536807265150, 0.5108670019508271, 0.3737060887154196, 0.2277858511416451, 0.07652652113349733],
+         [0.01761400713915212, 0.04060142980038694, 0.06267204833410906, 0.08327674157670475, 0.1019301198172404,
+          0.1181945319615184, 0.1316886384491766, 0.1420961093183821, 0.1491729864726037, 0.1527533871307259]),
+}
+
+def correlationMatrix(features, correlation=None):
+    """
+    Builds the correlation matrix of some features from the correlation of pairs of features.
+
+    Args:
+        features (List[str]): Features of the components.
+        correlation (Dict[str, Dict[str, float]] or None): Correlation of pairs of features, e.g.
+            {"elevation nodes": {"vegetation": 0.4}}. Pairs that are not given are uncorrelated.
+
+    Returns:
+        np.ndarray or None: Correlation matrix, shape (features, features), or None when the features are uncorrelated.
+    """
+    matrix = np.eye(len(features))
+    for i, first in enumerate(features):
+        for j, second in enumerate(features):
+            if i == j:
+                continue
+            value = (correlation or {}).get(first, {}).get(second)
+            if value is None:
+                value = (correlation or {}).get(second, {}).get(first, 0.0)
+            matrix[i, j] = value
+    if np.allclose(matrix, np.eye(len(features))):
+        return None
+    if not np.allclose(matrix, matrix.T):
+        raise ValueError(f"The correlation of {features} is not symmetric")
+    try:
+        np.linalg.cholesky(matrix)
+    except np.linalg.LinAlgError:
+        raise ValueError(f"The correlation of {features} is not positive definite")
+    return matrix
+
+def bvnCdf(h, k, r):
+    """
+    Bivariate standard normal CDF P(X < h, Y < k) with correlation r for many points at once, using
+    the algorithm of Drezner and Wesolowsky as refined by Genz. The absolute error is below BVN_ERROR.
+
+    Args:
+        h (np.ndarray), k (np.ndarray): Upper limits of the two variables.
+        r (float): Correlation of the two variables.
+
+    Returns:
+        np.ndarray: The probabilities, with the broadcast shape of h and k.
+    """
+    from scipy.special import ndtr
+
+    h, k = np.broadcast_arrays(-np.asarray(h, dtype=float), -np.asarray(k, dtype=float))
+    if r == 0:
+        return ndtr(-h) * ndtr(-k)
+
+    # Upper probability P(X > h, Y > k) of Genz's bvnu
+    order = 6 if abs(r) < 0.3 else 12 if abs(r) < 0.75 else 20
+    x, w = (np.array(values) for values in GAUSS_LEGENDRE[order])
+    x = np.concatenate([1 - x, 1 + x])
+    w = np.concatenate([w, w])
+    hk = h * k
+
+    if abs(r) < 0.925:
+        hs = (h * h + k * k) / 2
+        asr = np.arcsin(r) / 2
+        sn = np.sin(asr * x)
+        bvn = np.exp((sn * hk[..., None] - hs[..., None]) / (1 - sn ** 2)) @ w
+        bvn = bvn * asr / (2 * np.pi) + ndtr(-h) * ndtr(-k)
+        return np.clip(bvn, 0, 1)
+
+    if r < 0:
+        k = -k
+        hk = -hk
+    bvn = np.zeros(h.shape)
+    if abs(r) < 1:
+        As = 1 - r * r
+        a = np.sqrt(As)
+        bs = (h - k) ** 2
+        c = (4 - hk) / 8
+        d = (12 - hk) / 80
+        asr = -(bs / As + hk) / 2
+        bvn = a * np.exp(asr) * (1 - c * (bs - As) * (1 - d * bs) / 3 + c * d * As * As)
+        b = np.sqrt(bs)
+        bvn = bvn - np.exp(-hk / 2) * np.sqrt(2 * np.pi) * ndtr(-b / a) * b * (1 - c * bs * (1 - d * bs) / 3)
+        a = a / 2
+        xs = (a * x) ** 2
+        asr = -(bs[..., None] / xs + hk[..., None]) / 2
+        sp = 1 + c[..., None] * xs * (1 + 5 * d[..., None] * xs)
+        rs = np.sqrt(1 - xs)
+        ep = np.exp(-(hk[..., None] / 2) * xs / (1 + rs) ** 2) / rs
+        bvn = (a * ((np.exp(asr) * (sp - ep)) @ w) - bvn) / (2 * np.pi)
+    if r > 0:
+        bvn = bvn + ndtr(-np.maximum(h, k))
+    else:
+        # P(h < X < -k) minus the integral above, zero when the interval is empty
+        interval = np.where(h < 0, ndtr(k) - ndtr(h), ndtr(-h) - ndtr(-k))
+        bvn = np.where(h >= k, -bvn, interval - bvn)
+    return np.clip(bvn, 0, 1)
+
+def mvnCdf(upper, correlation, points=1024, replicates=8, seed=0, blockSize=1024):
+    """
+    Standard multivariate normal CDF P(X < upper) for many points sharing one correlation matrix.
+
+    Two variables use bvnCdf. More variables use Genz's separation of variables integrated with
+    randomized (scrambled) Sobol points: every component is evaluated with the same points, and the
+    error is estimated from the spread of the independent replicates. The returned error is three
+    standard errors of the mean of the replicates (a ~99% bound), and shrinks close to 1/points.
+
+    Args:
+        upper (np.ndarray): Upper limits, shape (components, variables).
+        correlation (np.ndarray): Correlation matrix, shape (variables, variables).
+        points (int): Number of Sobol points per replicate, a power of 2.
+        replicates (int): Number of independently scrambled replicates.
+        seed (int): Seed of the scrambling, so repeated runs give the same values.
+        blockSize (int): Number of components evaluated at a time, bounding the memory to blockSize * points values.
+
+    Returns:
+        prob (np.ndarray): The probabilities, shape (components,).
+        error (np.ndarray): Estimated absolute error of every probability, shape (components,).
+    """
+    from scipy.special import ndtr, ndtri
+    from scipy.stats import qmc
+
+    upper = np.clip(np.asarray(upper, dtype=float), -Z_LIMIT, Z_LIMIT)
+    n, d = upper.shape
+    if d == 1:
+        return ndtr(upper[:, 0]), np.zeros(n)
+    if d == 2:
+        return bvnCdf(upper[:, 0], upper[:, 1], correlation[0, 1]), np.full(n, BVN_ERROR)
+
+    L = np.linalg.cholesky(correlation)
+    # One set of scrambled points per replicate, shared by every component
+    samples = [qmc.Sobol(d - 1, scramble=True, seed=seed + i).random(points) for i in range(replicates)]
+
+    prob, error = np.empty(n), np.empty(n)
+    for start in range(0, n, blockSize):
+        b = upper[start:start + blockSize]
+        estimates = np.empty((replicates, len(b)))
+        for i, sample in enumerate(samples):
+            # Conditional upper limit of every variable given the previous ones
+            e = np.broadcast_to(ndtr(b[:, :1] / L[0, 0]), (len(b), points))
+            f = e.copy()
+            y = np.empty((len(b), points, d - 1))
+            for j in range(1, d):
+                y[:, :, j - 1] = ndtri(np.clip(sample[None, :, j - 1] * e, 1e-300, 1 - 1e-16))
+                e = ndtr((b[:, j:j + 1] - y[:, :, :j] @ L[j, :j]) / L[j, j])
+                f = f * e
+            estimates[i] = f.mean(axis=1)
+        prob[start:start + blockSize] = estimates.mean(axis=0)
+        error[start:start + blockSize] = 3 * estimates.std(axis=0, ddof=1) / np.sqrt(replicates)
+    return np.clip(prob, 0, 1), error
+
+def correlatedProbs(featureLevels, impactWeather, features, meanRange, stdRange, correlation, **options):
+    """
+    Correlated version of generateProbs: the multivariate normal CDF of the weather impact of every
+    feature with the mean and standard deviation of its level and a shared correlation matrix.
+
+    Args:
+        featureLevels (Dict[str, np.ndarray]): Severity level (1 to levels) of every component for each feature.
+        impactWeather (Dict[str, np.ndarray]): Weather impact on every component for each feature. Any shape whose first axis is the component.
+        features (List[str]): Features of the components, in the order of the correlation matrix.
+        meanRange (Dict[str, Dict[int, float]]): Mean impact of each feature for each severity level, from createTables.
+        stdRange (Dict[str, Dict[int, float]]): Standard deviation of each feature for each severity level, from createTables.
+        correlation (np.ndarray): Correlation matrix of the features, from correlationMatrix.
+        **options: Options of mvnCdf (points, replicates, seed, blockSize).
+
+    Returns:
+        prob (np.ndarray): Probability of an outage of every component, with the shape of the weather impact arrays.
+        error (np.ndarray): Estimated absolute error of every probability.
+    """
+    z = []
+    for feature in features:
+        impact = np.asarray(impactWeather[feature], dtype=float)
+        level = np.asarray(featureLevels[feature]).reshape((-1,) + (1,) * (impact.ndim - 1))
+        means = np.array([meanRange[feature].get(i, np.nan) for i in range(max(meanRange[feature]) + 1)])
+        stds = np.array([stdRange[feature].get(i, np.nan) for i in range(max(stdRange[feature]) + 1)])
+        z.append((impact - means[level]) / stds[level])
+    z = np.stack(z, axis=-1)
+    shape = z.shape[:-1]
+    z = z.reshape(-1, len(features))
+
+    # Components with a missing weather impact keep a missing probability, as in generateProbs
+    missing = np.isnan(z).any(axis=1)
+    prob, error = np.full(len(z), np.nan), np.full(len(z), np.nan)
+    if (~missing).any():
+        prob[~missing], error[~missing] = mvnCdf(z[~missing], correlation, **options)
+    return prob.reshape(shape), error.reshape(shape)
+
+def fragilityProbs(featureLevels, impactWeather, features, meanRange, stdRange, correlation=None, **options):
+    """
+    Probability of an outage of every component: from the fragility tables when the features are
+    uncorrelated, and from correlatedProbs otherwise.
+
+    Args:
+        featureLevels (Dict[str, np.ndarray]): Severity level (1 to levels) of every component for each feature.
+        impactWeather (Dict[str, np.ndarray]): Weather impact on every component for each feature.
+        features (List[str]): Features of the components.
+        meanRange (Dict[str, Dict[int, float]]), stdRange (Dict[str, Dict[int, float]]): Fragility curve tables from createTables.
+        correlation (Dict[str, Dict[str, float]] or None): Correlation of pairs of features (the "correlation" parameter).
+        **options: Options of mvnCdf (points, replicates, seed, blockSize).
+
+    Returns:
+        prob (np.ndarray): Probability of an outage of every component, with the shape of the weather impact arrays.
+        error (np.ndarray or None): Estimated absolute error of every probability, None when the features are uncorrelated.
+    """
+    from util.fragilityTables import getTables
+
+    matrix = correlationMatrix(features, correlation)
+    if matrix is None:
+        return getTables(meanRange, stdRange, features).probs(featureLevels, impactWeather, features), None
+    return correlatedProbs(featureLevels, impactWeather, features, meanRange, stdRange, matrix, **options)
@@ -0,0 +1,349 @@
+import hashlib
+import os
+import numpy as np
+
+# Catalog of the weather events exported from NOAA's Storm Event Database. An event sheet is parsed
+# once into a typed table (kept in memory and in a .cache folder next to the sheet), with the dates
+# and times of every event parsed at once. The events are filtered by the bounding box of a feeder
+# and a date range, and the windows of overlapping or adjacent events are merged so that the
+# weather of every NLDAS2 grid cell is fetched once for the merged span and sliced per event. The
+# hours already fetched for a cell are stored, so catalog backfills only download the hours missing.
+
+# Spacing and center of the first cell of the NLDAS2 grid (degrees)
+NLDAS_SPACING = 0.125
+NLDAS_ORIGIN = (-124.9375, 25.0625)
+
+# Number of catalogs kept in memory
+CACHE_SIZE = 8
+
+# Parsed catalogs by path, size and modification time
+_catalogs = {}
+
+def parseCatalog(weatherEvents):
+    """
+    Converts an event sheet into the typed table of the catalog.
+
+    Args:
+        weatherEvents (pd.DataFrame): Events exported from NOAA's Storm Event Database.
+
+    Returns:
+        pd.DataFrame: One row per event (indexed like the sheet) with the columns name (file name of
+            the event's weather), eventId, eventType, begin and end (rounded up to the hour, as in
+            eventWindow) and beginLon, beginLat, endLon, endLat (NaN when the event has no location).
+    """
+    import pandas as pd
+
+    def column(name, default=np.nan):
+        if name in weatherEvents:
+            return weatherEvents[name]
+        return pd.Series(default, index=weatherEvents.index)
+
+    def window(date, time):
+        # Times are stored as HHMM and rounded up to the next hour, like roundup
+        hours = np.ceil(pd.to_numeric(column(time), errors="coerce").values / 100)
+        return pd.to_datetime(column(date)).dt.normalize() + pd.to_timedelta(hours, unit="h")
+
+    catalog = pd.DataFrame({
+        "name": [f"weatherEvent{j+1}.csv" for j in weatherEvents.index],
+        "eventId": column("EVENT_ID", -1),
+        "eventType": column("EVENT_TYPE", "").astype(str),
+        "begin": window("BEGIN_DATE", "BEGIN_TIME"),
+        "end": window("END_DATE", "END_TIME"),
+    }, index=weatherEvents.index)
+    for key, name in [("beginLon", "BEGIN_LON"), ("beginLat", "BEGIN_LAT"), ("endLon", "END_LON"), ("endLat", "END_LAT")]:
+        catalog[key] = pd.to_numeric(column(name), errors="coerce").astype(float)
+    return catalog
+
+def loadCatalog(eventFile, cacheDir=None):
+    """
+    Loads an event sheet as a catalog, reusing the catalog parsed from the same sheet before.
+
+    Args:
+        eventFile (str): Excel file of the weather events.
+        cacheDir (str or None): Folder of the parsed catalogs, defaults to .cache/catalogs next to the sheet.
+
+    Returns:
+        pd.DataFrame: See parseCatalog.
+    """
+    import pandas as pd
+
+    stat = os.stat(eventFile)
+    key = (os.path.abspath(eventFile), stat.st_size, stat.st_mtime_ns)
+    if key in _catalogs:
+        return _catalogs[key]
+
+    with open(eventFile, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    cacheDir = cacheDir or os.path.join(os.path.dirname(os.path.abspath(eventFile)), ".cache", "catalogs")
+    path = os.path.join(cacheDir, f"{digest}.pkl")
+    if os.path.isfile(path):
+        catalog = pd.read_pickle(path)
+    else:
+        catalog = parseCatalog(pd.read_excel(eventFile))
+        os.makedirs(cacheDir, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}"
+        catalog.to_pickle(temporary)
+        os.replace(temporary, path)
+
+    if len(_catalogs) >= CACHE_SIZE:
+        _catalogs.pop(next(iter(_catalogs)))
+    _catalogs[key] = catalog
+    return catalog
+
+def filterEvents(catalog, bbox=None, start=None, end=None, margin=0.25, keepUnlocated=True):
+    """
+    Selects the events of a catalog near a feeder and within a date range.
+
+    Args:
+        catalog (pd.DataFrame): Catalog from loadCatalog.
+        bbox (Tuple[float, float, float, float] or None): (min lon, min lat, max lon, max lat) of the feeder.
+        start (str or None), end (str or None): Only keep the events overlapping this date range.
+        margin (float): Distance in degrees around the bounding box within which an event is kept.
+        keepUnlocated (bool): Keep the events without coordinates (e.g. reported for a whole zone).
+
+    Returns:
+        pd.DataFrame: The selected rows of the catalog.
+    """
+    import pandas as pd
+
+    keep = np.ones(len(catalog), dtype=bool)
+    if start is not None:
+        keep &= (catalog["end"] >= pd.Timestamp(start)).values
+    if end is not None:
+        keep &= (catalog["begin"] <= pd.Timestamp(end)).values
+    if bbox is not None:
+        minLon, minLat, maxLon, maxLat = bbox
+        # An event is near the feeder when the box of its path overlaps the box of the feeder
+        lon = catalog[["beginLon", "endLon"]].values
+        lat = catalog[["beginLat", "endLat"]].values
+        with np.errstate(invalid="ignore"):
+            near = (np.nanmin(lon, axis=1) <= maxLon + margin) & (np.nanmax(lon, axis=1) >= minLon - margin) \
+                & (np.nanmin(lat, axis=1) <= maxLat + margin) & (np.nanmax(lat, axis=1) >= minLat - margin)
+        located = ~np.isnan(lon).all(axis=1) & ~np.isnan(lat).all(axis=1)
+        keep &= np.where(located, near, keepUnlocated)
+    return catalog[keep]
+
+def coalesceWindows(catalog, gap="1h"):
+    """
+    Merges the windows of overlapping or adjacent events.
+
+    Args:
+        catalog (pd.DataFrame): Events with begin and end columns.
+        gap (str): Events separated by at most this much time are merged.
+
+    Returns:
+        pd.DataFrame: One row per merged span with its begin, end and the indices of its events (events).
+    """
+    import pandas as pd
+
+    events = catalog.sort_values("begin")
+    # A span starts at an event beginning after every earlier event ended (plus the gap)
+    reach = events["end"].cummax().shift() + pd.Timedelta(gap)
+    span = (~(events["begin"] <= reach)).cumsum().values
+    grouped = events.assign(span=span).groupby("span")
+    return pd.DataFrame({
+        "begin": grouped["begin"].min().values,
+        "end": grouped["end"].max().values,
+        "events": [list(group.index) for _, group in grouped],
+    })
+
+def nldasCells(lon, lat):
+    """
+    Finds the NLDAS2 grid cell of every location.
+
+    Args:
+        lon (np.ndarray), lat (np.ndarray): Coordinates of the locations.
+
+    Returns:
+        np.ndarray: Column and row of the cell of every location, shape (locations, 2).
+    """
+    column = np.rint((np.asarray(lon) - NLDAS_ORIGIN[0]) / NLDAS_SPACING).astype(np.int64)
+    row = np.rint((np.asarray(lat) - NLDAS_ORIGIN[1]) / NLDAS_SPACING).astype(np.int64)
+    return np.stack([column, row], axis=1)
+
+def toHours(labels):
+    """
+    Parses the hours of stored series as naive UTC timestamps, like the event windows.
+
+    Args:
+        labels (Iterable[str]): Hours as returned by the weather service.
+
+    Returns:
+        pd.DatetimeIndex: The hours.
+    """
+    import pandas as pd
+
+    times = pd.DatetimeIndex(pd.to_datetime(list(labels)))
+    return times.tz_convert(None) if times.tz is not None else times
+
+def missingRuns(covered, begin, end):
+    """
+    Finds the runs of hours of a window that are not covered by the windows already fetched.
+
+    Args:
+        covered (List[Tuple[pd.Timestamp, pd.Timestamp]]): Windows already fetched.
+        begin (pd.Timestamp), end (pd.Timestamp): Window needed.
+
+    Returns:
+        List[Tuple[pd.Timestamp, pd.Timestamp]]: First and last hour of every missing run.
+    """
+    import pandas as pd
+
+    hours = pd.date_range(begin, end, freq="h")
+    missing = np.ones(len(hours), dtype=bool)
+    for low, high in covered:
+        missing &= ~((hours >= low) & (hours <= high))
+    runs = []
+    # Consecutive missing hours form one run
+    starts = np.nonzero(missing & ~np.concatenate([[False], missing[:-1]]))[0]
+    stops = np.nonzero(missing & ~np.concatenate([missing[1:], [False]]))[0]
+    for a, b in zip(starts, stops):
+        runs.append((hours[a], hours[b]))
+    return runs
+
+def storedWindows(checkpoint, columns):
+    """
+    Parses the windows stored for a grid cell that hold every column needed.
+
+    Args:
+        checkpoint (Checkpoint): Store of the windows fetched for the cell.
+        columns (List[str]): Columns every window must hold.
+
+    Returns:
+        dict: Keys of the windows (keys) and their first (low) and last (high) hour as np.datetime64 arrays.
+    """
+    import pandas as pd
+
+    keys = [key for key, value in checkpoint.records.items() if all(column in value for column in columns)]
+    bounds = [key.split("/") for key in keys]
+    return {"keys": keys, "low": pd.to_datetime([low for low, _ in bounds]).values, "high": pd.to_datetime([high for _, high in bounds]).values}
+
+def cellWeather(checkpoint, lon, lat, begin, end, fetch, variables=(), windows=None):
+    """
+    Returns the hourly weather of a grid cell over a window, fetching only the hours not stored yet.
+
+    Args:
+        checkpoint (Checkpoint): Store of the windows fetched for the cell.
+        lon (float), lat (float): Location queried for the cell.
+        begin (pd.Timestamp), end (pd.Timestamp): First and last hour needed.
+        fetch (Callable): Function (lon, lat, begin, end) returning a DataFrame with the columns prcp,
+            wind_u and wind_v (and the other variables) indexed by hour, like getWeatherByCoords.
+        variables (Iterable[str]): Other weather variables to keep (see hazardVariables). Windows
+            stored without them are fetched again.
+        windows (dict or None): Windows of the checkpoint from storedWindows, updated with the windows
+            fetched. Parsed from the checkpoint when None, pass it to parse them once for many calls.
+
+    Returns:
+        pd.DataFrame: Columns label (the hour as written by collectWeather), prcp, wind (m/s) and the
+            other variables, indexed by hour.
+    """
+    import pandas as pd
+
+    columns = ["prcp", "wind"] + [variable for variable in variables if variable not in ["prcp", "wind"]]
+    # Windows stored before a variable was requested do not cover its hours
+    if windows is None:
+        windows = storedWindows(checkpoint, columns)
+    # Only the windows overlapping the one needed are read
+    overlap = np.nonzero((windows["low"] <= np.datetime64(end)) & (windows["high"] >= np.datetime64(begin)))[0]
+    keys = [windows["keys"][i] for i in overlap]
+    covered = [(pd.Timestamp(windows["low"][i]), pd.Timestamp(windows["high"][i])) for i in overlap]
+    for low, high in missingRuns(covered, begin, end):
+        print(f"Fetching {low} to {high} at ({lon:.4f}, {lat:.4f})")
+        timeframe = fetch(lon, lat, low.strftime("%Y-%m-%d %H%M"), high.strftime("%Y-%m-%d %H%M"))
+        # Convert uv wind components to wind speed
+        wind = np.sqrt(np.square(timeframe["wind_u"]) + np.square(timeframe["wind_v"]))
+        record = {"time": [str(time) for time in timeframe.index], "prcp": timeframe["prcp"].tolist(), "wind": wind.tolist()}
+        record.update({column: timeframe[column].tolist() for column in columns[2:]})
+        key = f"{low.isoformat()}/{high.isoformat()}"
+        checkpoint.put(key, record)
+        keys.append(key)
+        windows["keys"].append(key)
+        windows["low"] = np.append(windows["low"], np.datetime64(low))
+        windows["high"] = np.append(windows["high"], np.datetime64(high))
+
+    frames = [pd.DataFrame({"label": value["time"], **{column: value[column] for column in columns}}) for value in map(checkpoint.get, keys)]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame({"label": [], **{column: [] for column in columns}}, index=pd.DatetimeIndex([]))
+    df = pd.concat(frames)
+    df.index = toHours(df["label"])
+    df = df[~df.index.duplicated()].sort_index()
+    return df[(df.index >= begin) & (df.index <= end)]
+
+def collectCatalogWeather(network, eventFile="32123.xlsx", start=None, end=None, margin=0.25, resume=True, fetch=None, hazards=None):
+    """
+    Catalog version of collectWeather: selects the events of the sheet near the feeder and within a
+    date range, fetches the weather of every NLDAS2 cell of the feeder once per merged span of events
+    and saves the rain and wind of every node for every event to {network}/Rain/nodes and
+    {network}/Wind/nodes, and other hazards to {network}/{Hazard}/nodes. The hours fetched for every
+    cell are kept in {network}/.checkpoints/nldas.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventFile (str): Excel file of the weather events.
+        start (str or None), end (str or None): Only collect the events overlapping this date range.
+        margin (float): Distance in degrees around the feeder within which located events are kept.
+        resume (bool): Reuse the hours fetched by previous runs.
+        fetch (Callable or None): Weather query, defaults to getWeatherByCoords.
+        hazards (List[str] or None): Hazards to collect besides the rain and wind.
+
+    Returns:
+        fileNames (List[str]): Names of the files that were written.
+    """
+    import pandas as pd
+    from util.checkpoint import Checkpoint, fingerprint
+    from util.hazards import hazardFolder, hazardSeries, hazardVariables
+    from util.pipeline import nodePositions
+
+    if fetch is None:
+        from util.NetworkFunctions import getWeatherByCoords as fetch
+
+    nodes = pd.read_csv(f"{network}/nodeList.csv", usecols=["coords"])
+    coords = np.array(list(nodePositions(nodes).values()), dtype=float)
+    bbox = (coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max())
+    events = filterEvents(loadCatalog(eventFile), bbox, start, end, margin)
+    print(f"{len(events)} events near the feeder")
+
+    # Nodes sharing a grid cell share its weather, the first node of every cell is queried
+    cells, first, inverse = np.unique(nldasCells(coords[:, 0], coords[:, 1]), axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    checkpoints = [Checkpoint(f"{network}/.checkpoints/nldas/{x}_{y}.jsonl", fingerprint("nldas", int(x), int(y)), resume) for x, y in cells]
+
+    os.makedirs(f"{network}/Rain/nodes", exist_ok=True)
+    os.makedirs(f"{network}/Wind/nodes", exist_ok=True)
+    # Hazards derived from the same query as the rain and wind
+    extraHazards = [hazard for hazard in hazards or [] if hazard not in ["rain", "wind"]]
+    variables = hazardVariables(extraHazards)
+    for hazard in extraHazards:
+        os.makedirs(f"{network}/{hazardFolder(hazard)}/nodes", exist_ok=True)
+    fileNames = []
+    # The windows stored for every cell are parsed once and kept up to date by cellWeather
+    columns = ["prcp", "wind"] + [variable for variable in variables if variable not in ["prcp", "wind"]]
+    windows = [storedWindows(checkpoint, columns) for checkpoint in checkpoints]
+    try:
+        for span in coalesceWindows(events).itertuples():
+            weather = [cellWeather(checkpoint, *coords[i], span.begin, span.end, fetch, variables, cellWindows)
+                       for checkpoint, i, cellWindows in zip(checkpoints, first, windows)]
+            for j in span.events:
+                event = events.loc[j]
+                # Hours of the event present for any cell, labelled as the service returned them
+                hours = sorted(set().union(*[df.index[(df.index >= event["begin"]) & (df.index <= event["end"])] for df in weather]))
+                labels = {}
+                for df in weather:
+                    for hour, label in zip(df.index, df["label"]):
+                        labels.setdefault(hour, label)
+                rain = np.stack([df["prcp"].reindex(hours).values for df in weather])[inverse]
+                # Convert from m/s to mph
+                wind = np.stack([df["wind"].reindex(hours).values for df in weather])[inverse] * 2.23694
+
+                columns = [labels[hour] for hour in hours]
+                pd.DataFrame.to_csv(pd.DataFrame(rain, columns=columns), f"{network}/Rain/nodes/{event['name']}")
+                pd.DataFrame.to_csv(pd.DataFrame(wind, columns=columns), f"{network}/Wind/nodes/{event['name']}")
+                values = {variable: np.stack([df[variable].reindex(hours).values for df in weather])[inverse] for variable in variables}
+                for hazard, series in hazardSeries(values, extraHazards).items():
+                    pd.DataFrame.to_csv(pd.DataFrame(series, columns=columns), f"{network}/{hazardFolder(hazard)}/nodes/{event['name']}")
+                fileNames.append(event["name"])
+    finally:
+        for checkpoint in checkpoints:
+            checkpoint.close()
+    return sorted(fileNames, key=lambda name: int(name[len("weatherEvent"):-len(".csv")]))
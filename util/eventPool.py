@@ -0,0 +1,137 @@
+import numpy as np
+
+# Outage probability of many events on a pool of processes. The parent reads the network and the
+# weather impact of every event once and publishes them into shared memory (util/sharedArrays.py):
+# the compact tree, the severity level of every component and one (events, components, 2) tensor
+# per feature. Every worker attaches them by name when it starts and receives only ranges of event
+# indices, and writes the probabilities into shared result arrays instead of sending them back.
+
+# Model and arrays attached by the worker process
+_worker = {}
+
+def attachOutageModel(manifest, params, meanRange, stdRange, numNodes, radial, sources):
+    """
+    Initializer of the workers: attaches the shared arrays and rebuilds the outage model around them.
+
+    Args:
+        manifest (Dict[str, tuple]): SharedArrays.manifest of the parent.
+        params (dict): Pipeline parameters.
+        meanRange (dict), stdRange (dict): Fragility tables from createTables.
+        numNodes (int): Number of nodes in the network.
+        radial (bool): Whether the network is radial (propagated through the tree).
+        sources (List[int]): Source nodes (substations).
+    """
+    from util.sharedArrays import attachArrays
+    from util.topology import Topology
+
+    arrays, blocks = attachArrays(manifest, writable=[name for name in manifest if name.startswith("out/")])
+    topology = Topology(numNodes, arrays["parent"], arrays["parentEdge"], arrays["order"], arrays["levelStarts"])
+    reliability = None
+    if not radial:
+        from util.reliability import Reliability
+        # The connectivity model is derived from the shared edge list once per worker
+        reliability = Reliability(numNodes, arrays["source"], arrays["target"], sources)
+    levels = {name[len("levels/"):]: array for name, array in arrays.items() if name.startswith("levels/")}
+
+    _worker.update({"arrays": arrays, "blocks": blocks, "model": {
+        "params": params, "nodes": None, "edges": None, "topology": topology, "reliability": reliability,
+        "levels": levels, "meanRange": meanRange, "stdRange": stdRange}})
+
+def evaluateEvents(start, stop):
+    """
+    Task of the workers: computes the outage probabilities of the events start to stop - 1.
+
+    Args:
+        start (int), stop (int): Range of event indices.
+
+    Returns:
+        int: Number of events evaluated.
+    """
+    from util.pipeline import evaluateOutageModel
+
+    arrays, model = _worker["arrays"], _worker["model"]
+    params = model["params"]
+    for e in range(start, stop):
+        wiNodes = {feature: arrays[f"wiNodes/{feature}"][e] for feature in params["nodeFeatures"]}
+        wiEdges = {feature: arrays[f"wiEdges/{feature}"][e] for feature in params["edgeFeatures"]}
+        results = evaluateOutageModel(model, wiNodes, wiEdges)
+        arrays["out/prob"][e] = results["prob"]
+        arrays["out/probNodes"][e] = results["probNodes"]
+        arrays["out/probEdges"][e] = results["probEdges"]
+        if results["probError"] is not None:
+            arrays["out/probError"][e] = results["probError"]
+    return stop - start
+
+def computeOutageProbabilityEvents(network, eventNames=None, params=None, workers=None, eventsPerTask=1, save=True):
+    """
+    Parallel version of computeOutageProbability for many events.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventNames (List[str] or None): Names of the event files in {network}/WI/nodes, all of them by default.
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+        workers (int or None): Number of worker processes (default: every core).
+        eventsPerTask (int): Number of events sent to a worker at a time.
+        save (bool): Save the results and load at risk of every event like the outage command.
+
+    Returns:
+        results (dict): Dictionary with the following keys
+            - events (List[str]): Names of the events, in the order of the first axis of the arrays.
+            - prob (np.ndarray): Low and high probability of an outage of every node for every event, shape (events, nodes, 2).
+            - probError (np.ndarray or None): Error bound of prob, None when the network is radial.
+            - probNodes (np.ndarray), probEdges (np.ndarray): Outage probability of the nodes and edges themselves.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from util.pipeline import defaultParameters, loadNetwork, listEvents, prepareOutageModel, readWeatherImpact, saveOutageProbability
+    from util.sharedArrays import SharedArrays
+
+    params = params or defaultParameters()
+    eventNames = list(eventNames or listEvents(f"{network}/WI/nodes"))
+    nodes, edges = loadNetwork(network)
+    model = prepareOutageModel(nodes, edges, params)
+    topology, radial = model["topology"], model["reliability"] is None
+    numEvents = len(eventNames)
+
+    with SharedArrays() as shared:
+        for name in ["parent", "parentEdge", "order", "levelStarts"]:
+            shared.publish(name, getattr(topology, name))
+        shared.publish("source", edges["source"].values.astype(np.int64))
+        shared.publish("target", edges["target"].values.astype(np.int64))
+        for feature, levels in model["levels"].items():
+            shared.publish(f"levels/{feature}", levels)
+
+        # The weather impact of every event is read once, straight into the shared tensors
+        for component, features, count in [("nodes", params["nodeFeatures"], len(nodes)), ("edges", params["edgeFeatures"], len(edges))]:
+            prefix = "wiNodes" if component == "nodes" else "wiEdges"
+            tensors = {feature: shared.allocate(f"{prefix}/{feature}", (numEvents, count, 2)) for feature in features}
+            for e, eventName in enumerate(eventNames):
+                for feature, values in readWeatherImpact(f"{network}/WI/{component}/{eventName}", features).items():
+                    tensors[feature][e] = values
+
+        outputs = {
+            "prob": shared.allocate("out/prob", (numEvents, len(nodes), 2)),
+            "probNodes": shared.allocate("out/probNodes", (numEvents, len(nodes), 2)),
+            "probEdges": shared.allocate("out/probEdges", (numEvents, len(edges), 2)),
+            "probError": shared.allocate("out/probError", (numEvents, len(nodes), 2)),
+        }
+
+        tasks = [(start, min(start + eventsPerTask, numEvents)) for start in range(0, numEvents, eventsPerTask)]
+        initargs = (shared.manifest, params, model["meanRange"], model["stdRange"], len(nodes), radial, params.get("sources", [0]))
+        with ProcessPoolExecutor(max_workers=workers, initializer=attachOutageModel, initargs=initargs) as executor:
+            list(executor.map(evaluateEvents, *zip(*tasks)))
+
+        # Copy the results out of the blocks before they are removed
+        results = {name: np.array(values) for name, values in outputs.items()}
+
+    results["events"] = eventNames
+    if radial:
+        results["probError"] = None
+
+    if save:
+        from util.loadAtRisk import loadAtRiskForEvent
+        for e, eventName in enumerate(eventNames):
+            eventResults = {"prob": results["prob"][e], "probNodes": results["probNodes"][e], "probEdges": results["probEdges"][e],
+                            "probError": None if radial else results["probError"][e], "nodes": nodes, "edges": edges, "topology": topology}
+            nodeLoadAtRisk, _ = loadAtRiskForEvent(network, eventName, eventResults)
+            saveOutageProbability(network, eventName, eventResults, nodeLoadAtRisk)
+    return results
@@ -0,0 +1,183 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Stages of the pipeline in the order they depend on each other
+STAGES = ["import", "weather", "impact", "outage"]
+
+def discoverFeeders(root="."):
+    """
+    Finds the feeder folders below a root directory. A folder is a feeder when it holds an OpenDSS
+    circuit (DSS/Master.dss) or an already imported node list (nodeList.csv).
+
+    Args:
+        root (str): Directory to search.
+
+    Returns:
+        List[str]: Sorted paths of the feeder folders.
+    """
+    feeders = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Skip hidden folders such as caches and checkpoints
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        if "nodeList.csv" in filenames or os.path.isfile(os.path.join(dirpath, "DSS", "Master.dss")):
+            feeders.append(os.path.normpath(dirpath))
+            # The DSS and weather folders of a feeder are never feeders themselves
+            dirnames[:] = []
+    return feeders
+
+def limitWorker(memoryLimitMB):
+    """
+    Initializer of the worker processes. Keeps the numerical libraries single threaded, since the
+    pool already uses every core, and caps the address space of the worker.
+
+    Args:
+        memoryLimitMB (int or None): Memory limit of the worker in megabytes.
+    """
+    for variable in ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]:
+        os.environ.setdefault(variable, "1")
+    if memoryLimitMB is None:
+        return
+    try:
+        import resource
+    except ImportError:
+        # Memory limits are only supported on POSIX systems
+        return
+    limit = int(memoryLimitMB) * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def runStage(feeder, stage, options):
+    """
+    Runs one stage of the pipeline for one feeder. Executed inside a worker process.
+
+    Args:
+        feeder (str): Path of the feeder folder.
+        stage (str): One of STAGES.
+        options (dict): Keys "params" (pipeline parameters) and "events" (Excel file of the weather events).
+
+    Returns:
+        List[dict]: For the outage stage, one summary row per event. Empty for the other stages.
+    """
+    from util import pipeline
+    from util.loadAtRisk import loadAtRiskForEvent
+
+    params = options["params"]
+    if stage == "import":
+        pipeline.importNetwork(feeder, plot=False)
+    elif stage == "weather":
+        pipeline.collectWeather(feeder, options["events"], hazards=params.get("hazards"))
+    elif stage == "impact":
+        pipeline.computeWeatherImpact(feeder, params)
+    elif stage == "outage":
+        rows = []
+        for eventName in pipeline.listEvents(f"{feeder}/WI/nodes"):
+            results = pipeline.computeOutageProbability(feeder, eventName, params)
+            nodeLoadAtRisk, feederLoadAtRisk = loadAtRiskForEvent(feeder, eventName, results)
+            df = pipeline.saveOutageProbability(feeder, eventName, results, nodeLoadAtRisk)
+            rows.append({
+                "feeder": feeder,
+                "event": eventName,
+                "nodes": len(df),
+                "meanProb": df["mean"].mean(),
+                "maxProb": df["high"].max(),
+                "expectedNodesOut": df["mean"].sum(),
+                "expectedKW": feederLoadAtRisk["expectedKW"][2],
+                "expectedCustomers": feederLoadAtRisk["expectedCustomers"][2],
+                "eens": feederLoadAtRisk["eens"][2],
+            })
+        return rows
+    else:
+        raise ValueError(f"Unknown stage {stage}, expected one of {STAGES}")
+    return []
+
+def runFeeders(feeders, stages=STAGES, params=None, events="32123.xlsx", maxWorkers=None, memoryLimitMB=None):
+    """
+    Schedules the stages of every feeder across a process pool. The stages of one feeder run in order,
+    while different feeders run concurrently. When a stage fails, the later stages of that feeder are skipped.
+
+    Args:
+        feeders (List[str]): Paths of the feeder folders.
+        stages (List[str]): Stages to run, a subset of STAGES.
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+        events (str): Excel file of the weather events used by the weather stage.
+        maxWorkers (int or None): Number of worker processes, defaults to the number of cores.
+        memoryLimitMB (int or None): Total memory budget of the pool in megabytes, split evenly between workers.
+
+    Returns:
+        status (List[dict]): Outcome of every scheduled stage with keys feeder, stage, status and error.
+        summary (List[dict]): Summary rows returned by the outage stage of every feeder.
+    """
+    from util.pipeline import defaultParameters
+
+    stages = [stage for stage in STAGES if stage in stages]
+    options = {"params": params or defaultParameters(), "events": events}
+    maxWorkers = maxWorkers or os.cpu_count() or 1
+    workerLimit = None if memoryLimitMB is None else memoryLimitMB / maxWorkers
+
+    # Index of the next stage to run for every feeder
+    nextStage = {feeder: 0 for feeder in feeders}
+    status, summary = [], []
+    with ProcessPoolExecutor(max_workers=maxWorkers, initializer=limitWorker, initargs=(workerLimit,)) as executor:
+        running = {executor.submit(runStage, feeder, stages[0], options): feeder for feeder in feeders} if stages else {}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                feeder = running.pop(future)
+                stage = stages[nextStage[feeder]]
+                try:
+                    summary.extend(future.result())
+                except Exception as error:
+                    status.append({"feeder": feeder, "stage": stage, "status": "failed", "error": repr(error)})
+                    # Skip the stages that depend on the failed one
+                    for skipped in stages[nextStage[feeder] + 1:]:
+                        status.append({"feeder": feeder, "stage": skipped, "status": "skipped", "error": ""})
+                    continue
+                status.append({"feeder": feeder, "stage": stage, "status": "done", "error": ""})
+                print(f"{feeder}: {stage} done")
+                # Schedule the next stage of this feeder now that its dependency has finished
+                nextStage[feeder] += 1
+                if nextStage[feeder] < len(stages):
+                    running[executor.submit(runStage, feeder, stages[nextStage[feeder]], options)] = feeder
+    return status, summary
+
+def rollUp(feeders, outputDir="."):
+    """
+    Combines the outage results of every feeder into territory-wide tables.
+
+    Args:
+        feeders (List[str]): Paths of the feeder folders.
+        outputDir (str): Folder where territoryResults.csv and territorySummary.csv are written.
+
+    Returns:
+        results (pd.DataFrame): Probability of an outage of every node of every feeder for every event.
+        summary (pd.DataFrame): Aggregates of every feeder and event.
+    """
+    import pandas as pd
+    from util.pipeline import listEvents, outageResultsPath
+
+    frames = []
+    for feeder in feeders:
+        if not os.path.isdir(f"{feeder}/Outage"):
+            continue
+        for eventName in listEvents(f"{feeder}/Outage"):
+            df = pd.read_csv(outageResultsPath(feeder, eventName), index_col=0)
+            df.insert(0, "event", eventName)
+            df.insert(0, "feeder", feeder)
+            frames.append(df.rename_axis("node").reset_index())
+    if not frames:
+        return pd.DataFrame(), pd.DataFrame()
+
+    results = pd.concat(frames, ignore_index=True)
+    summary = results.groupby(["feeder", "event"]).agg(
+        nodes=("node", "size"),
+        meanProb=("mean", "mean"),
+        maxProb=("high", "max"),
+        expectedNodesOut=("mean", "sum"),
+    ).reset_index()
+    # Load at risk columns are only present when the outage stage computed them
+    extra = [column for column in ["expectedKW", "expectedCustomers", "eens"] if column in results]
+    if extra:
+        summary = summary.merge(results.groupby(["feeder", "event"])[extra].sum().reset_index(), on=["feeder", "event"])
+
+    pd.DataFrame.to_csv(results, os.path.join(outputDir, "territoryResults.csv"), index=False)
+    pd.DataFrame.to_csv(summary, os.path.join(outputDir, "territorySummary.csv"), index=False)
+    return results, summary
@@ -0,0 +1,109 @@
+import json
+from collections import OrderedDict
+import numpy as np
+
+# Precomputed fragility curves. The severity level of a feature is an integer from 1 to numOfBins
+# and the weather impact is rounded to 3 decimals by computeWeatherImpact, so the normal CDF of
+# every component is one of a small number of values. They are computed once per set of
+# parameters and outage probabilities become table gathers and products.
+
+# Number of sets of parameters whose tables are kept, for scenario sweeps
+CACHE_SIZE = 32
+
+# Tables already built, keyed by the parameters they were built from
+_cache = OrderedDict()
+
+# Fragility Table Class holding the CDF of every feature for every level and weather impact
+class FragilityTables:
+    def __init__(self, meanRange, stdRange, features, decimals=3, wiMin=0.0, wiMax=1.0):
+        from scipy.special import ndtr
+
+        # Features covered by the tables
+        self.features = list(features)
+
+        # Weather impact grid: wiMin to wiMax in steps of 10^-decimals
+        self.scale = 10 ** decimals
+        self.offset = int(round(wiMin * self.scale))
+        grid = np.arange(self.offset, int(round(wiMax * self.scale)) + 1) / self.scale
+
+        # Mean and standard deviation of every level (index 0 is unused), used for values off the grid
+        self.means, self.stds, self.tables = {}, {}, {}
+        for feature in self.features:
+            levels = sorted(meanRange[feature])
+            self.means[feature] = np.array([0.0] + [meanRange[feature][level] for level in levels])
+            self.stds[feature] = np.array([1.0] + [stdRange[feature][level] for level in levels])
+            # CDF of every level (rows) at every point of the grid (columns)
+            self.tables[feature] = ndtr((grid[None, :] - self.means[feature][:, None]) / self.stds[feature][:, None])
+
+    def cdf(self, feature, levels, impact):
+        """
+        Looks up the fragility curve of a feature.
+
+        Args:
+            feature (str): Name of the feature.
+            levels (np.ndarray): Severity level of every component, broadcastable against impact.
+            impact (np.ndarray): Weather impact on every component.
+
+        Returns:
+            np.ndarray: Normal CDF of the weather impact for the level of every component.
+        """
+        impact = np.asarray(impact, dtype=float)
+        levels = np.broadcast_to(levels, impact.shape)
+        table = self.tables[feature]
+
+        position = impact * self.scale - self.offset
+        index = np.rint(np.nan_to_num(position, nan=-1)).astype(np.int64)
+        onGrid = (index >= 0) & (index < table.shape[1]) & (np.abs(position - index) < 1e-6)
+
+        result = table[levels, np.where(onGrid, index, 0)]
+        if not onGrid.all():
+            # Weather impacts that were not rounded or fall outside of the grid are computed directly
+            from scipy.special import ndtr
+            offGrid = ~onGrid
+            level = levels[offGrid]
+            result[offGrid] = ndtr((impact[offGrid] - self.means[feature][level]) / self.stds[feature][level])
+        return result
+
+    def probs(self, featureLevels, impactWeather, features=None):
+        """
+        Table version of generateProbs: the product of the fragility curves of every feature.
+
+        Args:
+            featureLevels (Dict[str, np.ndarray]): Severity level (1 to levels) of every component for each feature.
+            impactWeather (Dict[str, np.ndarray]): Weather impact on every component for each feature. Any shape whose first axis is the component.
+            features (List[str] or None): Features to combine, defaults to the features of the tables.
+
+        Returns:
+            np.ndarray: Probability of an outage of every component, with the shape of the weather impact arrays.
+        """
+        prob = None
+        for feature in features or self.features:
+            impact = np.asarray(impactWeather[feature], dtype=float)
+            level = np.asarray(featureLevels[feature]).reshape((-1,) + (1,) * (impact.ndim - 1))
+            cdf = self.cdf(feature, level, impact)
+            prob = cdf if prob is None else prob * cdf
+        return prob
+
+def getTables(meanRange, stdRange, features, decimals=3):
+    """
+    Returns the fragility tables of a set of parameters, building them only when the parameters
+    have not been seen recently.
+
+    Args:
+        meanRange (Dict[str, Dict[int, float]]): Mean impact of each feature for each severity level, from createTables.
+        stdRange (Dict[str, Dict[int, float]]): Standard deviation of each feature for each severity level, from createTables.
+        features (List[str]): Features covered by the tables.
+        decimals (int): Number of decimals the weather impact is rounded to.
+
+    Returns:
+        FragilityTables: The tables.
+    """
+    key = json.dumps([sorted(features), {f: meanRange[f] for f in features}, {f: stdRange[f] for f in features}, decimals], sort_keys=True)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    tables = FragilityTables(meanRange, stdRange, features, decimals)
+    _cache[key] = tables
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return tables
@@ -0,0 +1,231 @@
+import json
+import os
+import struct
+import tempfile
+import numpy as np
+
+# Streaming export of the outage results for GIS and web maps. The node and edge lists are read in
+# blocks along with their results, and every block is turned into features and written before the
+# next one is read. Only the coordinates of the nodes (needed to draw the edges) are kept, in a
+# temporary memory-mapped file, so the memory used does not depend on the size of the network.
+
+# Magic bytes of the binary format
+BINARY_MAGIC = b"OMGB\x01"
+
+# Layer numbers of the binary format
+LAYERS = {"nodes": 0, "edges": 1}
+
+def parseCoords(values):
+    """
+    Parses the "(lon, lat)" strings of the coords column of a node list.
+
+    Args:
+        values (pd.Series): Coordinates of the nodes.
+
+    Returns:
+        np.ndarray: Longitude and latitude of every node, shape (nodes, 2).
+    """
+    parts = values.astype(str).str.strip("()").str.split(",", expand=True)
+    return parts.iloc[:, :2].astype(float).values
+
+def cleanValue(value):
+    # Missing values become null, numpy scalars become Python scalars
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+def iterFeatures(network, eventName="weatherEvent1.csv", components=("nodes", "edges"), chunkSize=100000):
+    """
+    Generates the features of the outage results of an event, one block of components at a time.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event whose results are read from {network}/Outage.
+        components (Iterable[str]): "nodes" (points) and/or "edges" (lines between their end nodes).
+        chunkSize (int): Number of components read at a time.
+
+    Returns:
+        Iterator[Tuple[str, np.ndarray, dict]]: Layer ("nodes" or "edges"), coordinates of the geometry
+            (shape (1, 2) for a point and (2, 2) for a line) and properties of every feature.
+    """
+    import pandas as pd
+    from util.pipeline import outageResultsPath
+
+    with tempfile.TemporaryDirectory() as directory:
+        coords = None
+        offset = 0
+        nodeResults = pd.read_csv(outageResultsPath(network, eventName), index_col=0, chunksize=chunkSize)
+        for block, results in zip(pd.read_csv(f"{network}/nodeList.csv", index_col=0, chunksize=chunkSize), nodeResults):
+            points = parseCoords(block["coords"])
+            if "edges" in components:
+                # Keep the coordinates on disk for the edges, growing the file block by block
+                coords = appendCoords(f"{directory}/coords.npy", coords, offset, points)
+            offset += len(block)
+            if "nodes" not in components:
+                continue
+            static = block.drop(columns=["coords", "name"], errors="ignore")
+            rows = pd.concat([results, static.set_index(results.index)], axis=1).to_dict("records")
+            for i, (point, row) in enumerate(zip(points, rows)):
+                yield "nodes", point[None, :], {"id": int(results.index[i]), **{key: cleanValue(value) for key, value in row.items()}}
+
+        if "edges" not in components:
+            return
+        edgeResults = pd.read_csv(outageResultsPath(network, eventName, "edges"), index_col=0, chunksize=chunkSize)
+        for block, results in zip(pd.read_csv(f"{network}/edgeList.csv", chunksize=chunkSize), edgeResults):
+            block = block.drop(columns=[column for column in block.columns if column.startswith("Unnamed")])
+            ends = coords[np.stack([block["source"].values, block["target"].values], axis=1)]
+            static = block.drop(columns=["name"], errors="ignore")
+            rows = pd.concat([results, static.set_index(results.index)], axis=1).to_dict("records")
+            for i, (line, row) in enumerate(zip(ends, rows)):
+                yield "edges", line, {"id": int(results.index[i]), **{key: cleanValue(value) for key, value in row.items()}}
+        del coords
+
+def appendCoords(path, coords, offset, points):
+    """
+    Writes the coordinates of a block of nodes to a memory-mapped array, doubling its size when it is full.
+
+    Args:
+        path (str): Path of the array.
+        coords (np.memmap or None): The array so far.
+        offset (int): Number of nodes already written.
+        points (np.ndarray): Coordinates of the block, shape (nodes, 2).
+
+    Returns:
+        np.memmap: The array.
+    """
+    needed = offset + len(points)
+    if coords is None or len(coords) < needed:
+        size = max(needed, 2 * (0 if coords is None else len(coords)))
+        grown = np.lib.format.open_memmap(f"{path}.{size}", mode="w+", dtype=np.float64, shape=(size, 2))
+        if coords is not None:
+            grown[:offset] = coords[:offset]
+            oldPath = coords.filename
+            del coords
+            os.remove(oldPath)
+        coords = grown
+    coords[offset:needed] = points
+    return coords
+
+def featureJSON(layer, coords, properties):
+    # GeoJSON text of a feature
+    if layer == "nodes":
+        geometry = {"type": "Point", "coordinates": coords[0].tolist()}
+    else:
+        geometry = {"type": "LineString", "coordinates": coords.tolist()}
+    return json.dumps({"type": "Feature", "geometry": geometry, "properties": {"layer": layer, **properties}})
+
+def writeGeoJSON(f, features):
+    """
+    Writes features as a GeoJSON FeatureCollection, one feature per line.
+
+    Args:
+        f (TextIO): Open text file.
+        features (Iterator): Features from iterFeatures.
+
+    Returns:
+        int: Number of features written.
+    """
+    count = 0
+    f.write('{"type": "FeatureCollection", "features": [\n')
+    for feature in features:
+        f.write((",\n" if count else "") + featureJSON(*feature))
+        count += 1
+    f.write("\n]}\n")
+    return count
+
+def writeNDJSON(f, features):
+    """
+    Writes features as newline delimited GeoJSON (one Feature per line, GeoJSONSeq).
+
+    Args:
+        f (TextIO): Open text file.
+        features (Iterator): Features from iterFeatures.
+
+    Returns:
+        int: Number of features written.
+    """
+    count = 0
+    for feature in features:
+        f.write(featureJSON(*feature) + "\n")
+        count += 1
+    return count
+
+def writeBinary(f, features):
+    """
+    Writes features as length-prefixed binary records, in the spirit of FlatGeobuf but without its
+    spatial index. The file starts with BINARY_MAGIC followed by a little endian uint32 length and a
+    JSON header. Each record is a uint32 length followed by:
+        - uint8 layer (0 nodes, 1 edges) and uint32 number of points,
+        - float64 longitude and latitude of every point,
+        - uint32 length and UTF-8 JSON of the properties.
+    Records can be read back one at a time with readBinary.
+
+    Args:
+        f (BinaryIO): Open binary file.
+        features (Iterator): Features from iterFeatures.
+
+    Returns:
+        int: Number of features written.
+    """
+    header = json.dumps({"crs": "EPSG:4326", "layers": list(LAYERS)}).encode()
+    f.write(BINARY_MAGIC + struct.pack("<I", len(header)) + header)
+    count = 0
+    for layer, coords, properties in features:
+        body = json.dumps(properties).encode()
+        record = struct.pack("<BI", LAYERS[layer], len(coords)) + np.ascontiguousarray(coords, dtype="<f8").tobytes() + struct.pack("<I", len(body)) + body
+        f.write(struct.pack("<I", len(record)) + record)
+        count += 1
+    return count
+
+def readBinary(f):
+    """
+    Reads the records of a file written by writeBinary, one at a time.
+
+    Args:
+        f (BinaryIO): Open binary file.
+
+    Returns:
+        Iterator[Tuple[str, np.ndarray, dict]]: Layer, coordinates and properties of every feature.
+    """
+    if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("Not an outage results binary file")
+    layers = json.loads(f.read(struct.unpack("<I", f.read(4))[0]))["layers"]
+    while True:
+        size = f.read(4)
+        if not size:
+            return
+        record = f.read(struct.unpack("<I", size)[0])
+        layer, points = struct.unpack_from("<BI", record)
+        coords = np.frombuffer(record, dtype="<f8", count=2 * points, offset=5).reshape(points, 2)
+        start = 5 + 16 * points
+        length = struct.unpack_from("<I", record, start)[0]
+        yield layers[layer], coords, json.loads(record[start + 4:start + 4 + length])
+
+# Writers by format name
+WRITERS = {"geojson": writeGeoJSON, "ndjson": writeNDJSON, "binary": writeBinary}
+
+def exportResults(network, eventName="weatherEvent1.csv", path=None, format="geojson", components=("nodes", "edges"), chunkSize=100000):
+    """
+    Streams the outage results of an event to a file.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event whose results are read from {network}/Outage.
+        path (str or None): Output file, defaults to {network}/Outage/export/{event}.{extension}.
+        format (str): "geojson", "ndjson" or "binary".
+        components (Iterable[str]): Components to export.
+        chunkSize (int): Number of components read at a time.
+
+    Returns:
+        path (str): The output file.
+        count (int): Number of features written.
+    """
+    extension = {"geojson": "geojson", "ndjson": "geojsonl", "binary": "omgb"}[format]
+    path = path or f"{network}/Outage/export/{os.path.splitext(eventName)[0]}.{extension}"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    features = iterFeatures(network, eventName, components, chunkSize)
+    with open(path, "wb" if format == "binary" else "w", **({} if format == "binary" else {"encoding": "utf-8"})) as f:
+        count = WRITERS[format](f, features)
+    return path, count
@@ -0,0 +1,246 @@
+import os
+import numpy as np
+
+# Gridded weather backend. Reads the weather of a whole feeder from a local NetCDF or GRIB file
+# (e.g. NLDAS2 forcing files or forecast cubes) instead of querying NLDAS2 node by node. Only the
+# window of the grid covering the feeder and the event is read, and every node is sampled at once.
+
+# Names under which the variables used by the pipeline are commonly stored
+VARIABLE_NAMES = {
+    "prcp": ["prcp", "Rainf", "APCP", "tp", "precipitation"],
+    "wind_u": ["wind_u", "Wind_E", "UGRD", "u10"],
+    "wind_v": ["wind_v", "Wind_N", "VGRD", "v10"],
+    "temp": ["temp", "Tair", "TMP", "t2m"],
+}
+
+# Names of the coordinates of the grid
+COORDINATE_NAMES = {
+    "lon": ["lon", "longitude", "x"],
+    "lat": ["lat", "latitude", "y"],
+    "time": ["time", "valid_time", "Time"],
+}
+
+def openGrid(path, engine=None):
+    """
+    Opens a gridded weather file lazily, without reading any data.
+
+    Args:
+        path (str): Path to a NetCDF (.nc, .nc4) or GRIB (.grb, .grib, .grb2) file.
+        engine (str or None): xarray engine, "cfgrib" is used for GRIB files when not given.
+
+    Returns:
+        xr.Dataset: The dataset.
+    """
+    import xarray as xr
+
+    if engine is None and os.path.splitext(path)[1].lower() in [".grb", ".grib", ".grb2", ".grib2"]:
+        engine = "cfgrib"
+    return xr.open_dataset(path, engine=engine)
+
+def findName(names, candidates, kind):
+    """
+    Finds which of the candidate names is present in a dataset.
+
+    Args:
+        names (Iterable[str]): Names in the dataset.
+        candidates (List[str]): Accepted names.
+        kind (str): Description used in the error message.
+
+    Returns:
+        str: The first candidate present.
+    """
+    for candidate in candidates:
+        if candidate in names:
+            return candidate
+    raise KeyError(f"No {kind} found in the grid, expected one of {candidates}")
+
+def readWindow(ds, variables, bbox, begin, end, pad=1):
+    """
+    Reads the part of the grid covering a bounding box and time window.
+
+    Args:
+        ds (xr.Dataset): Dataset from openGrid.
+        variables (List[str]): Pipeline names of the variables to read (keys of VARIABLE_NAMES).
+        bbox (Tuple[float, float, float, float]): Bounding box (minLon, minLat, maxLon, maxLat) of the feeder.
+        begin (pd.Timestamp), end (pd.Timestamp): First and last hour of the event.
+        pad (int): Number of grid cells added around the bounding box for the interpolation.
+
+    Returns:
+        grids (Dict[str, np.ndarray]): Values of every variable, shape (hours, lat, lon).
+        gridLon (np.ndarray), gridLat (np.ndarray): Coordinates of the window, ascending.
+        times (pd.DatetimeIndex): Hours of the window in UTC.
+    """
+    import pandas as pd
+
+    lonName = findName(ds.coords, COORDINATE_NAMES["lon"], "longitude")
+    latName = findName(ds.coords, COORDINATE_NAMES["lat"], "latitude")
+    timeName = findName(ds.coords, COORDINATE_NAMES["time"], "time")
+
+    minLon, minLat, maxLon, maxLat = bbox
+    gridLon = ds[lonName].values
+    gridLat = ds[latName].values
+    # Grids stored with longitudes from 0 to 360
+    if gridLon.max() > 180 and minLon < 0:
+        minLon, maxLon = minLon % 360, maxLon % 360
+
+    # Index windows (grids may be stored with descending latitudes)
+    def window(coords, low, high):
+        inside = np.where((coords >= low) & (coords <= high))[0]
+        if inside.size == 0:
+            nearest = np.argmin(np.abs(coords - (low + high) / 2))
+            inside = np.array([nearest])
+        return slice(max(inside.min() - pad, 0), min(inside.max() + pad + 1, len(coords)))
+
+    times = pd.DatetimeIndex(pd.to_datetime(ds[timeName].values))
+    times = times.tz_localize("UTC") if times.tz is None else times.tz_convert("UTC")
+    timeIndex = np.where((times >= begin) & (times <= end))[0]
+    if timeIndex.size == 0:
+        raise ValueError(f"The grid has no data between {begin} and {end}")
+
+    selection = {lonName: window(gridLon, minLon, maxLon), latName: window(gridLat, minLat, maxLat), timeName: slice(timeIndex.min(), timeIndex.max() + 1)}
+    grids = {}
+    for variable in variables:
+        name = findName(ds.data_vars, VARIABLE_NAMES[variable], variable)
+        # Only the selected window is read from disk
+        data = ds[name].isel(selection).transpose(timeName, latName, lonName).values.astype(float)
+        grids[variable] = data
+
+    windowLon = gridLon[selection[lonName]]
+    windowLat = gridLat[selection[latName]]
+    if windowLat[0] > windowLat[-1]:
+        windowLat = windowLat[::-1]
+        grids = {variable: data[:, ::-1, :] for variable, data in grids.items()}
+    if windowLon[0] > windowLon[-1]:
+        windowLon = windowLon[::-1]
+        grids = {variable: data[:, :, ::-1] for variable, data in grids.items()}
+    if windowLon.max() > 180 and bbox[0] < 0:
+        windowLon = windowLon - 360
+    return grids, windowLon, windowLat, times[selection[timeName]]
+
+def interpolate(grid, gridLon, gridLat, lon, lat, method="bilinear"):
+    """
+    Samples a gridded time series at many points at once.
+
+    Args:
+        grid (np.ndarray): Values, shape (hours, lat, lon).
+        gridLon (np.ndarray), gridLat (np.ndarray): Ascending coordinates of the grid.
+        lon (np.ndarray), lat (np.ndarray): Coordinates of the points.
+        method (str): "bilinear" or "nearest". Bilinear weights skip missing (NaN) cells, e.g. over water.
+
+    Returns:
+        np.ndarray: Values at the points, shape (points, hours).
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+
+    # Fractional position of every point in the grid
+    x = np.interp(lon, gridLon, np.arange(len(gridLon)))
+    y = np.interp(lat, gridLat, np.arange(len(gridLat)))
+
+    if method == "nearest" or grid.shape[1] == 1 or grid.shape[2] == 1:
+        return grid[:, np.rint(y).astype(np.int64), np.rint(x).astype(np.int64)].T
+
+    x0 = np.clip(np.floor(x).astype(np.int64), 0, len(gridLon) - 2)
+    y0 = np.clip(np.floor(y).astype(np.int64), 0, len(gridLat) - 2)
+    dx, dy = x - x0, y - y0
+
+    values = np.zeros((grid.shape[0], len(lon)))
+    totalWeight = np.zeros((grid.shape[0], len(lon)))
+    # Plain average of the valid corners, used when every corner with a weight is missing
+    cornerSum = np.zeros((grid.shape[0], len(lon)))
+    cornerCount = np.zeros((grid.shape[0], len(lon)))
+    for offsetY, offsetX, weight in [(0, 0, (1 - dx) * (1 - dy)), (0, 1, dx * (1 - dy)), (1, 0, (1 - dx) * dy), (1, 1, dx * dy)]:
+        corner = grid[:, y0 + offsetY, x0 + offsetX]
+        valid = ~np.isnan(corner)
+        values += np.where(valid, corner, 0) * weight
+        totalWeight += valid * weight
+        cornerSum += np.where(valid, corner, 0)
+        cornerCount += valid
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totalWeight > 0, values / totalWeight, cornerSum / cornerCount).T
+
+def sampleGriddedWeather(ds, lon, lat, begin, end, method="bilinear", rainScale=1.0):
+    """
+    Samples the rain and wind speed of every node from a grid, in the format written by collectWeather.
+
+    Args:
+        ds (xr.Dataset): Dataset from openGrid.
+        lon (np.ndarray), lat (np.ndarray): Coordinates of the nodes.
+        begin (pd.Timestamp), end (pd.Timestamp): First and last hour of the event.
+        method (str): "bilinear" or "nearest".
+        rainScale (float): Factor converting the precipitation of the grid to kg/m^2 per hour.
+
+    Returns:
+        rainDf (pd.DataFrame): Rain of every node (rows) for every hour (columns).
+        windDf (pd.DataFrame): Wind speed in mph of every node (rows) for every hour (columns).
+    """
+    series = sampleGriddedHazards(ds, lon, lat, begin, end, ["rain", "wind"], method, rainScale)
+    return series["rain"], series["wind"]
+
+def sampleGriddedHazards(ds, lon, lat, begin, end, hazards, method="bilinear", rainScale=1.0):
+    """
+    Samples the series of weather hazards (see util/hazards.py) of every node from a grid, reading
+    every variable they need in a single pass over the window of the event.
+
+    Args:
+        ds (xr.Dataset): Dataset from openGrid.
+        lon (np.ndarray), lat (np.ndarray): Coordinates of the nodes.
+        begin (pd.Timestamp), end (pd.Timestamp): First and last hour of the event.
+        hazards (List[str]): Names of the hazards.
+        method (str): "bilinear" or "nearest".
+        rainScale (float): Factor converting the precipitation of the grid to kg/m^2 per hour.
+
+    Returns:
+        Dict[str, pd.DataFrame]: Series of every hazard for every node (rows) and hour (columns).
+    """
+    import pandas as pd
+    from util.hazards import hazardVariables, hazardSeries
+
+    bbox = (np.min(lon), np.min(lat), np.max(lon), np.max(lat))
+    grids, gridLon, gridLat, times = readWindow(ds, hazardVariables(hazards), bbox, begin, end)
+    variables = {name: interpolate(grid, gridLon, gridLat, lon, lat, method) for name, grid in grids.items()}
+    if "prcp" in variables:
+        variables["prcp"] = variables["prcp"] * rainScale
+
+    columns = [str(time) for time in times]
+    return {hazard: pd.DataFrame(values, columns=columns) for hazard, values in hazardSeries(variables, hazards).items()}
+
+def collectGriddedWeather(network, gridPath, eventFile="32123.xlsx", method="bilinear", rainScale=1.0, hazards=None):
+    """
+    Gridded version of collectWeather: samples the rain and wind of every node for every event from a
+    local file and saves them to {network}/Rain/nodes and {network}/Wind/nodes, along with the other
+    hazards requested in {network}/{Hazard}/nodes. No network access is needed.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        gridPath (str): Path to the gridded weather file.
+        eventFile (str): Excel file of the weather events.
+        method (str): "bilinear" or "nearest".
+        rainScale (float): Factor converting the precipitation of the grid to kg/m^2 per hour.
+        hazards (List[str] or None): Hazards to collect besides the rain and wind.
+
+    Returns:
+        fileNames (List[str]): Names of the files that were written.
+    """
+    import pandas as pd
+    from util.pipeline import eventWindow, nodePositions
+    from util.hazards import hazardFolder
+
+    nodes = pd.read_csv(f"{network}/nodeList.csv", usecols=["coords"])
+    coords = np.array(list(nodePositions(nodes).values()), dtype=float)
+    weatherEvents = pd.read_excel(eventFile)
+    hazards = ["rain", "wind"] + [hazard for hazard in hazards or [] if hazard not in ["rain", "wind"]]
+
+    for hazard in hazards:
+        os.makedirs(f"{network}/{hazardFolder(hazard)}/nodes", exist_ok=True)
+    fileNames = []
+    with openGrid(gridPath) as ds:
+        for j in weatherEvents.index:
+            begin, end = [pd.Timestamp(pd.to_datetime(value, format="%Y-%m-%d %H%M"), tz="UTC") for value in eventWindow(weatherEvents, j)]
+            series = sampleGriddedHazards(ds, coords[:, 0], coords[:, 1], begin, end, hazards, method, rainScale)
+
+            name = f"weatherEvent{j+1}.csv"
+            for hazard, df in series.items():
+                pd.DataFrame.to_csv(df, f"{network}/{hazardFolder(hazard)}/nodes/{name}")
+            fileNames.append(name)
+    return fileNames
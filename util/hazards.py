@@ -0,0 +1,229 @@
+import os
+import numpy as np
+
+# Weather hazards scored by the weather impact stage. Every hazard is derived from the variables
+# returned by NLDAS2 (or read from a grid) in the same query, so adding a hazard adds no fetch. Its
+# hourly series are saved to {network}/{Hazard}/nodes like the rain and wind, every
+# component gets a score from the severity levels of every hazard, and the weather impact of all
+# features is one matrix product of the alpha weights (features x hazards) and the scores
+# (hazards x components).
+
+def windSpeed(variables):
+    # Wind speed in mph from the uv components in m/s
+    return np.sqrt(np.square(variables["wind_u"]) + np.square(variables["wind_v"])) * 2.23694
+
+def rainfall(variables):
+    # Hourly precipitation in kg/m^2
+    return np.asarray(variables["prcp"], dtype=float)
+
+def iceLoading(variables):
+    # Precipitation falling at or below freezing, a proxy of the ice accreted on lines (kg/m^2 per hour)
+    return np.where(np.asarray(variables["temp"], dtype=float) <= 273.15, np.asarray(variables["prcp"], dtype=float), 0.0)
+
+def heatStress(variables):
+    # Air temperature in degrees Fahrenheit from Kelvin
+    return (np.asarray(variables["temp"], dtype=float) - 273.15) * 9 / 5 + 32
+
+# Hazards by name: the variables they are derived from, the function deriving them and their default
+# severity levels [min, max, number of levels] (wind and rain use windSeverityLevels and rainSeverityLevels)
+HAZARDS = {
+    "wind": {"variables": ["wind_u", "wind_v"], "compute": windSpeed, "severityLevels": [0, 120, 10]},
+    "rain": {"variables": ["prcp"], "compute": rainfall, "severityLevels": [0, 6, 10]},
+    "ice": {"variables": ["prcp", "temp"], "compute": iceLoading, "severityLevels": [0, 3, 10]},
+    "heat": {"variables": ["temp"], "compute": heatStress, "severityLevels": [60, 120, 10]},
+}
+
+# Hazards of the paper, in the order of the alpha weights
+DEFAULT_HAZARDS = ["wind", "rain"]
+
+def hazardFolder(hazard):
+    """
+    Returns the folder of the series of a hazard, e.g. Rain for rain.
+    """
+    return hazard.capitalize()
+
+def hazardVariables(hazards):
+    """
+    Lists the weather variables needed by hazards.
+
+    Args:
+        hazards (List[str]): Names of the hazards.
+
+    Returns:
+        List[str]: Names of the variables, without repetitions.
+    """
+    variables = []
+    for hazard in hazards:
+        if hazard not in HAZARDS:
+            raise ValueError(f"Unknown hazard {hazard}, expected one of {list(HAZARDS)}")
+        variables.extend(variable for variable in HAZARDS[hazard]["variables"] if variable not in variables)
+    return variables
+
+def hazardSeries(variables, hazards):
+    """
+    Derives the series of hazards from the weather variables.
+
+    Args:
+        variables (Dict[str, np.ndarray]): Weather variables (e.g. prcp, wind_u, wind_v, temp), any shape.
+        hazards (List[str]): Names of the hazards.
+
+    Returns:
+        Dict[str, np.ndarray]: Series of every hazard, with the shape of the variables.
+    """
+    return {hazard: HAZARDS[hazard]["compute"](variables) for hazard in hazards}
+
+def hazardSeverityLevels(params, hazard):
+    """
+    Returns the [min, max, number of levels] used to score a hazard.
+
+    Args:
+        params (dict): Pipeline parameters.
+        hazard (str): Name of the hazard.
+
+    Returns:
+        list: The severity levels, from hazardSeverityLevels, windSeverityLevels or rainSeverityLevels, or the default of the hazard.
+    """
+    if hazard in params.get("hazardSeverityLevels", {}):
+        return params["hazardSeverityLevels"][hazard]
+    if f"{hazard}SeverityLevels" in params:
+        return params[f"{hazard}SeverityLevels"]
+    return HAZARDS[hazard]["severityLevels"]
+
+def hazardLevels(params, hazards):
+    """
+    Creates the severity levels of hazards.
+
+    Args:
+        params (dict): Pipeline parameters.
+        hazards (List[str]): Names of the hazards.
+
+    Returns:
+        List[list]: Levels created by createLevelsAlt for every hazard.
+    """
+    from util.mainHelper import createLevelsAlt
+
+    return [createLevelsAlt(*hazardSeverityLevels(params, hazard)) for hazard in hazards]
+
+def alphaMatrix(params, features, hazards):
+    """
+    Stacks the alpha weights of features into a matrix.
+
+    Args:
+        params (dict): Pipeline parameters.
+        features (List[str]): Features of the components.
+        hazards (List[str]): Hazards, in the order of the weights of every feature.
+
+    Returns:
+        np.ndarray: Weights of every hazard (columns) for every feature (rows).
+    """
+    alpha = np.array([params["alpha"][feature] for feature in features], dtype=float)
+    if alpha.shape != (len(features), len(hazards)):
+        raise ValueError(f"Every alpha must have one weight per hazard {hazards}")
+    return alpha
+
+def hazardExtremes(network, eventName, hazards, source, target, chunkSize=10000):
+    """
+    Reads the min and max of every hazard for every node and edge during an event. The series of the
+    nodes in {network}/{Hazard}/nodes are copied to a temporary memory map one block of nodes at a
+    time, and the nodes and edges are reduced from it one block of hours at a time (see
+    reduceNodeAndEdgeWeather). Without them, the series of {network}/{Hazard}/{component} or the
+    streaming statistics in {network}/Stats are read.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        hazards (List[str]): Names of the hazards.
+        source (np.ndarray), target (np.ndarray): End nodes of every edge.
+        chunkSize (int): Number of components read at a time from the weather files.
+
+    Returns:
+        Dict[str, Tuple[np.ndarray, np.ndarray]]: Min and max of every hazard (rows) for every component (columns), by component.
+    """
+    import tempfile
+    import pandas as pd
+    from util.streamingStats import reduceNodeAndEdgeWeather, reduceWeatherFile, weatherMemmap, weatherStatsPath
+
+    stats = {}
+    extremes = {"nodes": ([], []), "edges": ([], [])}
+    for hazard in hazards:
+        nodePath = f"{network}/{hazardFolder(hazard)}/nodes/{eventName}"
+        if os.path.isfile(nodePath):
+            with tempfile.TemporaryDirectory() as directory:
+                series = weatherMemmap(nodePath, f"{directory}/{hazard}", chunkSize)
+                values = dict(zip(["nodes", "edges"], reduceNodeAndEdgeWeather(series, source, target, hazard)))
+                del series
+        else:
+            values = {}
+            for component in ["nodes", "edges"]:
+                path = f"{network}/{hazardFolder(hazard)}/{component}/{eventName}"
+                if os.path.isfile(path):
+                    values[component] = reduceWeatherFile(path, hazard, chunkSize=chunkSize)
+                else:
+                    if component not in stats:
+                        statsPath = weatherStatsPath(network, eventName, component)
+                        stats[component] = pd.read_csv(statsPath, index_col=0) if os.path.isfile(statsPath) else pd.DataFrame()
+                    if f"{hazard}Min" not in stats[component]:
+                        raise ValueError(f"Neither the series nor the statistics of {hazard} were collected for {eventName}, "
+                                         f"collect the weather again with {hazard} in the hazards parameter")
+                    values[component] = stats[component]
+        for component, (mins, maxs) in extremes.items():
+            mins.append(values[component][f"{hazard}Min"].values)
+            maxs.append(values[component][f"{hazard}Max"].values)
+    return {component: (np.array(mins), np.array(maxs)) for component, (mins, maxs) in extremes.items()}
+
+def extremeScores(mins, maxs, severityLevels):
+    """
+    Scores the min (low) and max (high) of every hazard with its severity levels.
+
+    Args:
+        mins (np.ndarray), maxs (np.ndarray): Min and max of every hazard (rows) for every component (columns).
+        severityLevels (List[list]): Levels created by createLevelsAlt for every hazard.
+
+    Returns:
+        np.ndarray: Low and high score of every hazard for every component, shape (hazards, components, 2).
+    """
+    from util.mainHelper import findWeatherLevels
+
+    return np.stack([np.stack([findWeatherLevels(low, levels), findWeatherLevels(high, levels)], axis=-1)
+                     for low, high, levels in zip(mins, maxs, severityLevels)])
+
+def eventScores(network, eventName, params, source, target):
+    """
+    Scores of every hazard of the "hazards" parameter for every node and edge during an event, from
+    the extremes read by hazardExtremes.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        params (dict): Pipeline parameters.
+        source (np.ndarray), target (np.ndarray): End nodes of every edge.
+
+    Returns:
+        Dict[str, np.ndarray]: Low and high score of every hazard, shape (hazards, components, 2), by component.
+    """
+    hazards = params.get("hazards", DEFAULT_HAZARDS)
+    severityLevels = hazardLevels(params, hazards)
+    extremes = hazardExtremes(network, eventName, hazards, source, target)
+    return {component: extremeScores(mins, maxs, severityLevels) for component, (mins, maxs) in extremes.items()}
+
+def weatherImpactMatrix(alpha, features, mins, maxs, severityLevels):
+    """
+    Multi-hazard version of weatherImpactFromExtremes: scores the min and max of every hazard with
+    its severity levels and computes the weather impact of every feature as alpha @ scores.
+
+    Args:
+        alpha (np.ndarray): Weights of every hazard for every feature, from alphaMatrix.
+        features (List[str]): Features, in the order of the rows of alpha.
+        mins (np.ndarray), maxs (np.ndarray): Min and max of every hazard (rows) for every component (columns).
+        severityLevels (List[list]): Levels created by createLevelsAlt for every hazard.
+
+    Returns:
+        pd.DataFrame: One column per feature holding the (low, high) weather impact of every component.
+    """
+    import pandas as pd
+
+    # Scores of the min (low) and max (high) of every hazard, shape (hazards, components, 2)
+    scores = extremeScores(mins, maxs, severityLevels)
+    # Weather impact of every feature, shape (features, components, 2)
+    wi = np.round(np.einsum("fh,hcb->fcb", alpha, scores), 3)
+    return pd.DataFrame({feature: list(zip(wi[f, :, 0], wi[f, :, 1])) for f, feature in enumerate(features)})
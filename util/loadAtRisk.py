@@ -0,0 +1,234 @@
+import os
+import re
+import numpy as np
+
+# Load at risk and expected energy not served. The loads of the circuit are attached to the nodes,
+# their demand over the event is found from their yearly load shapes, and the expected values follow
+# from the probability of an outage of every node. Downstream quantities use the subtree sums of the
+# compact tree, so everything is linear in the size of the network.
+
+def parseDSSProperties(line):
+    """
+    Parses the key=value properties of an OpenDSS "New" command.
+
+    Args:
+        line (str): The command.
+
+    Returns:
+        Dict[str, str]: Properties with lower case keys.
+    """
+    # Remove the spaces around "=" so that "npts= 35040" is a single token
+    line = re.sub(r"\s*=\s*", "=", line)
+    properties = {}
+    for token in line.split()[2:]:
+        if "=" in token:
+            key, value = token.split("=", 1)
+            properties[key.lower()] = value
+    return properties
+
+def readLoads(network, nodes):
+    """
+    Reads the loads of the network from {network}/loadList.csv, written by importNetwork, or parses
+    them from {network}/DSS/Loads.dss when the list has not been created.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        nodes (pd.DataFrame): Node list of the network.
+
+    Returns:
+        pd.DataFrame: One row per load with columns name, bus, node, kW, kvar, phases and yearly.
+    """
+    import pandas as pd
+
+    if os.path.isfile(f"{network}/loadList.csv"):
+        return pd.read_csv(f"{network}/loadList.csv", index_col=0)
+
+    from util.NetworkFunctions import nodeNameSplit
+
+    rows = []
+    with open(f"{network}/DSS/Loads.dss") as f:
+        for line in f:
+            if not line.lower().startswith("new load."):
+                continue
+            properties = parseDSSProperties(line)
+            rows.append({
+                "name": line.split()[1].split(".", 1)[1],
+                "bus": nodeNameSplit(properties.get("bus1", "")).lower(),
+                "kW": float(properties.get("kw", 0)),
+                "kvar": float(properties.get("kvar", 0)),
+                "phases": int(properties.get("phases", 1)),
+                "yearly": properties.get("yearly", ""),
+            })
+    loads = pd.DataFrame(rows, columns=["name", "bus", "kW", "kvar", "phases", "yearly"])
+    nodeNum = {name.lower(): i for i, name in enumerate(nodes["name"])}
+    loads.insert(2, "node", loads["bus"].map(nodeNum).fillna(-1).astype(int))
+    return loads
+
+def readLoadShapes(network):
+    """
+    Parses the load shapes defined in {network}/DSS/LoadShapes.dss.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+
+    Returns:
+        Dict[str, dict]: For every load shape, its number of points (npts), interval in hours and multiplier file.
+    """
+    shapes = {}
+    path = f"{network}/DSS/LoadShapes.dss"
+    if not os.path.isfile(path):
+        return shapes
+    with open(path) as f:
+        for line in f:
+            if not line.lower().startswith("new loadshape."):
+                continue
+            name = line.split()[1].split(".", 1)[1].lower()
+            mult = re.search(r"(?<!q)mult\s*=\s*\(file=([^)]+)\)", line, re.IGNORECASE)
+            properties = parseDSSProperties(re.sub(r"\([^)]*\)", "", line))
+            shapes[name] = {
+                "npts": int(properties.get("npts", 8760)),
+                "interval": float(properties.get("interval", 1)),
+                "mult": os.path.join(f"{network}/DSS", mult.group(1)) if mult else None,
+            }
+    return shapes
+
+def eventHours(network, eventName):
+    """
+    Reads the hours of an event from the header of its weather files, or from the window saved with the
+    statistics of the weather when only those were collected.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+
+    Returns:
+        pd.DatetimeIndex or None: The hours of the event, None when they are unknown.
+    """
+    import pandas as pd
+    from util.streamingStats import weatherWindowsPath
+
+    for folder in ["Rain", "Wind"]:
+        path = f"{network}/{folder}/nodes/{eventName}"
+        if os.path.isfile(path):
+            columns = [column for column in pd.read_csv(path, nrows=0).columns if not column.startswith("Unnamed")]
+            return pd.DatetimeIndex(pd.to_datetime(columns, utc=True))
+    path = weatherWindowsPath(network)
+    if os.path.isfile(path):
+        windows = pd.read_csv(path, index_col=0)
+        if eventName in windows.index:
+            begin, end = pd.to_datetime(windows.loc[eventName, ["begin", "end"]], utc=True)
+            return pd.date_range(begin, end, freq="h")
+    print(f"The hours of {eventName} are unknown, its energy not served is not computed")
+    return None
+
+def loadShapeEnergy(shapes, loads, hours):
+    """
+    Sums the multiplier of the yearly load shape of every load over the hours of an event. Load shapes
+    are indexed by their position in the year, so profiles of a different year can be used. Loads
+    without a readable profile are assumed to consume their nominal kW every hour.
+
+    Args:
+        shapes (Dict[str, dict]): Load shapes from readLoadShapes.
+        loads (pd.DataFrame): Loads from readLoads.
+        hours (pd.DatetimeIndex): Hours of the event.
+
+    Returns:
+        np.ndarray: Number of equivalent full load hours of every load during the event.
+    """
+    hoursPerLoad = np.full(len(loads), float(len(hours)))
+    hourOfYear = (hours.dayofyear.values - 1) * 24 + hours.hour.values + hours.minute.values / 60
+    missing = []
+    for shapeName, index in loads.groupby(loads["yearly"].fillna("").str.lower()).indices.items():
+        shape = shapes.get(shapeName)
+        if shape is None or shape["mult"] is None or not os.path.isfile(shape["mult"]):
+            if shapeName:
+                missing.append(shapeName)
+            continue
+        mult = np.loadtxt(shape["mult"], delimiter=",", usecols=0, ndmin=1)
+        # Average the points of the profile that fall within every hour of the event
+        pointsPerHour = max(int(round(1 / shape["interval"])), 1)
+        start = (np.floor(hourOfYear / shape["interval"]).astype(np.int64)[:, None] + np.arange(pointsPerHour)) % len(mult)
+        hoursPerLoad[index] = mult[start].mean(axis=1).sum()
+    if missing:
+        print(f"{len(missing)} load shapes have no profile, using their nominal kW")
+    return hoursPerLoad
+
+def computeLoadAtRisk(topology, prob, probNodes, probEdges, loads, hoursPerLoad=None):
+    """
+    Computes the expected load, customers and energy interrupted at every node and for the whole feeder.
+
+    Args:
+        topology (Topology): Compact tree of the network.
+        prob (np.ndarray): Probability of an outage of every node taking into account its path to the root, shape (nodes, 2).
+        probNodes (np.ndarray): Probability of an outage of the nodes themselves, shape (nodes, 2).
+        probEdges (np.ndarray): Probability of an outage of the edges themselves, shape (edges, 2).
+        loads (pd.DataFrame): Loads from readLoads.
+        hoursPerLoad (np.ndarray or None): Equivalent full load hours of every load during the event, from
+            loadShapeEnergy. The energy not served is NaN when it is None.
+
+    Returns:
+        nodeResults (Dict[str, np.ndarray]): Per node values computed with the mean probability
+            - kW, customers: Load and number of loads connected to the node.
+            - expectedKW, expectedCustomers: Expected load and number of loads interrupted at the node.
+            - eens: Expected energy not served at the node during the event (kWh).
+            - downstreamKW, downstreamCustomers: Load and number of loads in the subtree of the node.
+            - kWAtRisk: Expected load interrupted by an outage of the node or the edge feeding it.
+        feederResults (Dict[str, List[float]]): Low, high and mean totals of expectedKW, expectedCustomers and eens.
+    """
+    numNodes = topology.numNodes
+    connected = loads["node"].values >= 0
+    node = loads["node"].values[connected]
+    kW = np.bincount(node, weights=loads["kW"].values[connected], minlength=numNodes)
+    customers = np.bincount(node, minlength=numNodes).astype(float)
+    hours = np.full(len(loads), np.nan) if hoursPerLoad is None else hoursPerLoad
+    energy = np.bincount(node, weights=loads["kW"].values[connected] * hours[connected], minlength=numNodes)
+
+    prob = np.asarray(prob, dtype=float)
+    meanProb = prob.mean(axis=1)
+
+    # Probability that the node or the edge connecting it to its parent is out
+    localProb = np.asarray(probNodes, dtype=float).mean(axis=1)
+    hasParent = topology.parentEdge >= 0
+    localProb[hasParent] = 1 - (1 - localProb[hasParent]) * (1 - np.asarray(probEdges, dtype=float)[topology.parentEdge[hasParent]].mean(axis=1))
+
+    downstream = topology.subtreeSum(np.stack([kW, customers], axis=1))
+    nodeResults = {
+        "kW": kW,
+        "customers": customers,
+        "expectedKW": meanProb * kW,
+        "expectedCustomers": meanProb * customers,
+        "eens": meanProb * energy,
+        "downstreamKW": downstream[:, 0],
+        "downstreamCustomers": downstream[:, 1],
+        "kWAtRisk": localProb * downstream[:, 0],
+    }
+
+    # Totals for the low, high and mean probability
+    bounds = np.column_stack([prob, meanProb])
+    feederResults = {
+        "expectedKW": list(kW @ bounds),
+        "expectedCustomers": list(customers @ bounds),
+        "eens": list(energy @ bounds),
+    }
+    return nodeResults, feederResults
+
+def loadAtRiskForEvent(network, eventName, results):
+    """
+    Computes the load at risk for the results of computeOutageProbability.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        results (dict): Output of computeOutageProbability.
+
+    Returns:
+        nodeResults (Dict[str, np.ndarray]), feederResults (Dict[str, List[float]]): See computeLoadAtRisk.
+    """
+    from util.topology import Topology
+
+    nodes, edges = results["nodes"], results["edges"]
+    topology = results.get("topology") or Topology.fromEdges(edges["source"].values, edges["target"].values, len(nodes))
+    loads = readLoads(network, nodes)
+    hours = eventHours(network, eventName)
+    hoursPerLoad = None if hours is None else loadShapeEnergy(readLoadShapes(network), loads, hours)
+    return computeLoadAtRisk(topology, results["prob"], results["probNodes"], results["probEdges"], loads, hoursPerLoad)
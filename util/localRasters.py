@@ -0,0 +1,122 @@
+import numpy as np
+
+# Local raster backend for the enrichment of the network with elevation and vegetation, used instead
+# of the remote 3DEP and NLCD services (py3dep, pygeohydro) when copies of the DEM and tree canopy
+# GeoTIFFs are available, e.g. on sites without network access. The points (buses and the sample
+# points of the lines) are transformed to the pixels of a raster all at once, only the window of the
+# raster covering them is read (rasterio reads the blocks intersecting it), and their values are
+# gathered from that window.
+
+def linePoints(start, end, n):
+    """
+    Vectorized version of interpolate_points for many lines: n points between the ends of every line.
+
+    Args:
+        start (np.ndarray), end (np.ndarray): Longitude and latitude of the two ends of every line, shape (lines, 2).
+        n (int): Number of points of every line (including the ends).
+
+    Returns:
+        lon (np.ndarray), lat (np.ndarray): Coordinates of the points, shape (lines, n).
+    """
+    lon1, lat1 = np.radians(np.asarray(start, dtype=float)).T[:, :, None]
+    lon2, lat2 = np.radians(np.asarray(end, dtype=float)).T[:, :, None]
+
+    # Same distance as interpolate_points, which gives the haversine the coordinates in radians
+    dlat, dlon = np.radians(lat2 - lat1), np.radians(lon2 - lon1)
+    a = np.sin(dlat / 2) ** 2 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(dlon / 2) ** 2
+    d = 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    fraction = np.arange(n) / (n - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        A = np.sin((1 - fraction) * d) / np.sin(d)
+        B = np.sin(fraction * d) / np.sin(d)
+    # Both ends at the same place (e.g. transformers): every point is that place
+    same = np.sin(d) == 0
+    A, B = np.where(same, 1 - fraction, A), np.where(same, fraction, B)
+
+    x = A * np.cos(lat1) * np.cos(lon1) + B * np.cos(lat2) * np.cos(lon2)
+    y = A * np.cos(lat1) * np.sin(lon1) + B * np.cos(lat2) * np.sin(lon2)
+    z = A * np.sin(lat1) + B * np.sin(lat2)
+    return np.degrees(np.arctan2(y, x)), np.degrees(np.arctan2(z, np.sqrt(x ** 2 + y ** 2)))
+
+def toPixels(src, lon, lat):
+    """
+    Transforms coordinates to the rows and columns of the pixels of a raster.
+
+    Args:
+        src (rasterio.DatasetReader): The raster.
+        lon (np.ndarray), lat (np.ndarray): Longitude and latitude of the points.
+
+    Returns:
+        rows (np.ndarray), cols (np.ndarray): Pixel of every point (may be outside of the raster).
+    """
+    x, y = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    if src.crs is not None and not src.crs.is_geographic:
+        from pyproj import Transformer
+        # e.g. the Albers projection of NLCD
+        x, y = Transformer.from_crs("EPSG:4326", src.crs.to_wkt(), always_xy=True).transform(x, y)
+
+    # Inverse of the affine transform of the raster, x = a col + b row + c and y = d col + e row + f
+    a, b, c, d, e, f = tuple(src.transform)[:6]
+    det = a * e - b * d
+    cols = (e * (x - c) - b * (y - f)) / det
+    rows = (a * (y - f) - d * (x - c)) / det
+    return np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64)
+
+def sampleRaster(path, lon, lat, band=1):
+    """
+    Reads the value of a raster at many points with one read of the window covering them.
+
+    Args:
+        path (str): GeoTIFF (or any file rasterio opens).
+        lon (np.ndarray), lat (np.ndarray): Longitude and latitude of the points, any shape.
+        band (int): Band to read.
+
+    Returns:
+        np.ndarray: Value at every point, NaN outside of the raster and where it has no data.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    values = np.full(lon.shape, np.nan)
+    with rasterio.open(path) as src:
+        rows, cols = toPixels(src, lon.ravel(), lat.ravel())
+        inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+        if not inside.any():
+            return values
+        rowOff, colOff = rows[inside].min(), cols[inside].min()
+        window = Window(colOff, rowOff, cols[inside].max() - colOff + 1, rows[inside].max() - rowOff + 1)
+        data = src.read(band, window=window).astype(float)
+        if src.nodata is not None:
+            data[data == src.nodata] = np.nan
+
+    flat = values.ravel()
+    flat[inside] = data[rows[inside] - rowOff, cols[inside] - colOff]
+    return flat.reshape(lon.shape)
+
+def enrichFromRasters(coords, lines, demPath, canopyPath, n=10):
+    """
+    Local version of getElevationByCoords, getLandCover and findAvgLineVegetation for a whole network.
+
+    Args:
+        coords (np.ndarray): Longitude and latitude of every bus, shape (buses, 2).
+        lines (np.ndarray): Indices of the two buses of every line, shape (lines, 2).
+        demPath (str): DEM in meters (e.g. a local copy of 3DEP).
+        canopyPath (str): Tree canopy cover in percent (e.g. a local copy of NLCD canopy).
+        n (int): Number of sample points of every line.
+
+    Returns:
+        elevation (np.ndarray), vegetation (np.ndarray): Elevation and tree canopy cover of every bus.
+        lineVegetation (np.ndarray): Average tree canopy cover of the sample points of every line.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    lines = np.asarray(lines, dtype=np.int64).reshape(-1, 2)
+    lineLon, lineLat = linePoints(coords[lines[:, 0]], coords[lines[:, 1]], n)
+
+    elevation = sampleRaster(demPath, coords[:, 0], coords[:, 1])
+    # The buses and the sample points of the lines are gathered from the same window of the canopy
+    canopy = sampleRaster(canopyPath, np.concatenate([coords[:, 0], lineLon.ravel()]), np.concatenate([coords[:, 1], lineLat.ravel()]))
+    vegetation = canopy[:len(coords)]
+    lineVegetation = canopy[len(coords):].reshape(len(lines), n).sum(axis=1) / n
+    return elevation, vegetation, lineVegetation
@@ -1,10 +1,5 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.colors import LinearSegmentedColormap
 from itertools import combinations
-from scipy.stats import norm, multivariate_normal
-import networkx as nx
-import matplotlib.pyplot as plt 
 import warnings
 from collections import deque
 warnings.filterwarnings('ignore')
@@ -172,6 +167,7 @@ def generateProb(node, edge, nodeFeatures, edgeFeatures, meanRange, stdRange, fo
     Returns:
         float: Calculated probability of outage for the node or edge.
     """
+    from scipy.stats import multivariate_normal
 
     # Initialize a list to store the probability outcomes
     prob = []
@@ -283,7 +279,11 @@ def plotTreeWithProb(tree, probabilities, title, pos):
     Returns:
         Displays a visual representation of the network graph with nodes colored according to their outage probabilities.
     """
-        
+    # Plotting modules are only loaded when a map is actually rendered
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LinearSegmentedColormap
+    import networkx as nx
+
     # Create a figure and an axis with constrained layout for better spacing
     fig, ax = plt.subplots(constrained_layout=True)
 
@@ -397,3 +397,76 @@ def findFeatureLevel(feature_value,feature_levels):
         if ((feature_value >= feature_levels[i]['min']) and (feature_value <=feature_levels[i]['max'])).all() ==True:
             level = i
             return level
+
+def findWeatherLevels(weather_values, weather_levels):
+    """
+    Vectorized version of findWeatherLevel for an array of weather values.
+
+    Args:
+        weather_values (numpy.ndarray): Values representing weather conditions.
+        weather_levels (list): List of dictionaries containing 'min' and 'max' values for each weather level.
+
+    Returns:
+        numpy.ndarray: The score of every value (level index multiplied by 0.1), NaN when the value is outside of every level.
+    """
+    weather_values = np.asarray(weather_values, dtype=float)
+    mins = np.array([level['min'] for level in weather_levels])
+    maxs = np.array([level['max'] for level in weather_levels])
+
+    # The first level whose max is greater or equal to the value, as in the linear search of findWeatherLevel
+    index = np.searchsorted(maxs, weather_values, side='left')
+    inRange = (index < len(weather_levels)) & (weather_values >= mins[np.minimum(index, len(weather_levels) - 1)])
+    return np.where(inRange, (index + 1) * 0.1, np.nan)
+
+def findLevels(observedVals, featureName, forecastedRange, levels):
+    """
+    Vectorized version of findLevel for an array of observed values.
+
+    Args:
+        observedVals (numpy.ndarray): The observed values for the feature.
+        featureName (str): Name of the feature.
+        forecastedRange (Dict[str, List[Tuple[float, float]]]): Dictionary mapping feature names to lists of tuples, each tuple representing a range for a severity level.
+        levels (int): Total number of severity levels.
+    Returns:
+        numpy.ndarray: The severity level (1 to levels) that every observed value falls into.
+    """
+    observedVals = np.asarray(observedVals, dtype=float)
+    result = np.full(observedVals.shape, levels, dtype=np.int64)
+
+    # Walk the ranges backwards so that the first matching range wins, as in findLevel
+    for index in range(len(forecastedRange[featureName]) - 1, -1, -1):
+        low, high = forecastedRange[featureName][index]
+        inside = ((low <= observedVals) & (observedVals <= high)) | ((high <= observedVals) & (observedVals <= low))
+        result[inside] = index + 1
+    return result
+
+def generateProbs(featureLevels, impactWeather, features, meanRange, stdRange):
+    """
+    Vectorized version of generateProb for a block of components. With a diagonal covariance the
+    multivariate normal CDF is the product of the univariate CDFs of every feature.
+
+    Args:
+        featureLevels (Dict[str, numpy.ndarray]): Severity level (1 to levels) of every component for each feature.
+        impactWeather (Dict[str, numpy.ndarray]): Weather impact on every component for each feature. Any shape whose first axis is the component.
+        features (List[str]): Names of the features to combine.
+        meanRange (Dict[str, Dict[int, float]]): Mean impact of each feature for each severity level.
+        stdRange (Dict[str, Dict[int, float]]): Standard deviation of each feature for each severity level.
+    Returns:
+        numpy.ndarray: Probability of an outage of every component, with the shape of the weather impact arrays.
+    """
+    from scipy.special import ndtr
+
+    prob = None
+    for feature in features:
+        # Lookup arrays indexed by level (index 0 is unused)
+        means = np.array([0.0] + [meanRange[feature][level] for level in sorted(meanRange[feature])])
+        stds = np.array([1.0] + [stdRange[feature][level] for level in sorted(stdRange[feature])])
+
+        impact = np.asarray(impactWeather[feature], dtype=float)
+        # Broadcast the per component parameters over any trailing axes (e.g. low and high bounds)
+        shape = (-1,) + (1,) * (impact.ndim - 1)
+        level = np.asarray(featureLevels[feature]).reshape(shape)
+
+        cdf = ndtr((impact - means[level]) / stds[level])
+        prob = cdf if prob is None else prob * cdf
+    return prob
@@ -0,0 +1,107 @@
+import time
+
+# Weather, weather impact and outage stages run event by event with the fetching of the next events
+# overlapped with the computation of the current one. A producer thread queries the weather of the
+# events in order and hands their names to the consumer through a bounded queue: when the consumer
+# falls behind, the queue fills up and the producer waits (back-pressure), so at most queueSize
+# events are fetched ahead. The queries wait on the network and the computation on the CPU, so the
+# time of a catalog approaches the larger of the two instead of their sum.
+
+# Marks the end of the events in the queue
+_DONE = object()
+
+def fetchEvents(network, eventFile, events, queue, stop, resume=True, hazards=None):
+    """
+    Producer: collects the weather of the nodes for every event and puts the names of their files in the queue.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventFile (str): Excel file of the weather events.
+        events (List[int] or None): Indices of the events to collect, all of them by default.
+        queue (queue.Queue): Bounded queue of (name, seconds spent fetching), or the exception that stopped the producer.
+        stop (threading.Event): Set by the consumer when it stops early.
+        resume (bool): Reuse the series of a previous run that did not finish.
+        hazards (List[str] or None): Hazards to collect besides the rain and wind.
+    """
+    import queue as queues
+    import pandas as pd
+    from util.pipeline import collectEventWeather
+
+    def put(item):
+        # Wait for room in the queue unless the consumer stopped
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.5)
+                return True
+            except queues.Full:
+                continue
+        return False
+
+    try:
+        nodes = pd.read_csv(f"{network}/nodeList.csv")
+        weatherEvents = pd.read_excel(eventFile)
+        for j in weatherEvents.index if events is None else events:
+            if stop.is_set():
+                return
+            start = time.perf_counter()
+            name = collectEventWeather(network, nodes, weatherEvents, j, resume, hazards)
+            if not put((name, time.perf_counter() - start)):
+                return
+        put(_DONE)
+    except Exception as error:
+        put(error)
+
+def runOverlapped(network, eventFile="32123.xlsx", params=None, events=None, queueSize=2, resume=True):
+    """
+    Runs the weather, weather impact and outage stages for every event, collecting the weather of the
+    next events while the current one is computed, and saves the results like the outage command.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventFile (str): Excel file of the weather events.
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+        events (List[int] or None): Indices of the events to run, all of them by default.
+        queueSize (int): Number of events whose weather can be collected ahead of the computation.
+        resume (bool): Reuse the weather series of a previous run that did not finish.
+
+    Returns:
+        List[dict]: One row per event with its name, mean probability of an outage and the seconds spent fetching and computing it.
+    """
+    import queue as queues
+    import threading
+    from util import pipeline
+    from util.loadAtRisk import loadAtRiskForEvent
+
+    params = params or pipeline.defaultParameters()
+    queue = queues.Queue(maxsize=max(queueSize, 1))
+    stop = threading.Event()
+    producer = threading.Thread(target=fetchEvents, args=(network, eventFile, events, queue, stop, resume, params.get("hazards")), daemon=True)
+    producer.start()
+
+    rows = []
+    try:
+        # The structure, severity levels and fragility tables do not depend on the event
+        nodes, edges = pipeline.loadNetwork(network)
+        model = pipeline.prepareOutageModel(nodes, edges, params)
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            name, fetchSeconds = item
+
+            start = time.perf_counter()
+            # The weather of the edges is derived from the nodes by the weather impact stage
+            pipeline.computeWeatherImpact(network, params, [name])
+            weatherImpactNodes = pipeline.readWeatherImpact(f"{network}/WI/nodes/{name}", params["nodeFeatures"])
+            weatherImpactEdges = pipeline.readWeatherImpact(f"{network}/WI/edges/{name}", params["edgeFeatures"])
+            results = pipeline.evaluateOutageModel(model, weatherImpactNodes, weatherImpactEdges)
+            nodeLoadAtRisk, _ = loadAtRiskForEvent(network, name, results)
+            df = pipeline.saveOutageProbability(network, name, results, nodeLoadAtRisk)
+            rows.append({"event": name, "meanProb": float(df["mean"].mean()), "fetchSeconds": fetchSeconds,
+                         "computeSeconds": time.perf_counter() - start})
+    finally:
+        stop.set()
+        producer.join()
+    return rows
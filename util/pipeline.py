@@ -0,0 +1,998 @@
+import json
+import os
+import warnings
+warnings.filterwarnings("ignore")
+
+# Only light modules are imported at the top of this file. pandas, networkx, OpenDSS,
+# the geospatial clients and matplotlib are imported inside the stage that needs them
+# so that importing the pipeline (or running a single stage) stays fast.
+
+###############################################################
+            # DEFAULT PIPELINE PARAMETERS
+###############################################################
+
+def defaultParameters():
+    """
+    Returns the parameters used by the example in the paper (Scenario 1).
+
+    Returns:
+        params (dict): Dictionary with the following keys
+            - nodeFeatures (List[str]): Features describing the nodes.
+            - edgeFeatures (List[str]): Features describing the edges.
+            - numOfBins (int): Number of severity levels for the physical features.
+            - numOfScenarios (int): Number of weather scenarios interpolated between the min and max of an event.
+            - meanWI (Dict[str, List[float]]): Minimum and maximum mean of the fragility curve of each feature.
+            - stdWI (Dict[str, List[float]]): Minimum and maximum standard deviation of the fragility curve of each feature.
+            - alpha (Dict[str, List[float]]): Weights of [wind, rain] used to compute the weather impact of each feature.
+            - windSeverityLevels (List[float]): [min, max, number of levels] used to normalize the wind speed.
+            - rainSeverityLevels (List[float]): [min, max, number of levels] used to normalize the rain.
+            - correlation (Dict[str, Dict[str, float]]): Correlation of pairs of features of the same component,
+              e.g. {"elevation nodes": {"vegetation": 0.4}}. Empty for independent features.
+            - sources (List[int]): Source nodes (substations) of the network.
+            - reliabilitySamples (int): Number of Monte Carlo samples used on the meshed part of a network.
+            - hazards (List[str]): Weather hazards scored by the weather impact (see util/hazards.py), in the order
+              of the weights of alpha, e.g. ["wind", "rain", "ice"] with alpha rows of three weights.
+            - hazardSeverityLevels (Dict[str, List[float]]): [min, max, number of levels] of the hazards other than wind and rain.
+    """
+    return {
+        "nodeFeatures": ["elevation nodes", "vegetation"],
+        "edgeFeatures": ["vegetation edges", "length"],
+        "numOfBins": 10,
+        "numOfScenarios": 2,
+        "meanWI": {
+            "elevation nodes": [0.65, 0.2],
+            "vegetation": [0.5, 0.2],
+            "length": [0.4, 0.18],
+            "vegetation edges": [0.6, 0.2]
+        },
+        "stdWI": {
+            "elevation nodes": [0.15, 0.05],
+            "vegetation": [0.14, 0.05],
+            "length": [0.15, 0.05],
+            "vegetation edges": [0.15, 0.05],
+        },
+        "alpha": {
+            "elevation nodes": [0.4, 0.6],
+            "vegetation": [0.8, 0.2],
+            "vegetation edges": [0.7, 0.3],
+            "length": [0.9, 0.1],
+        },
+        "windSeverityLevels": [0, 120, 10],
+        "rainSeverityLevels": [0, 6, 10],
+        "correlation": {},
+        "sources": [0],
+        "reliabilitySamples": 10000,
+        "hazards": ["wind", "rain"],
+        "hazardSeverityLevels": {},
+    }
+
+def loadParameters(path=None, **overrides):
+    """
+    Builds the pipeline parameters from the defaults, an optional JSON file and keyword overrides.
+
+    Args:
+        path (str or None): Path to a JSON file containing any subset of the keys of defaultParameters().
+        **overrides: Individual parameters to override (e.g. meanWI={...}).
+
+    Returns:
+        params (dict): The merged parameters.
+    """
+    params = defaultParameters()
+    if path is not None:
+        with open(path) as f:
+            params.update(json.load(f))
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    return params
+
+def saveParameters(params, path):
+    """
+    Writes pipeline parameters to a JSON file that can be read back with loadParameters.
+
+    Args:
+        params (dict): Pipeline parameters.
+        path (str): Destination of the JSON file.
+    """
+    with open(path, "w") as f:
+        json.dump(params, f, indent=4)
+
+###############################################################
+            # NETWORK
+###############################################################
+
+def loadNetwork(network):
+    """
+    Loads the node and edge lists created by importNetwork.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+
+    Returns:
+        nodes (pd.DataFrame): Node list of the network.
+        edges (pd.DataFrame): Edge list of the network.
+    """
+    import pandas as pd
+
+    nodes = pd.read_csv(f"{network}/nodeList.csv")
+    edges = pd.read_csv(f"{network}/edgeList.csv")
+    return nodes, edges
+
+def buildGraph(nodes, edges):
+    """
+    Creates the tree structure used for probability propagation and plotting.
+
+    Args:
+        nodes (pd.DataFrame): Node list of the network.
+        edges (pd.DataFrame): Edge list of the network.
+
+    Returns:
+        G (nx.DiGraph): Directed graph of the network.
+        graph (defaultdict[list]): Keys are parent node indices and values are lists of [child node, edge index].
+    """
+    import networkx as nx
+    from collections import defaultdict
+
+    sources = edges["source"].astype(int).tolist()
+    targets = edges["target"].astype(int).tolist()
+
+    # Prepare graph structure
+    graph = defaultdict(list)
+    for i, (source, target) in enumerate(zip(sources, targets)):
+        graph[source].append([target, i])
+
+    # Initialize directed graph and add nodes and edges
+    G = nx.DiGraph()
+    G.add_nodes_from(range(len(nodes)))
+    G.add_edges_from(sorted(zip(sources, targets)))
+    return G, graph
+
+def nodePositions(nodes):
+    """
+    Parses the coordinates of every node.
+
+    Args:
+        nodes (pd.DataFrame): Node list of the network.
+
+    Returns:
+        pos (Dict[int, Tuple[float, float]]): Dictionary mapping node indices to (longitude, latitude).
+    """
+    from ast import literal_eval
+
+    return {i: literal_eval(coords) for i, coords in enumerate(nodes["coords"])}
+
+def importNetwork(network, plot=True, resume=True, demPath=None, canopyPath=None):
+    """
+    Extracts the buses, lines, transformers and loads of an OpenDSS circuit, enriches the nodes and edges
+    with elevation and vegetation data and saves them to {network}/nodeList.csv, {network}/edgeList.csv
+    and {network}/loadList.csv. The lines that are disabled in the circuit (e.g. normally open tie
+    switches) are not part of the edge list, they are saved to {network}/switchList.csv for the
+    switching studies of util/switching.py. The elevation and vegetation are checkpointed to
+    {network}/.checkpoints/import.jsonl as they are received, or sampled from local rasters when
+    demPath and canopyPath are given (see util/localRasters.py).
+
+    Args:
+        network (str): Folder name corresponding to the network data. The circuit is read from {network}/DSS/Master.dss.
+        plot (bool): Draw the imported network.
+        resume (bool): Reuse the results of a previous run of the same circuit that did not finish.
+        demPath (str or None): Local DEM in meters used instead of 3DEP.
+        canopyPath (str or None): Local tree canopy cover raster used instead of NLCD.
+
+    Returns:
+        G (nx.MultiDiGraph): Graph of the imported network.
+    """
+    import networkx as nx
+    import opendssdirect as dss
+    import pandas as pd
+    from util.NetworkFunctions import getElevationByCoords, fixBusName, findNodeNum, getLandCover, findAvgLineVegetation
+    from util.ComponentClasses import Bus, Line, Load, Node, Edge, Transformer
+    from util.checkpoint import Checkpoint, fingerprint
+
+    # Load the Network
+    dss.Command(f'Redirect {network}/DSS/Master.dss')
+
+    # Acquire a list of buses, lines, elements, transformers, and loads
+    buses = dss.Circuit.AllBusNames()
+    lines = dss.Lines.AllNames()
+    elements = dss.Circuit.AllElementNames()
+    transformers  = [item for item in elements if 'Transformer' in item]
+    loads = [item for item in elements if 'Load' in item]
+
+    # Initialize empty list for circuit and graph components
+    BUSES=[]
+    LINES = []
+    TRANSFORMERS = []
+    LOADS = []
+    NODES = []
+    EDGES = []
+
+    # Loop through buses, and append bus data to bus list
+    for bus in buses:
+        dss.Circuit.SetActiveBus(bus)
+        # Append [Name, (X,Y), Base kV] to bus object and store in list
+        BUSES.append(Bus(dss.Bus.Name(),(dss.Bus.X(),dss.Bus.Y()),dss.Bus.kVBase()))
+
+    # Loop through lines, and append line data to line list
+    for line in lines:
+        # Set the current line
+        dss.Lines.Name(line)
+        # Set the current line (element form to get enabled)
+        dss.Circuit.SetActiveElement(line)
+        # Append [Name, Length, Bus1, Bus2, Enabled] to line object and store list
+        LINES.append(Line(dss.Lines.Name(),dss.Lines.Length(),dss.Lines.Bus1(),dss.Lines.Bus2(),dss.CktElement.Enabled()))
+
+    # Loop through transformers
+    for transformer in transformers:
+        # Set the current transformer
+        dss.Circuit.SetActiveElement(transformer)
+        # Get the buses attached to transformers
+        busesT = dss.CktElement.BusNames()
+        # Remove the node number from bus name for simplification
+        newBusT = fixBusName(busesT)
+        # Append [Name, Bus1 Bus2 WdgVoltages and WdgCurrents] to Transformer object and store in list
+        TRANSFORMERS.append(Transformer(dss.Element.Name(),newBusT[0],newBusT[1],dss.Transformers.WdgVoltages(),dss.Transformers.WdgCurrents()))
+
+    # Loop through loads
+    for load in loads:
+        # Set the current load element
+        dss.Circuit.SetActiveElement(load)
+        # Get the bus attached to the load
+        lBus = dss.CktElement.BusNames()
+        # Fix the bus name for simplicity
+        newBusL = fixBusName(lBus)
+        # Append [Name, Bus, kV, kvar, Vminpu, Vmaxpu, Phases] to Load object and store in list
+        LOADS.append(Load(dss.Loads.Name(), newBusL[0], dss.Loads.kV(), dss.Loads.kW(), dss.Loads.kvar(), dss.Loads.Vminpu(), dss.Loads.Vmaxpu(), dss.Loads.Phases(), dss.Loads.Yearly()))
+
+    # Results of the remote services already received for this circuit
+    definition = fingerprint([(bus.name, bus.coordinates) for bus in BUSES], [(line.name, line.bus1, line.bus2, line.enabled) for line in LINES],
+                             [(tf.name, tf.bus1, tf.bus2) for tf in TRANSFORMERS])
+    checkpoint = Checkpoint(f"{network}/.checkpoints/import.jsonl", definition, resume)
+
+    # Elevation and vegetation of every bus and edge sampled at once from the local rasters
+    local = None
+    if demPath is not None and canopyPath is not None:
+        from util.NetworkFunctions import nodeNameSplit
+        from util.localRasters import enrichFromRasters
+        busNum = {bus.name: i for i, bus in enumerate(BUSES)}
+        ends = [(line.name, line.bus1, line.bus2) for line in LINES] + [(tf.name, tf.bus1, tf.bus2) for tf in TRANSFORMERS]
+        ends = [(name, busNum.get(nodeNameSplit(bus1) if '.' in bus1 else bus1), busNum.get(nodeNameSplit(bus2) if '.' in bus2 else bus2)) for name, bus1, bus2 in ends]
+        ends = [end for end in ends if end[1] is not None and end[2] is not None]
+        elevation, vegetation, lineVegetation = enrichFromRasters([bus.coordinates for bus in BUSES], [(bus1, bus2) for _, bus1, bus2 in ends], demPath, canopyPath)
+        local = {"elevation": elevation, "vegetation": vegetation, "edges": {name: float(value) for (name, _, _), value in zip(ends, lineVegetation)}}
+
+    # Loop through bus list
+    for i, bus in enumerate(BUSES):
+        if local is not None:
+            # Nothing to checkpoint, the rasters are read again in one pass
+            data = {"elevation": float(local["elevation"][i]), "vegetation": float(local["vegetation"][i])}
+        else:
+            if f"node/{bus.name}" not in checkpoint:
+                # Print the node number for progress check
+                print('Node ' + str(i))
+                checkpoint.put(f"node/{bus.name}", {"elevation": getElevationByCoords(bus.coordinates), "vegetation": getLandCover(bus.coordinates)})
+            data = checkpoint.get(f"node/{bus.name}")
+        # Append [Name, Num, Coord, Elevation, Vegetation] to node object and store in node list
+        NODES.append(Node(bus.name,i,bus.coordinates,elevation=data["elevation"], vegetation=data["vegetation"]))
+
+    # Print Progress Update
+    print('Nodes Created')
+
+    # Loop through lines
+    for line in LINES:
+        # Append [Name, Length, Node1, Node2, Enabled] to Edge object and store in list
+        EDGES.append(Edge(line.name,line.length,findNodeNum(line.bus1, NODES),findNodeNum(line.bus2, NODES),line.enabled))
+
+    # Loop through transformers
+    for tf in TRANSFORMERS:
+        # Append [Name, 0, Node1, Node2, 1] to Edge object and store in list
+        EDGES.append(Edge(tf.name,0, findNodeNum(tf.bus1, NODES),findNodeNum(tf.bus2, NODES),1))
+
+    # Print Progress Update
+    print('Edges Created')
+
+    # Create a new graph. # Need to use a graph class that includes Multi (MultiGraph, MultiDiGraph, etc.)
+    G = nx.MultiDiGraph()
+
+    # Initialize a node dictionary to convert to csv
+    nodeDict = []
+
+    # Loop through node list
+    for node in NODES:
+        # Add the Node to Graph G
+        G.add_node(node.num, name = node.name, coords = node.coords)
+        # Add Node Data to dictionary entry and store in list
+        nodeDict.append({
+            'name':node.name,
+            'coords':node.coords,
+            'elevation':node.elevation,
+            'vegetation':node.vegetation
+            })
+
+    # Initialize a switch dictionary for the lines that are disabled
+    switchDict = []
+
+    # Loop through edges
+    for i, edge in enumerate(EDGES):
+        if local is not None:
+            vegetation = local["edges"].get(edge.name)
+        else:
+            if f"edge/{edge.name}" not in checkpoint:
+                # Print the edge number for progress update
+                print('Edge ' + str(i))
+                checkpoint.put(f"edge/{edge.name}", findAvgLineVegetation(edge.bus1, edge.bus2, NODES,10))
+            vegetation = checkpoint.get(f"edge/{edge.name}")
+        # Check if the edge is enabled
+        if edge.enabled ==1:
+            # Add the Edge to Graph G and assign edge data to corresponding attributes
+            G.add_edge(edge.bus1, edge.bus2,name = edge.name, length = edge.length, vegetation = vegetation)
+        else:
+            # Open lines can be closed by a switching study, so they keep the same columns as the edge list
+            switchDict.append({'source':edge.bus1, 'target':edge.bus2, 'name':edge.name, 'vegetation':vegetation, 'length':edge.length})
+    checkpoint.close()
+
+    if plot:
+        import matplotlib.pyplot as plt
+
+        # Create a position mapping based on node coordinates
+        pos = {node.num: node.coords for node in NODES if node.coords is not None}
+
+        # Draw the graph
+        nx.draw_networkx(G, pos=pos,with_labels=True, node_size=30, font_size=6,arrows=True)
+        plt.show()
+
+    # Convert Edge List and Node List to Panda Dataframes
+    el = nx.to_pandas_edgelist(G)
+    nl = pd.DataFrame(nodeDict)
+
+    # Loads with the node they are connected to, used for the load at risk
+    ll = pd.DataFrame([{
+        'name':load.name,
+        'bus':load.bus,
+        'node':findNodeNum(load.bus, NODES),
+        'kW':load.kW,
+        'kvar':load.kvar,
+        'phases':load.phases,
+        'yearly':load.yearly
+        } for load in LOADS])
+
+    sl = pd.DataFrame(switchDict, columns=['source', 'target', 'name', 'vegetation', 'length'])
+
+    # Convert Panda Dataframes to Edge List, Node List, Load List and Switch List CSV
+    pd.DataFrame.to_csv(nl,f'{network}/nodeList.csv')
+    pd.DataFrame.to_csv(el,f'{network}/edgeList.csv')
+    pd.DataFrame.to_csv(ll,f'{network}/loadList.csv')
+    pd.DataFrame.to_csv(sl,f'{network}/switchList.csv')
+    return G
+
+###############################################################
+            # WEATHER
+###############################################################
+
+def eventWindow(weatherEvents, j):
+    """
+    Determines the start and end of an event in the format expected by NLDAS2.
+
+    Args:
+        weatherEvents (pd.DataFrame): Events exported from NOAA's Storm Event Database.
+        j (int): Index of the event.
+
+    Returns:
+        begin (str): Start of the event, as "%Y-%m-%d %H%M".
+        end (str): End of the event, as "%Y-%m-%d %H%M".
+    """
+    from datetime import datetime, timedelta
+    from util.NetworkFunctions import roundup, parseDate
+
+    def window(date, time):
+        # Times after 23:00 round up to 2400, which is midnight of the next day as in the event catalog
+        hours = roundup(time) // 100
+        return (datetime.strptime(parseDate(date), "%Y-%m-%d") + timedelta(hours=hours)).strftime("%Y-%m-%d %H%M")
+
+    begin = window(weatherEvents['BEGIN_DATE'][j], weatherEvents['BEGIN_TIME'][j])
+    end = window(weatherEvents['END_DATE'][j], weatherEvents['END_TIME'][j])
+    return begin, end
+
+def collectWeather(network, eventFile="32123.xlsx", resume=True, hazards=None):
+    """
+    Queries NLDAS2 for the hourly rain and wind speed at every node for every event in the event file
+    and saves them to {network}/Rain/nodes and {network}/Wind/nodes. Other hazards (see util/hazards.py)
+    are derived from the same query and saved to {network}/{Hazard}/nodes. The series of every node are
+    checkpointed to {network}/.checkpoints/weather/ as they are received.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventFile (str): Excel file of the weather events to collect data for.
+        resume (bool): Reuse the series of a previous run of the same events and nodes that did not finish.
+        hazards (List[str] or None): Hazards to collect besides the rain and wind.
+
+    Returns:
+        fileNames (List[str]): Names of the files that were written.
+    """
+    import pandas as pd
+
+    # Importing Nodes of Network
+    nodes = pd.read_csv(f"{network}/nodeList.csv")
+
+    # Weather Event to collect data for
+    weatherEvents = pd.read_excel(eventFile)
+
+    # Loop through weather events
+    return [collectEventWeather(network, nodes, weatherEvents, j, resume, hazards) for j in weatherEvents.index]
+
+def collectEventWeather(network, nodes, weatherEvents, j, resume=True, hazards=None):
+    """
+    Collects the weather of every node for one event, see collectWeather.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        nodes (pd.DataFrame): Node list of the network.
+        weatherEvents (pd.DataFrame): Events exported from NOAA's Storm Event Database.
+        j (int): Index of the event.
+        resume (bool): Reuse the series of a previous run of the same event and nodes that did not finish.
+        hazards (List[str] or None): Hazards to collect besides the rain and wind.
+
+    Returns:
+        name (str): Name of the files that were written.
+    """
+    import numpy as np
+    import pandas as pd
+    from util.NetworkFunctions import getWeatherByCoords
+    from util.checkpoint import Checkpoint, fingerprint
+    from util.hazards import hazardFolder, hazardSeries, hazardVariables
+
+    # Hazards derived from the same query as the rain and wind
+    extraHazards = [hazard for hazard in hazards or [] if hazard not in ["rain", "wind"]]
+    pos = nodePositions(nodes)
+
+    # Determine start and end date of event
+    begin, end = eventWindow(weatherEvents, j)
+
+    # Initialize Node Event Lists
+    eventForNode = []
+    eventForNode1 = []
+    eventForHazard = {hazard: [] for hazard in extraHazards}
+
+    # Series already received for this event and these nodes
+    name = f"weatherEvent{j+1}.csv"
+    definition = fingerprint(list(nodes["name"]), [pos[i] for i in nodes.index], begin, end)
+    checkpoint = Checkpoint(f"{network}/.checkpoints/weather/{os.path.splitext(name)[0]}.jsonl", definition, resume)
+
+    # Loop through each node
+    for i in nodes.index:
+        # Series stored before a hazard was requested are queried again
+        if str(i) not in checkpoint or any(hazard not in checkpoint.get(str(i)) for hazard in extraHazards):
+            print(f"{i}th node for {j}th event")
+
+            # Grab node coordinates
+            long, lat = pos[i]
+
+            # Query NLDAS2 for Weather Data
+            timeframe = getWeatherByCoords(long, lat, begin, end)
+
+            # Convert uv wind components to wind speed
+            tempWind = np.sqrt(np.square(timeframe["wind_u"]) + np.square(timeframe["wind_v"]))
+            record = {"time": [str(time) for time in timeframe.index], "prcp": timeframe["prcp"].tolist(), "wind": tempWind.tolist()}
+            variables = {variable: timeframe[variable].values for variable in hazardVariables(extraHazards)}
+            record.update({hazard: values.tolist() for hazard, values in hazardSeries(variables, extraHazards).items()})
+            checkpoint.put(str(i), record)
+        series = checkpoint.get(str(i))
+
+        # Append the rain to node event lists
+        eventForNode.append(pd.Series(series["prcp"], index=series["time"], name="prcp"))
+
+        # Append the wind to node event lists (converted from m/s to mph)
+        eventForNode1.append(pd.Series(series["wind"], index=series["time"]) * 2.23694)
+        for hazard in extraHazards:
+            eventForHazard[hazard].append(pd.Series(series[hazard], index=series["time"]))
+    checkpoint.close()
+
+    # Convert Lists to dataframe and save them to csv's
+    os.makedirs(f"{network}/Rain/nodes", exist_ok=True)
+    os.makedirs(f"{network}/Wind/nodes", exist_ok=True)
+    pd.DataFrame.to_csv(pd.DataFrame(eventForNode), f'{network}/Rain/nodes/{name}')
+    pd.DataFrame.to_csv(pd.DataFrame(eventForNode1), f'{network}/Wind/nodes/{name}')
+    for hazard in extraHazards:
+        os.makedirs(f"{network}/{hazardFolder(hazard)}/nodes", exist_ok=True)
+        pd.DataFrame.to_csv(pd.DataFrame(eventForHazard[hazard]), f"{network}/{hazardFolder(hazard)}/nodes/{name}")
+    return name
+
+def readWeather(path):
+    """
+    Reads a weather CSV written by the collection stage and removes the extra index columns.
+
+    Args:
+        path (str): Path to the weather CSV.
+
+    Returns:
+        pd.DataFrame: One row per component and one column per hour of the event.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    return df.drop([column for column in df.columns if column.startswith("Unnamed")], axis=1)
+
+def listEvents(directory):
+    """
+    Lists the event files stored in a directory.
+
+    Args:
+        directory (str): Directory to search.
+
+    Returns:
+        List[str]: Sorted file names.
+    """
+    return sorted(f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f)))
+
+def weatherEvents(network, component="nodes"):
+    """
+    Lists the events whose weather was collected, as hourly series in {network}/Rain or as streaming
+    statistics in {network}/Stats.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        component (str): "nodes" or "edges".
+
+    Returns:
+        List[str]: Sorted file names.
+    """
+    names = set()
+    for directory in [f"{network}/Rain/{component}", f"{network}/Stats/{component}"]:
+        if os.path.isdir(directory):
+            names.update(listEvents(directory))
+    return sorted(names)
+
+def edgeEnds(network):
+    """
+    Reads the two end nodes of every edge.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+
+    Returns:
+        source (np.ndarray), target (np.ndarray): Index of the nodes of every edge.
+    """
+    import pandas as pd
+
+    edges = pd.read_csv(f"{network}/edgeList.csv", usecols=["source", "target"])
+    return edges["source"].astype(int).values, edges["target"].astype(int).values
+
+def edgeWeather(values, source, target):
+    """
+    Weather of every edge, the average of the weather of the two nodes it connects.
+
+    Args:
+        values (np.ndarray): Weather of every node (rows), any number of columns.
+        source (np.ndarray), target (np.ndarray): Index of the nodes of every edge.
+
+    Returns:
+        np.ndarray: Weather of every edge (rows).
+    """
+    return (values[source] + values[target]) / 2
+
+def readComponentWeather(network, folder, component, eventName):
+    """
+    Reads the hourly weather of the nodes or edges for an event. The weather of the edges is derived
+    from the weather of the nodes when it is needed, the files of {network}/{folder}/edges (see
+    collectEdgeWeather) are only read when the nodes have no file.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        folder (str): Folder of the weather variable, e.g. Rain.
+        component (str): "nodes" or "edges".
+        eventName (str): Name of the event file.
+
+    Returns:
+        pd.DataFrame: One row per component and one column per hour of the event.
+    """
+    import pandas as pd
+
+    nodePath = f"{network}/{folder}/nodes/{eventName}"
+    if component == "nodes" or not os.path.isfile(nodePath):
+        return readWeather(f"{network}/{folder}/{component}/{eventName}")
+    nodeDf = readWeather(nodePath)
+    return pd.DataFrame(edgeWeather(nodeDf.values, *edgeEnds(network)), columns=nodeDf.columns)
+
+def collectEdgeWeather(network, eventNames=None):
+    """
+    Computes the rain and wind (and the other hazards collected) of every edge by averaging the weather
+    of the two nodes it connects and saves them to {network}/Rain/edges, {network}/Wind/edges, ...
+    The stages derive the weather of the edges from the nodes themselves, so these files are only
+    needed to export it.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventNames (List[str] or None): Names of the event files to process, every file by default.
+    """
+    import pandas as pd
+    from util.hazards import HAZARDS, hazardFolder
+
+    source, target = edgeEnds(network)
+
+    folders = [hazardFolder(hazard) for hazard in HAZARDS if hazard in ["wind", "rain"] or os.path.isdir(f"{network}/{hazardFolder(hazard)}/nodes")]
+    for weather in folders:
+        os.makedirs(f"{network}/{weather}/edges", exist_ok=True)
+        # Loop through each file in folder
+        for name in eventNames or listEvents(f"{network}/{weather}/nodes"):
+            nodeDf = readWeather(f"{network}/{weather}/nodes/{name}")
+            # Calculate the edge data by averaging between the connected nodes
+            edgeDf = pd.DataFrame(edgeWeather(nodeDf.values, source, target), columns=nodeDf.columns)
+            pd.DataFrame.to_csv(edgeDf, f'{network}/{weather}/edges/{name}')
+
+###############################################################
+            # WEATHER IMPACT
+###############################################################
+
+def weatherImpactRanges(rainDf, windDf, alpha, windSeverityLevels, rainSeverityLevels, n=2):
+    """
+    Converts the rain and wind of an event into the weather impact range of each feature.
+
+    Args:
+        rainDf (pd.DataFrame): Rain of each component (rows) for each hour (columns).
+        windDf (pd.DataFrame): Wind speed of each component (rows) for each hour (columns).
+        alpha (Dict[str, List[float]]): Weights of [wind, rain] for each feature.
+        windSeverityLevels (list): Severity levels created by createLevelsAlt for the wind.
+        rainSeverityLevels (list): Severity levels created by createLevelsAlt for the rain.
+        n (int): Number of weather scenarios to interpolate between the min and max.
+
+    Returns:
+        pd.DataFrame: One column per feature holding the (low, high) weather impact of every component.
+    """
+    import numpy as np
+
+    # Calculate max and min values for rain and wind datasets
+    return weatherImpactFromExtremes(np.array(rainDf.min(axis=1)), np.array(rainDf.max(axis=1)), np.array(windDf.min(axis=1)), np.array(windDf.max(axis=1)),
+                                     alpha, windSeverityLevels, rainSeverityLevels, n)
+
+def weatherImpactFromExtremes(minValuesRain, maxValuesRain, minValuesWind, maxValuesWind, alpha, windSeverityLevels, rainSeverityLevels, n=2):
+    """
+    Converts the min and max rain and wind of every component during an event (e.g. from the streaming
+    statistics of util/streamingStats.py) into the weather impact range of each feature.
+
+    Args:
+        minValuesRain (np.ndarray), maxValuesRain (np.ndarray): Min and max rain of every component.
+        minValuesWind (np.ndarray), maxValuesWind (np.ndarray): Min and max wind speed of every component.
+        alpha (Dict[str, List[float]]): Weights of [wind, rain] for each feature.
+        windSeverityLevels (list): Severity levels created by createLevelsAlt for the wind.
+        rainSeverityLevels (list): Severity levels created by createLevelsAlt for the rain.
+        n (int): Number of weather scenarios to interpolate between the min and max.
+
+    Returns:
+        pd.DataFrame: One column per feature holding the (low, high) weather impact of every component.
+    """
+    import numpy as np
+    import pandas as pd
+    from util.mainHelper import weatherImpact, findWeatherLevel
+
+    # Initialize arrays to store scores and vectors in
+    numComponents = len(minValuesRain)
+    weatherVector = np.zeros((2, numComponents, n))
+    score_wind = np.zeros((2, numComponents))
+    score_rain = np.zeros((2, numComponents))
+
+    # Loop through each component to find the normalized weather value
+    for i in range(numComponents):
+        score_wind[0,i] = findWeatherLevel(minValuesWind[i],windSeverityLevels)
+        score_wind[1,i] = findWeatherLevel(maxValuesWind[i],windSeverityLevels)
+
+        score_rain[0,i] = findWeatherLevel(minValuesRain[i],rainSeverityLevels)
+        score_rain[1,i] = findWeatherLevel(maxValuesRain[i],rainSeverityLevels)
+
+    # Create the normalized weather vector
+    weatherVector[0,:] = np.linspace(score_wind[0,:], score_wind[1,:], num=n).T
+    weatherVector[1,:] = np.linspace(score_rain[0,:], score_rain[1,:], num=n).T
+
+    # Compute weather impact for both interpolated points
+    wi1 = weatherImpact(alpha, weatherVector[:,:,0])
+    wi2 = weatherImpact(alpha, weatherVector[:,:,n-1])
+
+    # Combine data for low and high scenarios
+    wi = {feature: [] for feature in alpha}
+    for feature in wi:
+        for low, high in zip(wi1[feature], wi2[feature]):
+            wi[feature].append((np.round(low,3), np.round(high,3)))
+
+    return pd.DataFrame(wi)
+
+def computeWeatherImpact(network, params=None, eventNames=None):
+    """
+    Scales the weather of every event and converts it to weather impact scores for the nodes and
+    edges. Every hazard of the "hazards" parameter (rain and wind by default) is scored with its
+    severity levels and the weather impact of all features is alpha @ scores (see util/hazards.py).
+    The results are saved to {network}/WI/nodes and {network}/WI/edges.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+        eventNames (List[str] or None): Names of the event files to process, every collected event by default.
+
+    Returns:
+        fileNames (List[str]): Names of the events that were processed.
+    """
+    import pandas as pd
+    from util.hazards import DEFAULT_HAZARDS, alphaMatrix, hazardExtremes, hazardLevels, weatherImpactMatrix
+
+    params = params or defaultParameters()
+    hazards = params.get("hazards", DEFAULT_HAZARDS)
+
+    # Normalization Levels for Weather Data
+    severityLevels = hazardLevels(params, hazards)
+
+    components = [("nodes", params["nodeFeatures"]), ("edges", params["edgeFeatures"])]
+    alpha = {component: alphaMatrix(params, features, hazards) for component, features in components}
+    for component, _ in components:
+        os.makedirs(f"{network}/WI/{component}", exist_ok=True)
+    source, target = edgeEnds(network)
+
+    fileNames = eventNames or sorted(set(weatherEvents(network, "nodes")) | set(weatherEvents(network, "edges")))
+    for name in fileNames:
+        # Only the min and max of every component are needed, the series of the nodes are read once and
+        # the edges are reduced from them without writing or holding their series
+        extremes = hazardExtremes(network, name, hazards, source, target)
+        for component, features in components:
+            mins, maxs = extremes[component]
+            events = weatherImpactMatrix(alpha[component], features, mins, maxs, severityLevels)
+            # Save the weather impact to CSV
+            pd.DataFrame.to_csv(events, f'{network}/WI/{component}/{name}')
+    return fileNames
+
+def readWeatherImpact(path, features):
+    """
+    Reads a weather impact CSV and parses the (low, high) tuples of each feature.
+
+    Args:
+        path (str): Path to the weather impact CSV.
+        features (List[str]): Features to read.
+
+    Returns:
+        Dict[str, np.ndarray]: Array of shape (components, 2) holding the low and high weather impact of each feature.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = pd.read_csv(path, usecols=features)
+    wi = {}
+    for feature in features:
+        # Values are stored as "(low, high)"
+        bounds = df[feature].str.strip("()").str.split(",", expand=True)
+        wi[feature] = bounds.astype(float).values.reshape(len(df), 2)
+    return wi
+
+###############################################################
+            # OUTAGE PROBABILITY
+###############################################################
+
+def computeForecastedRange(nodes, edges, params):
+    """
+    Determines the ranges of each physical feature that map to the severity levels.
+
+    Args:
+        nodes (pd.DataFrame): Node list of the network.
+        edges (pd.DataFrame): Edge list of the network.
+        params (dict): Pipeline parameters.
+
+    Returns:
+        forecastedRange (Dict[str, List[List[float]]]): Range of each severity level of each feature.
+    """
+    import numpy as np
+    from util.mainHelper import assign_values_to_ranges
+
+    forecastedRange = {}
+    numOfBins = params["numOfBins"]
+    for name in params["edgeFeatures"] + params["nodeFeatures"]:
+        component = nodes if name in params["nodeFeatures"] else edges
+        vals = np.round(component[name.split()[0]].values,1)
+        # Higher elevation means less exposure, so its levels are inverted
+        bins = assign_values_to_ranges(vals, numOfBins, inv=(name == "elevation nodes"))
+        forecastedRange[name] = [list(ranges) for ranges, count in bins]
+    return forecastedRange
+
+def componentLevels(nodes, edges, params, forecastedRange):
+    """
+    Finds the severity level of every physical feature of every node and edge.
+
+    Args:
+        nodes (pd.DataFrame): Node list of the network.
+        edges (pd.DataFrame): Edge list of the network.
+        params (dict): Pipeline parameters.
+        forecastedRange (Dict[str, List[List[float]]]): Range of each severity level of each feature.
+
+    Returns:
+        Dict[str, np.ndarray]: Severity level (1 to numOfBins) of every component for each feature.
+    """
+    from util.mainHelper import findLevels
+
+    levels = {}
+    for feature in params["nodeFeatures"] + params["edgeFeatures"]:
+        component = nodes if feature in params["nodeFeatures"] else edges
+        levels[feature] = findLevels(component[feature.split()[0]].values, feature, forecastedRange, params["numOfBins"])
+    return levels
+
+def computeOutageProbability(network, eventName="weatherEvent1.csv", params=None):
+    """
+    Computes the probability of an outage of every node for an event, taking into account the
+    outage of the components between the node and the substation. The fragility curves are read
+    from precomputed tables (see util/fragilityTables.py), or from a multivariate normal CDF when
+    the "correlation" parameter correlates the features (see util/correlatedFragility.py). They are
+    propagated through the compact tree when the network is radial, and through the general
+    connectivity model of util/reliability.py when it has loops, several sources or reversed edges.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file in {network}/WI/nodes and {network}/WI/edges.
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+
+    Returns:
+        results (dict): Dictionary with the following keys
+            - prob (np.ndarray): Low and high probability of an outage of every node, shape (nodes, 2).
+            - probError (np.ndarray or None): Error bound of prob on the meshed part of the network, None when the network is radial.
+            - probNodes (np.ndarray): Low and high outage probability of the nodes themselves.
+            - probEdges (np.ndarray): Low and high outage probability of the edges themselves.
+            - errorNodes (np.ndarray or None), errorEdges (np.ndarray or None): Estimated error of probNodes and probEdges with correlated features.
+            - wiNodes (Dict[str, np.ndarray]), wiEdges (Dict[str, np.ndarray]): Low and high weather impact of every feature.
+            - levels (Dict[str, np.ndarray]): Severity level of every component for each feature.
+            - nodes (pd.DataFrame), edges (pd.DataFrame): The network.
+            - topology (Topology): Compact tree of the network.
+    """
+    params = params or defaultParameters()
+
+    # Load node and edge data from CSV files
+    nodes, edges = loadNetwork(network)
+    model = prepareOutageModel(nodes, edges, params)
+
+    # Load weather impact data for nodes and edges
+    weatherImpactNodes = readWeatherImpact(f"{network}/WI/nodes/{eventName}", params["nodeFeatures"])
+    weatherImpactEdges = readWeatherImpact(f"{network}/WI/edges/{eventName}", params["edgeFeatures"])
+    return evaluateOutageModel(model, weatherImpactNodes, weatherImpactEdges)
+
+def prepareOutageModel(nodes, edges, params):
+    """
+    Computes the parts of the outage model that do not depend on the event: the structure of the
+    network, the severity level of every component and the fragility curve tables.
+
+    Args:
+        nodes (pd.DataFrame): Node list of the network.
+        edges (pd.DataFrame): Edge list of the network.
+        params (dict): Pipeline parameters.
+
+    Returns:
+        model (dict): Dictionary with the keys params, nodes, edges, topology, reliability (None when the
+            network is radial), forecastedRange, levels, meanRange and stdRange.
+    """
+    from util.mainHelper import createTables
+    from util.topology import Topology
+
+    sources = params.get("sources", [0])
+
+    # Prepare graph structure
+    topology = Topology.fromEdges(edges["source"].values, edges["target"].values, len(nodes), roots=sources)
+    # The tree reaches every node with one edge per node that is not a source
+    radial = len(topology.order) == len(nodes) and len(edges) == len(nodes) - topology.levelStarts[1]
+    reliability = None
+    if not radial:
+        from util.reliability import Reliability
+        reliability = Reliability.fromEdgeList(edges, len(nodes), sources)
+
+    # Process each forecasted factor to determine the forecasted ranges and the level of every component
+    forecastedRange = computeForecastedRange(nodes, edges, params)
+    levels = componentLevels(nodes, edges, params, forecastedRange)
+
+    # Create tables for mean and standard deviation ranges
+    meanRange, stdRange = createTables(params["stdWI"], params["meanWI"], params["numOfBins"] + 1)
+
+    return {"params": params, "nodes": nodes, "edges": edges, "topology": topology, "reliability": reliability,
+            "forecastedRange": forecastedRange, "levels": levels, "meanRange": meanRange, "stdRange": stdRange}
+
+def evaluateOutageModel(model, weatherImpactNodes, weatherImpactEdges):
+    """
+    Computes the probability of an outage of every node from the weather impact on the nodes and edges.
+
+    Args:
+        model (dict): Output of prepareOutageModel.
+        weatherImpactNodes (Dict[str, np.ndarray]): Weather impact on every node for each node feature, shape (nodes, ...).
+        weatherImpactEdges (Dict[str, np.ndarray]): Weather impact on every edge for each edge feature, shape (edges, ...).
+            The trailing axes (e.g. the low and high bounds, or several events side by side) are evaluated together.
+
+    Returns:
+        results (dict): See computeOutageProbability.
+    """
+    from util.correlatedFragility import fragilityProbs
+
+    params, levels = model["params"], model["levels"]
+    meanRange, stdRange = model["meanRange"], model["stdRange"]
+
+    # Calculate probabilities for nodes and edges based on weather impact
+    correlation = params.get("correlation")
+    probNodes, errorNodes = fragilityProbs(levels, weatherImpactNodes, params["nodeFeatures"], meanRange, stdRange, correlation)
+    probEdges, errorEdges = fragilityProbs(levels, weatherImpactEdges, params["edgeFeatures"], meanRange, stdRange, correlation)
+
+    # Calculate combined probabilities for nodes and their parent nodes
+    probError = None
+    if model["reliability"] is None:
+        prob = model["topology"].propagate(probNodes, probEdges)
+    else:
+        prob, probError = model["reliability"].outage(probNodes, probEdges, params.get("reliabilitySamples", 10000))
+
+    return {"prob": prob, "probError": probError, "probNodes": probNodes, "probEdges": probEdges, "errorNodes": errorNodes, "errorEdges": errorEdges,
+            "wiNodes": weatherImpactNodes, "wiEdges": weatherImpactEdges, "levels": levels, "nodes": model["nodes"], "edges": model["edges"],
+            "topology": model["topology"]}
+
+def outageResultsPath(network, eventName, component="nodes"):
+    """
+    Returns the path of the outage results of an event.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        component (str): "nodes" or "edges".
+
+    Returns:
+        str: Path to {network}/Outage/{eventName} for the nodes or {network}/Outage/edges/{eventName} for the edges.
+    """
+    if component == "edges":
+        return f"{network}/Outage/edges/{eventName}"
+    return f"{network}/Outage/{eventName}"
+
+def saveOutageProbability(network, eventName, results, loadAtRisk=None):
+    """
+    Saves the low, high and mean probability of an outage of every node to {network}/Outage/{eventName}
+    and of every edge to {network}/Outage/edges/{eventName}.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        results (dict): Output of computeOutageProbability.
+        loadAtRisk (Dict[str, np.ndarray] or None): Per node load at risk from computeLoadAtRisk, saved as extra columns.
+
+    Returns:
+        pd.DataFrame: The saved results.
+    """
+    import pandas as pd
+
+    prob = results["prob"]
+    df = pd.DataFrame({
+        "name": results["nodes"]["name"],
+        "low": [low for low, high in prob],
+        "high": [high for low, high in prob],
+    })
+    df["mean"] = (df["low"] + df["high"]) / 2
+    if results.get("probError") is not None:
+        # Error bound of the Monte Carlo estimate on the meshed part of the network
+        df["errorLow"], df["errorHigh"] = results["probError"][:, 0], results["probError"][:, 1]
+    for column, values in (loadAtRisk or {}).items():
+        df[column] = values
+    os.makedirs(f"{network}/Outage/edges", exist_ok=True)
+    pd.DataFrame.to_csv(df, outageResultsPath(network, eventName))
+
+    # Probability of an outage of the edges themselves
+    probEdges = results["probEdges"]
+    edgeDf = pd.DataFrame({
+        "name": results["edges"]["name"],
+        "low": [low for low, high in probEdges],
+        "high": [high for low, high in probEdges],
+    })
+    edgeDf["mean"] = (edgeDf["low"] + edgeDf["high"]) / 2
+    pd.DataFrame.to_csv(edgeDf, outageResultsPath(network, eventName, "edges"))
+    return df
+
+###############################################################
+            # RENDERING
+###############################################################
+
+def renderOutageMap(network, eventName="weatherEvent1.csv", title="", meanProb=None):
+    """
+    Plots the network with each node colored by its mean probability of an outage.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event whose results are read from {network}/Outage when meanProb is not given.
+        title (str): Title for the plotted graph.
+        meanProb (List[float] or None): Mean probability of an outage of every node.
+    """
+    import pandas as pd
+    from util.mainHelper import plotTreeWithProb
+
+    nodes, edges = loadNetwork(network)
+    G, graph = buildGraph(nodes, edges)
+    if meanProb is None:
+        meanProb = pd.read_csv(outageResultsPath(network, eventName))["mean"].tolist()
+
+    # Plot the graph with probabilities
+    plotTreeWithProb(G, meanProb, title, nodePositions(nodes))
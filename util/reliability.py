@@ -0,0 +1,276 @@
+import numpy as np
+
+# Connectivity probabilities of general (meshed, multi-source) networks. A node is energized when it
+# works and a path of working nodes and edges connects it to a working source, in any direction.
+# The trees hanging off the network (everything that is not on a loop or between sources) are
+# peeled off leaf by leaf and solved exactly along their path to the rest of the network, in linear
+# time. Only the remaining core, holding the loops, ties and sources, is solved by enumeration when
+# it is small and by batched Monte Carlo otherwise.
+
+# Largest number of core nodes and edges whose states are all enumerated
+EXACT_LIMIT = 16
+
+# Normal quantile of the confidence of the Monte Carlo error bounds (99%)
+CONFIDENCE_Z = 2.576
+
+# Reliability Class holding the peeled structure of a network
+class Reliability:
+    def __init__(self, numNodes, source, target, sources=(0,), enabled=None):
+        from scipy import sparse
+
+        # Number of nodes in the network
+        self.numNodes = numNodes
+
+        source = np.asarray(source, dtype=np.int64)
+        target = np.asarray(target, dtype=np.int64)
+        # Edges taking part in the network: enabled (e.g. closed switches) and not self loops
+        usable = source != target
+        if enabled is not None:
+            usable &= np.asarray(enabled, dtype=bool)
+        edgeIds = np.nonzero(usable)[0]
+
+        isSource = np.zeros(numNodes, dtype=bool)
+        isSource[np.asarray(sources, dtype=np.int64)] = True
+        self.isSource = isSource
+
+        # Degree and XOR of the incident edges of every node: a node of degree one is attached by the edge equal to the XOR
+        degree = np.bincount(source[edgeIds], minlength=numNodes) + np.bincount(target[edgeIds], minlength=numNodes)
+        incident = np.zeros(numNodes, dtype=np.int64)
+        np.bitwise_xor.at(incident, source[edgeIds], edgeIds)
+        np.bitwise_xor.at(incident, target[edgeIds], edgeIds)
+        alive = np.ones(numNodes, dtype=bool)
+        edgeAlive = usable.copy()
+
+        # Node every peeled node is attached to (-1 when it cannot reach a source) and the edge attaching it
+        self.anchor = np.full(numNodes, -1, dtype=np.int64)
+        self.anchorEdge = np.full(numNodes, -1, dtype=np.int64)
+        # Nodes peeled in every round, the last rounds are the closest to the core
+        self.rounds = []
+        while True:
+            # Nodes without any edge left that are not sources can never be energized
+            isolated = np.nonzero(alive & (degree == 0) & ~isSource)[0]
+            alive[isolated] = False
+
+            leaves = np.nonzero(alive & (degree == 1) & ~isSource)[0]
+            edge = incident[leaves]
+            other = source[edge] + target[edge] - leaves
+            # When both ends of an edge are leaves, peel only the end with the higher index this round
+            leafMask = np.zeros(numNodes, dtype=bool)
+            leafMask[leaves] = True
+            keep = ~(leafMask[other] & (leaves < other))
+            leaves, edge, other = leaves[keep], edge[keep], other[keep]
+
+            if not leaves.size and not isolated.size:
+                break
+            self.rounds.append(np.concatenate([isolated, leaves]))
+            if not leaves.size:
+                continue
+            self.anchor[leaves] = other
+            self.anchorEdge[leaves] = edge
+            alive[leaves] = False
+            edgeAlive[edge] = False
+            degree[leaves] = 0
+            np.subtract.at(degree, other, 1)
+            np.bitwise_xor.at(incident, other, edge)
+
+        # Core of the network, indices into the nodes and edges
+        self.coreNodes = np.nonzero(alive)[0]
+        self.coreEdges = np.nonzero(edgeAlive)[0]
+        local = np.full(numNodes, -1, dtype=np.int64)
+        local[self.coreNodes] = np.arange(len(self.coreNodes))
+        self.coreSource = local[source[self.coreEdges]]
+        self.coreTarget = local[target[self.coreEdges]]
+
+        # Incidence of the core edges on their two ends, used to spread the energized nodes over working edges
+        n, m = len(self.coreNodes), len(self.coreEdges)
+        rows = np.arange(m)
+        self.toTarget = sparse.csr_matrix((np.ones(m), (rows, self.coreTarget)), shape=(m, n))
+        self.toSource = sparse.csr_matrix((np.ones(m), (rows, self.coreSource)), shape=(m, n))
+
+    @classmethod
+    def fromEdgeList(cls, edges, numNodes, sources=(0,), enabled=None):
+        """
+        Builds the structure from an edge list.
+
+        Args:
+            edges (pd.DataFrame): Edge list with the columns source and target.
+            numNodes (int): Number of nodes in the network.
+            sources (Iterable[int]): Source nodes (substations).
+            enabled (np.ndarray or None): Whether every edge is in service, every edge when None.
+
+        Returns:
+            Reliability: The structure.
+        """
+        return cls(numNodes, edges["source"].values, edges["target"].values, sources, enabled)
+
+    def isRadial(self):
+        """
+        Returns whether every node is solved exactly without the core: the network is a forest with one source per tree.
+        """
+        return len(self.coreEdges) == 0
+
+    def _spread(self, energized, workingNodes, workingEdges):
+        # Energize the neighbours of the energized nodes through working edges until nothing changes
+        while True:
+            fromSource = (energized[:, self.coreSource] & workingEdges).astype(np.float32)
+            fromTarget = (energized[:, self.coreTarget] & workingEdges).astype(np.float32)
+            reached = np.asarray((self.toTarget.T @ fromSource.T).T + (self.toSource.T @ fromTarget.T).T) > 0
+            updated = energized | (reached & workingNodes)
+            if (updated == energized).all():
+                return energized
+            energized = updated
+
+    def coreEnergized(self, probN, probE, samples=10000, batchSize=2048, seed=0):
+        """
+        Probability of every core node being energized.
+
+        Args:
+            probN (np.ndarray): Probability of an outage of every node, shape (nodes, columns).
+            probE (np.ndarray): Probability of an outage of every edge, shape (edges, columns).
+            samples (int): Number of Monte Carlo samples when the core is too large to enumerate.
+            batchSize (int): Number of samples drawn at a time.
+            seed (int): Seed of the samples, the same uniforms are used for every column.
+
+        Returns:
+            energized (np.ndarray): Probability of every core node being energized, shape (core nodes, columns).
+            error (np.ndarray): Bound on the absolute error of every probability at the CONFIDENCE_Z level, zero when exact.
+        """
+        n, m = len(self.coreNodes), len(self.coreEdges)
+        columns = probN.shape[1]
+        coreSource = self.isSource[self.coreNodes]
+        pN, pE = probN[self.coreNodes], probE[self.coreEdges]
+        if m == 0:
+            return (1 - pN) * coreSource[:, None], np.zeros((n, columns))
+
+        if n + m <= EXACT_LIMIT:
+            # Every combination of working and failed core components, weighted by its probability
+            states = ((np.arange(2 ** (n + m))[:, None] >> np.arange(n + m)) & 1).astype(bool)
+            workingNodes, workingEdges = states[:, :n], states[:, n:]
+            energized = self._spread(workingNodes & coreSource, workingNodes, workingEdges)
+            result = np.empty((n, columns))
+            for c in range(columns):
+                works = np.concatenate([1 - pN[:, c], 1 - pE[:, c]])
+                weight = np.prod(np.where(states, works, 1 - works), axis=1)
+                result[:, c] = weight @ energized
+            return result, np.zeros((n, columns))
+
+        rng = np.random.default_rng(seed)
+        total = np.zeros((n, columns))
+        drawn = 0
+        while drawn < samples:
+            size = min(batchSize, samples - drawn)
+            uniforms = rng.random((size, n + m))
+            for c in range(columns):
+                workingNodes = uniforms[:, :n] >= pN[:, c]
+                workingEdges = uniforms[:, n:] >= pE[:, c]
+                total[:, c] += self._spread(workingNodes & coreSource, workingNodes, workingEdges).sum(axis=0)
+            drawn += size
+        energized = total / drawn
+        # Normal approximation of the binomial proportion, at least one sample of resolution
+        error = CONFIDENCE_Z * np.sqrt(np.maximum(energized * (1 - energized), 1 / drawn) / drawn)
+        return energized, error
+
+    def outage(self, probN, probE, samples=10000, seed=0):
+        """
+        General version of Topology.propagate: the probability of every node not being connected to a working source.
+
+        Args:
+            probN (np.ndarray): Probability of an outage of every node, shape (nodes,) or (nodes, bounds).
+            probE (np.ndarray): Probability of an outage of every edge, shape (edges,) or (edges, bounds).
+            samples (int): Number of Monte Carlo samples for a large core.
+            seed (int): Seed of the samples.
+
+        Returns:
+            prob (np.ndarray): Probability of an outage of every node, with the shape of probN.
+            error (np.ndarray): Bound on the absolute error of every probability, zero where it is exact.
+        """
+        probN = np.asarray(probN, dtype=float)
+        shape = probN.shape
+        probN = probN.reshape(len(probN), -1)
+        probE = np.asarray(probE, dtype=float).reshape(len(probE), -1)
+
+        energized = np.zeros(probN.shape)
+        error = np.zeros(probN.shape)
+        energized[self.coreNodes], error[self.coreNodes] = self.coreEnergized(probN, probE, samples, seed=seed)
+
+        # Peeled trees, from the core outwards: energized when the anchor is and the path to it works
+        for nodes in reversed(self.rounds):
+            attached = nodes[self.anchor[nodes] >= 0]
+            anchor, edge = self.anchor[attached], self.anchorEdge[attached]
+            works = (1 - probN[attached]) * (1 - probE[edge])
+            energized[attached] = energized[anchor] * works
+            error[attached] = error[anchor] * works
+        return (1 - energized).reshape(shape), error.reshape(shape)
+
+    def coreGradient(self, probN, probE, gradN, gradE):
+        """
+        Exact probability of every core node being energized and its derivatives with respect to parameters.
+
+        Args:
+            probN (np.ndarray), probE (np.ndarray): Probability of an outage of every node and edge, shape (components, columns).
+            gradN (np.ndarray), gradE (np.ndarray): Their derivatives, shape (components, columns, parameters).
+
+        Returns:
+            energized (np.ndarray): Probability of every core node being energized, shape (core nodes, columns).
+            grad (np.ndarray): Derivatives of energized, shape (core nodes, columns, parameters).
+        """
+        n, m = len(self.coreNodes), len(self.coreEdges)
+        coreSource = self.isSource[self.coreNodes]
+        pN, pE = probN[self.coreNodes], probE[self.coreEdges]
+        if m == 0:
+            return (1 - pN) * coreSource[:, None], -gradN[self.coreNodes] * coreSource[:, None, None]
+        if n + m > EXACT_LIMIT:
+            raise ValueError(f"Sensitivities need a core of at most {EXACT_LIMIT} nodes and edges, this network has {n + m}")
+
+        states = ((np.arange(2 ** (n + m))[:, None] >> np.arange(n + m)) & 1).astype(bool)
+        workingNodes, workingEdges = states[:, :n], states[:, n:]
+        energizedStates = self._spread(workingNodes & coreSource, workingNodes, workingEdges).astype(float)
+        # A failure probability lowers the weight of the states where the component works and raises the others
+        sign = np.where(states, -1.0, 1.0)
+        dProb = np.concatenate([gradN[self.coreNodes], gradE[self.coreEdges]])
+        energized = np.empty(pN.shape)
+        grad = np.empty(pN.shape + (dProb.shape[-1],))
+        for c in range(pN.shape[1]):
+            works = np.concatenate([1 - pN[:, c], 1 - pE[:, c]])
+            factors = np.where(states, works, 1 - works)
+            # Product of the factors of every other component, from prefix and suffix products
+            before = np.cumprod(np.concatenate([np.ones((len(states), 1)), factors[:, :-1]], axis=1), axis=1)
+            after = np.cumprod(np.concatenate([np.ones((len(states), 1)), factors[:, :0:-1]], axis=1), axis=1)[:, ::-1]
+            energized[:, c] = np.prod(factors, axis=1) @ energizedStates
+            grad[:, c] = (energizedStates.T @ (before * after * sign)) @ dProb[:, c]
+        return energized, grad
+
+    def outageGradient(self, probN, probE, gradN, gradE):
+        """
+        outage along with the derivatives of the result with respect to parameters. The core is solved
+        exactly, so it must be small enough to enumerate.
+
+        Args:
+            probN (np.ndarray): Probability of an outage of every node, shape (nodes,) or (nodes, columns).
+            probE (np.ndarray): Probability of an outage of every edge, shape (edges,) or (edges, columns).
+            gradN (np.ndarray): Derivatives of probN, shape (nodes, [columns,] parameters).
+            gradE (np.ndarray): Derivatives of probE, shape (edges, [columns,] parameters).
+
+        Returns:
+            prob (np.ndarray): Probability of an outage of every node, with the shape of probN.
+            grad (np.ndarray): Derivatives of prob, with the shape of gradN.
+        """
+        probN = np.asarray(probN, dtype=float)
+        shape, gradShape = probN.shape, np.shape(gradN)
+        probN = probN.reshape(len(probN), -1)
+        probE = np.asarray(probE, dtype=float).reshape(len(probE), -1)
+        gradN = np.asarray(gradN, dtype=float).reshape(probN.shape + (-1,))
+        gradE = np.asarray(gradE, dtype=float).reshape(probE.shape + (-1,))
+
+        energized = np.zeros(probN.shape)
+        grad = np.zeros(gradN.shape)
+        energized[self.coreNodes], grad[self.coreNodes] = self.coreGradient(probN, probE, gradN, gradE)
+
+        for nodes in reversed(self.rounds):
+            attached = nodes[self.anchor[nodes] >= 0]
+            anchor, edge = self.anchor[attached], self.anchorEdge[attached]
+            nodeWorks, edgeWorks = 1 - probN[attached], 1 - probE[edge]
+            dWorks = -gradN[attached] * edgeWorks[..., None] - nodeWorks[..., None] * gradE[edge]
+            grad[attached] = grad[anchor] * (nodeWorks * edgeWorks)[..., None] + energized[anchor][..., None] * dWorks
+            energized[attached] = energized[anchor] * nodeWorks * edgeWorks
+        return (1 - energized).reshape(shape), (-grad).reshape(gradShape)
@@ -0,0 +1,177 @@
+import os
+import numpy as np
+
+# Analytic sensitivities of the outage probabilities to the parameters of the fragility curves
+# (meanWI, stdWI) and of the weather impact (alpha). The fragility curve of a component is a product
+# of normal CDFs, so its derivative with respect to a parameter of one feature is the normal density
+# of that feature times the CDFs of the others. The derivatives are then carried along the path of
+# every node to its source by the product rule (Topology.propagateGradient, Reliability.outageGradient),
+# so one evaluation gives the derivatives of every node and of the feeder totals for every parameter.
+
+# Groups of parameters that can be differentiated
+PARAMETER_GROUPS = ["meanWI", "stdWI", "alpha"]
+
+def parameterList(params, groups=None):
+    """
+    Lists the scalar parameters of the groups, in the order of the gradients.
+
+    Args:
+        params (dict): Pipeline parameters.
+        groups (List[str] or None): Groups of PARAMETER_GROUPS to include, all of them by default.
+
+    Returns:
+        List[Tuple[str, str, int]]: Group, feature and position of every parameter, e.g. ("meanWI", "vegetation", 0)
+            for the mean of the first severity level of vegetation. alpha positions follow the "hazards" parameter
+            (0 for the wind and 1 for the rain by default).
+    """
+    from util.hazards import DEFAULT_HAZARDS
+
+    features = params["nodeFeatures"] + params["edgeFeatures"]
+    sizes = {"meanWI": 2, "stdWI": 2, "alpha": len(params.get("hazards", DEFAULT_HAZARDS))}
+    return [(group, feature, i) for group in groups or PARAMETER_GROUPS for feature in features for i in range(sizes[group])]
+
+def parameterName(parameter):
+    group, feature, i = parameter
+    return f"{group}[{feature}][{i}]"
+
+def fragilityGradients(featureLevels, impactWeather, features, params, parameters, scores=None):
+    """
+    Probability of an outage of every component and its derivatives with respect to parameters.
+
+    Args:
+        featureLevels (Dict[str, np.ndarray]): Severity level (1 to numOfBins) of every component for each feature.
+        impactWeather (Dict[str, np.ndarray]): Weather impact on every component for each feature, shape (components, columns).
+        features (List[str]): Features of the components.
+        params (dict): Pipeline parameters.
+        parameters (List[Tuple[str, str, int]]): Parameters from parameterList.
+        scores (np.ndarray or None): Scores of every hazard from eventScores, shape (hazards, components, columns), needed for alpha.
+
+    Returns:
+        prob (np.ndarray): Probability of an outage of every component, shape (components, columns).
+        grad (np.ndarray): Derivatives of prob, shape (components, columns, parameters).
+    """
+    from scipy.special import ndtr
+
+    numOfBins = params["numOfBins"]
+    z, cdf, weights, stds = {}, {}, {}, {}
+    for feature in features:
+        impact = np.asarray(impactWeather[feature], dtype=float)
+        level = np.asarray(featureLevels[feature]).reshape((-1,) + (1,) * (impact.ndim - 1))
+        # The levels are spaced evenly between the two values of meanWI and stdWI (createTables),
+        # level L is (1 - L / numOfBins) times the first plus L / numOfBins times the second
+        weights[feature] = level / numOfBins
+        low, high = params["meanWI"][feature]
+        mean = low + (high - low) * weights[feature]
+        low, high = params["stdWI"][feature]
+        stds[feature] = low + (high - low) * weights[feature]
+        z[feature] = (impact - mean) / stds[feature]
+        cdf[feature] = ndtr(z[feature])
+
+    prob = np.prod([cdf[feature] for feature in features], axis=0)
+    grad = np.zeros(prob.shape + (len(parameters),))
+    for k, (group, feature, i) in enumerate(parameters):
+        if feature not in features:
+            continue
+        weight = weights[feature] if i == 1 else 1 - weights[feature]
+        if group == "meanWI":
+            dz = -weight / stds[feature]
+        elif group == "stdWI":
+            dz = -z[feature] * weight / stds[feature]
+        else:
+            if scores is None:
+                raise ValueError("The hazard scores of the event are needed for the sensitivities to alpha")
+            dz = scores[i] / stds[feature]
+        # Normal density of this feature times the CDF of the others
+        density = np.exp(-0.5 * z[feature] ** 2) / np.sqrt(2 * np.pi)
+        others = np.prod([cdf[other] for other in features if other != feature], axis=0) if len(features) > 1 else 1.0
+        grad[..., k] = density * others * dz
+    return prob, grad
+
+def computeOutageSensitivities(network, eventName="weatherEvent1.csv", params=None, groups=None):
+    """
+    Computes the probability of an outage of every node for an event along with its derivatives with
+    respect to meanWI, stdWI and alpha, and the derivatives of the feeder totals (mean probability,
+    expected number of nodes out and expected kW interrupted). The derivatives with respect to alpha
+    ignore the rounding of the weather impact to 3 decimals.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file in {network}/WI and the folders of the hazards (e.g. {network}/Rain and {network}/Wind).
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+        groups (List[str] or None): Groups of PARAMETER_GROUPS to differentiate, all of them by default.
+
+    Returns:
+        results (dict): Dictionary with the following keys
+            - parameters (List[Tuple[str, str, int]]): Parameters from parameterList.
+            - prob (np.ndarray): Low and high probability of an outage of every node, shape (nodes, 2).
+            - grad (np.ndarray): Derivatives of prob, shape (nodes, 2, parameters).
+            - totals (Dict[str, Tuple[np.ndarray, np.ndarray]]): Low and high value of every feeder total and its derivatives, shape (2, parameters).
+    """
+    from util.pipeline import defaultParameters, loadNetwork, prepareOutageModel, readWeatherImpact
+    from util.hazards import eventScores
+    from util.loadAtRisk import readLoads
+
+    params = params or defaultParameters()
+    groups = groups or PARAMETER_GROUPS
+    if params.get("correlation"):
+        raise ValueError("Sensitivities are only available for independent features, remove the correlation parameter")
+    parameters = parameterList(params, groups)
+
+    nodes, edges = loadNetwork(network)
+    model = prepareOutageModel(nodes, edges, params)
+
+    # Scores of every hazard, needed for the derivatives with respect to alpha
+    scores = {"nodes": None, "edges": None}
+    if "alpha" in groups:
+        scores = eventScores(network, eventName, params, edges["source"].values.astype(int), edges["target"].values.astype(int))
+
+    components = {}
+    for component, features in [("nodes", params["nodeFeatures"]), ("edges", params["edgeFeatures"])]:
+        wi = readWeatherImpact(f"{network}/WI/{component}/{eventName}", features)
+        components[component] = fragilityGradients(model["levels"], wi, features, params, parameters, scores[component])
+    (probNodes, gradNodes), (probEdges, gradEdges) = components["nodes"], components["edges"]
+
+    if model["reliability"] is None:
+        prob, grad = model["topology"].propagateGradient(probNodes, probEdges, gradNodes, gradEdges)
+    else:
+        prob, grad = model["reliability"].outageGradient(probNodes, probEdges, gradNodes, gradEdges)
+
+    # Feeder totals are weighted sums of the node probabilities, and so are their derivatives
+    loads = readLoads(network, nodes)
+    loads = loads[loads["node"] >= 0]
+    weights = {
+        "meanProb": np.full(len(nodes), 1 / len(nodes)),
+        "expectedNodesOut": np.ones(len(nodes)),
+        "expectedKW": np.bincount(loads["node"].values, weights=loads["kW"].values, minlength=len(nodes)),
+    }
+    totals = {name: (weight @ prob, np.einsum("n,ncp->cp", weight, grad)) for name, weight in weights.items()}
+    return {"parameters": parameters, "prob": prob, "grad": grad, "totals": totals}
+
+def saveSensitivities(network, eventName, results):
+    """
+    Saves the sensitivities of the feeder totals to {network}/Outage/sensitivity/{eventName} (one row per
+    parameter) and the sensitivities of the mean probability of every node to
+    {network}/Outage/sensitivity/nodes/{eventName} (one column per parameter).
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        results (dict): Output of computeOutageSensitivities.
+
+    Returns:
+        pd.DataFrame: The sensitivities of the feeder totals.
+    """
+    import pandas as pd
+
+    names = [parameterName(parameter) for parameter in results["parameters"]]
+    df = pd.DataFrame({"parameter": names})
+    for total, (value, grad) in results["totals"].items():
+        df[f"{total} low"] = grad[0]
+        df[f"{total} high"] = grad[1]
+
+    os.makedirs(f"{network}/Outage/sensitivity/nodes", exist_ok=True)
+    pd.DataFrame.to_csv(df, f"{network}/Outage/sensitivity/{eventName}")
+    # The mean probability is the average of the low and high bounds
+    nodeDf = pd.DataFrame(results["grad"].mean(axis=1), columns=names)
+    pd.DataFrame.to_csv(nodeDf, f"{network}/Outage/sensitivity/nodes/{eventName}")
+    return df
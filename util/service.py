@@ -0,0 +1,381 @@
+import json
+import os
+import signal
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+# Keep the numerical libraries single threaded, the workers already use every core. They read these
+# variables when they are loaded, so they are set before the first import of numpy
+for variable in ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]:
+    os.environ.setdefault(variable, "1")
+
+import numpy as np
+
+# Long lived outage probability service. The networks are loaded once, and the parts of the model
+# that do not depend on the event (structure, severity levels, fragility tables) are kept for every
+# set of parameters recently used, so a request only evaluates the fragility curves and propagates
+# them. Requests are served over HTTP and/or a Unix socket by a pool of forked worker processes,
+# each answering requests on its own threads.
+
+# Number of prepared models (network and parameters), and of weather impact files, kept in memory
+MODEL_CACHE_SIZE = 16
+
+# Outage Service Class holding the loaded networks and prepared models
+class OutageService:
+    def __init__(self, networks, params=None):
+        from util.pipeline import defaultParameters
+
+        # Base parameters, requests may override any of them
+        self.params = params or defaultParameters()
+
+        # Nodes, edges and load of every network by name
+        self.networks = {}
+
+        # Prepared models by network and parameters, least recently used first
+        self.models = OrderedDict()
+
+        # Weather impact of the events already read by path, least recently used first
+        self.impacts = OrderedDict()
+
+        self.lock = threading.Lock()
+        for network in networks:
+            self.load(network)
+
+    def load(self, network):
+        """
+        Loads a network and prepares its model with the base parameters.
+
+        Args:
+            network (str): Folder name corresponding to the network data.
+        """
+        from util.pipeline import loadNetwork
+        from util.loadAtRisk import readLoads
+
+        nodes, edges = loadNetwork(network)
+        kW = customers = np.zeros(len(nodes))
+        if os.path.isfile(f"{network}/loadList.csv") or os.path.isfile(f"{network}/DSS/Loads.dss"):
+            loads = readLoads(network, nodes)
+            connected = loads["node"].values >= 0
+            kW = np.bincount(loads["node"].values[connected], weights=loads["kW"].values[connected], minlength=len(nodes))
+            customers = np.bincount(loads["node"].values[connected], minlength=len(nodes)).astype(float)
+        self.networks[network] = {"nodes": nodes, "edges": edges, "kW": kW, "customers": customers}
+        self.model(network, {})
+
+    def model(self, network, overrides):
+        """
+        Returns the prepared model of a network for a set of parameter overrides.
+
+        Args:
+            network (str): Name of a loaded network.
+            overrides (dict): Parameters replacing the base parameters.
+
+        Returns:
+            model (dict): Output of prepareOutageModel.
+        """
+        from util.pipeline import prepareOutageModel
+
+        if network not in self.networks:
+            raise KeyError(f"Unknown network {network}, loaded networks are {list(self.networks)}")
+        params = {**self.params, **overrides}
+        key = json.dumps([network, params], sort_keys=True)
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key]
+        model = prepareOutageModel(self.networks[network]["nodes"], self.networks[network]["edges"], params)
+        with self.lock:
+            self.models[key] = model
+            if len(self.models) > MODEL_CACHE_SIZE:
+                self.models.popitem(last=False)
+        return model
+
+    def eventImpact(self, network, eventName, params):
+        # Weather impact files of an event, read again only when they change
+        from util.pipeline import readWeatherImpact
+
+        impacts = []
+        for component, features in [("nodes", params["nodeFeatures"]), ("edges", params["edgeFeatures"])]:
+            path = f"{network}/WI/{component}/{eventName}"
+            stamp = (os.path.getmtime(path), tuple(features))
+            with self.lock:
+                cached = self.impacts.get(path)
+                if cached is not None:
+                    self.impacts.move_to_end(path)
+            if cached is None or cached[0] != stamp:
+                cached = (stamp, readWeatherImpact(path, features))
+                with self.lock:
+                    self.impacts[path] = cached
+                    self.impacts.move_to_end(path)
+                    if len(self.impacts) > MODEL_CACHE_SIZE:
+                        self.impacts.popitem(last=False)
+            impacts.append(cached[1])
+        return impacts
+
+    def weatherImpact(self, network, request, params):
+        """
+        Finds the weather impact of a request, given as an event, as weather impact arrays or as weather series.
+
+        Args:
+            network (str): Name of a loaded network.
+            request (dict): The request, with one of the keys
+                - event (str): Name of an event file in {network}/WI/nodes and {network}/WI/edges.
+                - wiNodes, wiEdges (Dict[str, list]): Low and high weather impact of every component for each feature.
+                - weather (Dict[str, list]): Hourly {hazard}Nodes and {hazard}Edges of every component for every hazard
+                  of the parameters (e.g. rainNodes, windNodes, rainEdges and windEdges). The edges are derived
+                  from the nodes when they are missing.
+            params (dict): Parameters of the request.
+
+        Returns:
+            wiNodes (Dict[str, np.ndarray]), wiEdges (Dict[str, np.ndarray]): Weather impact on the nodes and edges.
+        """
+        from util.chunked import weatherImpactArrays
+        from util.hazards import DEFAULT_HAZARDS, alphaMatrix, hazardLevels
+
+        if "wiNodes" in request:
+            return ({feature: np.asarray(request["wiNodes"][feature], dtype=float) for feature in params["nodeFeatures"]},
+                    {feature: np.asarray(request["wiEdges"][feature], dtype=float) for feature in params["edgeFeatures"]})
+        if "weather" in request:
+            weather = {name: np.asarray(values, dtype=float) for name, values in request["weather"].items()}
+            hazards = params.get("hazards", DEFAULT_HAZARDS)
+            missing = [f"{hazard}Nodes" for hazard in hazards if f"{hazard}Nodes" not in weather]
+            if missing:
+                raise ValueError(f"The weather of the request is missing {missing}")
+            if any(f"{hazard}Edges" not in weather for hazard in hazards):
+                from util.pipeline import edgeWeather
+                edges = self.networks[network]["edges"]
+                source, target = edges["source"].values.astype(int), edges["target"].values.astype(int)
+                for hazard in hazards:
+                    weather.setdefault(f"{hazard}Edges", edgeWeather(weather[f"{hazard}Nodes"], source, target))
+            severityLevels = hazardLevels(params, hazards)
+            return tuple(weatherImpactArrays([weather[f"{hazard}{component}"] for hazard in hazards], features, alphaMatrix(params, features, hazards), severityLevels)
+                         for component, features in [("Nodes", params["nodeFeatures"]), ("Edges", params["edgeFeatures"])])
+        return self.eventImpact(network, request.get("event", "weatherEvent1.csv"), params)
+
+    def aggregates(self, network, prob):
+        """
+        Summarizes the probability of an outage of every node.
+
+        Args:
+            network (str): Name of a loaded network.
+            prob (np.ndarray): Low and high probability of an outage of every node, shape (nodes, 2).
+
+        Returns:
+            Dict[str, float or List[float]]: Mean and max probability, expected number of nodes out, and
+            the low, high and mean expected load and number of loads interrupted.
+        """
+        data = self.networks[network]
+        bounds = np.column_stack([prob, prob.mean(axis=1)])
+        return {
+            "meanProb": float(bounds[:, 2].mean()),
+            "maxProb": float(prob[:, 1].max()),
+            "expectedNodesOut": float(bounds[:, 2].sum()),
+            "expectedKW": (data["kW"] @ bounds).tolist(),
+            "expectedCustomers": (data["customers"] @ bounds).tolist(),
+        }
+
+    def evaluate(self, requests):
+        """
+        Evaluates a batch of requests. Requests for the same network and parameters are stacked and
+        evaluated in a single pass through the fragility tables and the network.
+
+        Args:
+            requests (List[dict]): Requests with the keys network (optional when one network is loaded),
+                params (parameter overrides) and the weather impact keys of weatherImpact.
+
+        Returns:
+            List[dict]: For every request, the network, the probabilities prob, probNodes and probEdges, and the aggregates.
+        """
+        from util.pipeline import evaluateOutageModel
+
+        groups = OrderedDict()
+        for i, request in enumerate(requests):
+            network = request.get("network") or next(iter(self.networks))
+            overrides = request.get("params", {})
+            groups.setdefault(json.dumps([network, overrides], sort_keys=True), (network, overrides, []))[2].append(i)
+
+        results = [None] * len(requests)
+        for network, overrides, indices in groups.values():
+            model = self.model(network, overrides)
+            params = model["params"]
+            impacts = [self.weatherImpact(network, requests[i], params) for i in indices]
+            # Stack the requests along a trailing axis: (components, 2, requests)
+            wiNodes = {feature: np.stack([impact[0][feature] for impact in impacts], axis=-1) for feature in params["nodeFeatures"]}
+            wiEdges = {feature: np.stack([impact[1][feature] for impact in impacts], axis=-1) for feature in params["edgeFeatures"]}
+            output = evaluateOutageModel(model, wiNodes, wiEdges)
+            for k, i in enumerate(indices):
+                prob = output["prob"][..., k]
+                results[i] = {"network": network, "prob": prob, "probNodes": output["probNodes"][..., k], "probEdges": output["probEdges"][..., k],
+                              "aggregates": self.aggregates(network, prob)}
+        return results
+
+# Arrays of a result that a request can include
+RESULT_ARRAYS = ["prob", "probNodes", "probEdges"]
+
+def encodeResult(result, include):
+    # JSON friendly version of a result with the requested arrays
+    encoded = {"network": result["network"], "aggregates": result["aggregates"]}
+    for name in include:
+        encoded[name] = np.where(np.isnan(result[name]), None, result[name]).tolist()
+    return encoded
+
+# Request Handler Class answering the requests of the service
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Send the headers and body of a response together, without waiting for the client to acknowledge
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) and self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send(self, status, body, contentType="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendJSON(self, status, value):
+        self.send(status, json.dumps(value).encode())
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self.sendJSON(200, {"status": "ok", "pid": os.getpid(), "networks": list(service.networks)})
+        else:
+            self.sendJSON(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path not in ["/outage", "/batch"]:
+                self.sendJSON(404, {"error": f"Unknown path {self.path}"})
+                return
+            # Malformed requests are answered before anything is evaluated
+            if not isinstance(body, dict):
+                raise TypeError("The body must be a JSON object")
+            requests = [body] if self.path == "/outage" else body["requests"]
+            if not isinstance(requests, list) or not all(isinstance(request, dict) for request in requests):
+                raise TypeError("requests must be a list of JSON objects")
+            include = body.get("include", ["prob"])
+            if not isinstance(include, list) or not include or not set(include) <= set(RESULT_ARRAYS):
+                raise ValueError(f"include must be a non empty list of {RESULT_ARRAYS}")
+            results = service.evaluate(requests)
+        except (KeyError, ValueError, TypeError, FileNotFoundError) as error:
+            self.sendJSON(400, {"error": repr(error)})
+            return
+
+        binary = body.get("format") == "binary" or self.headers.get("Accept") == "application/octet-stream"
+        if binary:
+            # Little endian float64 array of the first included result, shape (requests, components, 2)
+            array = np.stack([result[include[0]] for result in results]).astype("<f8")
+            self.send(200, array.tobytes(), "application/octet-stream", {"X-Shape": ",".join(map(str, array.shape))})
+        elif self.path == "/outage":
+            self.sendJSON(200, encodeResult(results[0], include))
+        else:
+            self.sendJSON(200, {"results": [encodeResult(result, include) for result in results]})
+
+# Threaded HTTP server on a Unix socket
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def createServers(service, host="127.0.0.1", port=8765, socketPath=None, verbose=False):
+    """
+    Creates the listening servers of the service.
+
+    Args:
+        service (OutageService): The service.
+        host (str): Interface of the HTTP server.
+        port (int or None): Port of the HTTP server, no HTTP server when None.
+        socketPath (str or None): Path of the Unix socket, no Unix socket when None.
+        verbose (bool): Log every request.
+
+    Returns:
+        List[socketserver.BaseServer]: The servers, already bound.
+    """
+    servers = []
+    if port is not None:
+        servers.append(ThreadingHTTPServer((host, port), ServiceHandler))
+    if socketPath is not None:
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        servers.append(ThreadingUnixHTTPServer(socketPath, ServiceHandler))
+    for server in servers:
+        server.service = service
+        server.verbose = verbose
+    return servers
+
+def stopServing(signum, frame):
+    raise KeyboardInterrupt
+
+def serve(networks, params=None, host="127.0.0.1", port=8765, socketPath=None, workers=None, verbose=False):
+    """
+    Loads the networks and serves requests until interrupted. The sockets are bound and the networks
+    loaded before forking the workers, so the workers share the loaded data and accept connections
+    from the same sockets.
+
+    Args:
+        networks (List[str]): Folder names of the networks to load.
+        params (dict or None): Base pipeline parameters, defaults to defaultParameters().
+        host (str): Interface of the HTTP server.
+        port (int or None): Port of the HTTP server, no HTTP server when None.
+        socketPath (str or None): Path of the Unix socket.
+        workers (int or None): Number of worker processes, defaults to the number of cores.
+        verbose (bool): Log every request.
+    """
+    service = OutageService(networks, params)
+    servers = createServers(service, host, port, socketPath, verbose)
+    try:
+        from threadpoolctl import threadpool_limits
+        # numpy may have been imported before this module set the number of threads
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+    workers = workers or os.cpu_count() or 1
+    children = []
+    isParent = True
+    if hasattr(os, "fork"):
+        for _ in range(workers - 1):
+            pid = os.fork()
+            if pid == 0:
+                isParent = False
+                children = []
+                break
+            children.append(pid)
+
+    threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    if isParent:
+        # Stop the workers and clean up on SIGTERM as on Ctrl+C
+        signal.signal(signal.SIGTERM, stopServing)
+        print(f"Serving {list(service.networks)} with {len(children) + 1} workers")
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.server_close()
+        # The parent stops the workers and removes the socket
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        if isParent and socketPath is not None and os.path.exists(socketPath):
+            os.remove(socketPath)
@@ -0,0 +1,99 @@
+import numpy as np
+
+# NumPy arrays published once into shared memory so that the processes of a pool read them
+# without copying. The publishing process owns the blocks and removes them when it closes, and
+# every worker attaches the arrays by the names of their blocks, which are all a task needs to
+# receive besides a few indices. Arrays are attached read-only unless they are outputs the
+# workers fill in.
+
+# Shared Arrays Class owning the shared memory blocks of a set of arrays
+class SharedArrays:
+    def __init__(self):
+        # Shared memory blocks by array name
+        self.blocks = {}
+
+        # Name of the block, dtype and shape of every array, all a worker needs to attach them
+        self.manifest = {}
+
+    def publish(self, name, array):
+        """
+        Copies an array into a new shared memory block.
+
+        Args:
+            name (str): Name of the array.
+            array (np.ndarray): Values of the array.
+
+        Returns:
+            np.ndarray: View of the shared copy.
+        """
+        array = np.ascontiguousarray(array)
+        return self.allocate(name, array.shape, array.dtype, array)
+
+    def allocate(self, name, shape, dtype=np.float64, values=None):
+        """
+        Creates a shared array, e.g. for the results written by the workers.
+
+        Args:
+            name (str): Name of the array.
+            shape (tuple): Shape of the array.
+            dtype (np.dtype): Type of the values.
+            values (np.ndarray or None): Initial values, NaN (or zero for integers) by default.
+
+        Returns:
+            np.ndarray: View of the shared array.
+        """
+        from multiprocessing import shared_memory
+
+        dtype = np.dtype(dtype)
+        # Blocks cannot be empty
+        block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        self.blocks[name] = block
+        self.manifest[name] = (block.name, dtype.str, tuple(int(size) for size in shape))
+        view = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if values is not None:
+            view[...] = values
+        elif dtype.kind == "f":
+            view.fill(np.nan)
+        else:
+            view.fill(0)
+        return view
+
+    def close(self):
+        """
+        Releases and removes the blocks. The views returned by publish and allocate cannot be used afterwards.
+        """
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def attachArrays(manifest, writable=()):
+    """
+    Attaches the arrays of a manifest in a worker, without copying them.
+
+    Args:
+        manifest (Dict[str, tuple]): SharedArrays.manifest of the publishing process.
+        writable (Iterable[str]): Names of the arrays the worker writes to, the others are read-only.
+
+    Returns:
+        arrays (Dict[str, np.ndarray]): Views of the arrays by name.
+        blocks (list): The attached blocks, which must be kept alive as long as the views are used.
+    """
+    from multiprocessing import shared_memory
+
+    writable = set(writable)
+    arrays, blocks = {}, []
+    for name, (blockName, dtype, shape) in manifest.items():
+        # The block was registered by the publishing process, which also removes it
+        block = shared_memory.SharedMemory(name=blockName)
+        blocks.append(block)
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        view.flags.writeable = name in writable
+        arrays[name] = view
+    return arrays, blocks
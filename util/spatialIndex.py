@@ -0,0 +1,167 @@
+import heapq
+import os
+import numpy as np
+
+# Kilometers per degree of latitude, used to project the coordinates onto a local plane
+KM_PER_DEGREE = 111.32
+
+# Indexes already built, keyed by network folder. The geometry of a network does not depend on
+# the event, so the same index answers the queries of every event.
+_indexes = {}
+
+# Spatial Index Class over the node coordinates and edge midpoints of a network
+class SpatialIndex:
+    def __init__(self, lon, lat, source=None, target=None):
+        from scipy.spatial import cKDTree
+
+        # Coordinates of the nodes
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+
+        # Reference latitude of the equirectangular projection
+        self.lat0 = float(np.mean(self.lat)) if len(self.lat) else 0.0
+
+        # KD-tree over the projected nodes
+        self.nodeTree = cKDTree(self.project(self.lon, self.lat))
+
+        # KD-tree over the projected edge midpoints
+        self.edgeTree = None
+        if source is not None:
+            source = np.asarray(source, dtype=np.int64)
+            target = np.asarray(target, dtype=np.int64)
+            self.edgeLon = (self.lon[source] + self.lon[target]) / 2
+            self.edgeLat = (self.lat[source] + self.lat[target]) / 2
+            self.edgeTree = cKDTree(self.project(self.edgeLon, self.edgeLat))
+
+    @classmethod
+    def forNetwork(cls, network):
+        """
+        Returns the spatial index of a network, building it the first time and whenever the node or edge list changes.
+
+        Args:
+            network (str): Folder name corresponding to the network data.
+
+        Returns:
+            SpatialIndex: The index.
+        """
+        import pandas as pd
+        from util.pipeline import nodePositions
+
+        key = os.path.abspath(network)
+        stamp = tuple(os.path.getmtime(f"{network}/{name}.csv") for name in ["nodeList", "edgeList"])
+        if key in _indexes and _indexes[key][0] == stamp:
+            return _indexes[key][1]
+
+        nodes = pd.read_csv(f"{network}/nodeList.csv", usecols=["coords"])
+        edges = pd.read_csv(f"{network}/edgeList.csv", usecols=["source", "target"])
+        coords = np.array(list(nodePositions(nodes).values()), dtype=float).reshape(-1, 2)
+        index = cls(coords[:, 0], coords[:, 1], edges["source"].values, edges["target"].values)
+        _indexes[key] = (stamp, index)
+        return index
+
+    def project(self, lon, lat):
+        """
+        Projects coordinates onto a local plane in kilometers.
+
+        Args:
+            lon (np.ndarray or float): Longitudes.
+            lat (np.ndarray or float): Latitudes.
+
+        Returns:
+            np.ndarray: Projected points, shape (points, 2).
+        """
+        x = np.asarray(lon, dtype=float) * KM_PER_DEGREE * np.cos(np.radians(self.lat0))
+        y = np.asarray(lat, dtype=float) * KM_PER_DEGREE
+        return np.column_stack([np.ravel(x), np.ravel(y)])
+
+    def _select(self, kind):
+        # Tree and coordinates of the nodes or edges
+        if kind == "nodes":
+            return self.nodeTree, self.lon, self.lat
+        if kind == "edges" and self.edgeTree is not None:
+            return self.edgeTree, self.edgeLon, self.edgeLat
+        raise ValueError(f"Unknown kind {kind}, expected 'nodes' or 'edges'")
+
+    def withinBox(self, minLon, minLat, maxLon, maxLat, kind="nodes"):
+        """
+        Finds the nodes or edges (by midpoint) inside a bounding box.
+
+        Args:
+            minLon (float), minLat (float), maxLon (float), maxLat (float): Bounding box.
+            kind (str): "nodes" or "edges".
+
+        Returns:
+            np.ndarray: Sorted indices of the components inside the box.
+        """
+        tree, lon, lat = self._select(kind)
+        # The square circumscribing the box in the projected plane, refined with the exact box
+        corners = self.project([minLon, maxLon], [minLat, maxLat])
+        center = corners.mean(axis=0)
+        radius = np.abs(corners[1] - corners[0]).max() / 2
+        candidates = np.asarray(tree.query_ball_point(center, radius * (1 + 1e-9), p=np.inf), dtype=np.int64)
+        inside = (lon[candidates] >= minLon) & (lon[candidates] <= maxLon) & (lat[candidates] >= minLat) & (lat[candidates] <= maxLat)
+        return np.sort(candidates[inside])
+
+    def withinRadius(self, lon, lat, radiusKm, kind="nodes"):
+        """
+        Finds the nodes or edges (by midpoint) within a distance of a point.
+
+        Args:
+            lon (float), lat (float): The point.
+            radiusKm (float): Distance in kilometers.
+            kind (str): "nodes" or "edges".
+
+        Returns:
+            np.ndarray: Sorted indices of the components within the distance.
+        """
+        tree = self._select(kind)[0]
+        return np.sort(np.asarray(tree.query_ball_point(self.project(lon, lat)[0], radiusKm), dtype=np.int64))
+
+    def nearest(self, lon, lat, k=1, kind="nodes"):
+        """
+        Finds the k nodes or edges (by midpoint) closest to a point.
+
+        Args:
+            lon (float), lat (float): The point.
+            k (int): Number of components to return.
+            kind (str): "nodes" or "edges".
+
+        Returns:
+            indices (np.ndarray): Indices of the closest components, closest first.
+            distances (np.ndarray): Their distance to the point in kilometers.
+        """
+        tree = self._select(kind)[0]
+        k = min(k, tree.n)
+        distances, indices = tree.query(self.project(lon, lat)[0], k=k)
+        return np.atleast_1d(indices), np.atleast_1d(distances)
+
+def topK(values, k, indices=None, weights=None):
+    """
+    Selects the k most at-risk components, optionally weighted (e.g. by load).
+
+    Args:
+        values (np.ndarray): Probability of an outage of every component.
+        k (int): Number of components to return.
+        indices (np.ndarray or None): Candidate components (e.g. the result of a spatial query), every component when None.
+        weights (np.ndarray or None): Weight of every component, the score is values * weights.
+
+    Returns:
+        List[Tuple[int, float]]: (index, score) of the selected components, highest score first.
+    """
+    scores = np.asarray(values, dtype=float)
+    if weights is not None:
+        scores = scores * np.asarray(weights, dtype=float)
+
+    if indices is None:
+        # A partial sort of the whole array, then order the k selected components
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        selected = np.argpartition(-scores, k - 1)[:k]
+        selected = selected[np.argsort(-scores[selected], kind="stable")]
+        return [(int(i), float(scores[i])) for i in selected]
+
+    # Heap selection over the candidates, O(candidates log k)
+    indices = np.asarray(indices, dtype=np.int64)
+    best = heapq.nlargest(k, zip(scores[indices].tolist(), indices.tolist()))
+    return [(i, score) for score, i in best]
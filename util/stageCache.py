@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import shutil
+
+# Content addressed cache of the pipeline stages. The key of a stage is the hash of everything it
+# reads: its input files, the parameters it uses and the source code of the modules it runs. The
+# files a stage writes are stored once in {network}/.cache/objects under the hash of their content,
+# and {network}/.cache/{stage}/{key}.json records which files a key produced. When a stage is run
+# again with the same key, its files are restored from the cache instead of running it.
+
+# Root of the code files, used to hash the code of the stages
+CODE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What every stage reads and writes. Inputs and outputs are relative to the network folder, inputs
+# starting with @ are taken from the options of the run (e.g. @events for the event file) and outputs
+# containing {event} are repeated for every event with a weather impact in WI/nodes.
+STAGE_SPECS = {
+    "import": {
+        "inputs": ["DSS"],
+        "params": [],
+        "code": ["util/pipeline.py", "util/NetworkFunctions.py", "util/ComponentClasses.py", "util/checkpoint.py"],
+        "outputs": ["nodeList.csv", "edgeList.csv", "loadList.csv", "switchList.csv"],
+    },
+    "weather": {
+        "inputs": ["nodeList.csv", "edgeList.csv", "@events"],
+        "params": ["hazards"],
+        "code": ["util/pipeline.py", "util/NetworkFunctions.py", "util/checkpoint.py", "util/hazards.py"],
+        "outputs": ["Rain", "Wind", "Ice", "Heat", "Stats"],
+    },
+    "impact": {
+        "inputs": ["Rain", "Wind", "Ice", "Heat", "Stats"],
+        "params": ["nodeFeatures", "edgeFeatures", "alpha", "windSeverityLevels", "rainSeverityLevels", "numOfScenarios",
+                   "hazards", "hazardSeverityLevels"],
+        "code": ["util/pipeline.py", "util/mainHelper.py", "util/streamingStats.py", "util/hazards.py"],
+        "outputs": ["WI"],
+    },
+    "outage": {
+        "inputs": ["nodeList.csv", "edgeList.csv", "loadList.csv", "DSS/Loads.dss", "DSS/LoadShapes.dss", "DSS/profiles", "WI", "Rain/nodes", "Wind/nodes",
+                   "Stats/windows.csv"],
+        "params": ["nodeFeatures", "edgeFeatures", "numOfBins", "meanWI", "stdWI", "correlation", "sources", "reliabilitySamples"],
+        "code": ["util/pipeline.py", "util/mainHelper.py", "util/fragilityTables.py", "util/correlatedFragility.py",
+                 "util/topology.py", "util/reliability.py", "util/loadAtRisk.py"],
+        "outputs": ["Outage/{event}", "Outage/edges/{event}"],
+    },
+}
+
+# Hash Index Class remembering the content hash of files by size and modification time, so
+# unchanged files are not read again
+class HashIndex:
+    def __init__(self, path):
+        # Location of the index
+        self.path = path
+
+        # (size, mtime, hash) of every file by absolute path
+        self.entries = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        self.changed = False
+
+    def fileHash(self, path):
+        """
+        Hashes the content of a file, reusing the stored hash when the file did not change.
+
+        Args:
+            path (str): Path to the file.
+
+        Returns:
+            str: Hex digest of the content.
+        """
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self.changed = True
+        return digest.hexdigest()
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}"
+        with open(temporary, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temporary, self.path)
+        self.changed = False
+
+def listFiles(path):
+    """
+    Lists the files of a file or folder, skipping hidden files and folders.
+
+    Args:
+        path (str): File or folder.
+
+    Returns:
+        List[str]: Sorted paths of the files, empty when the path does not exist.
+    """
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        files.extend(os.path.join(dirpath, name) for name in sorted(filenames) if not name.startswith("."))
+    return files
+
+# Stage Cache Class storing the outputs of the stages of one network
+class StageCache:
+    def __init__(self, network, cacheDir=None):
+        # Folder name corresponding to the network data
+        self.network = network
+
+        # Location of the cache
+        self.cacheDir = cacheDir or os.path.join(network, ".cache")
+
+        # Content hashes of the input and output files
+        self.hashes = HashIndex(os.path.join(self.cacheDir, "hashes.json"))
+
+    def inputPaths(self, stage, options):
+        # Paths of the inputs of a stage by name
+        return {name: options[name[1:]] if name.startswith("@") else os.path.join(self.network, name) for name in STAGE_SPECS[stage]["inputs"]}
+
+    def key(self, stage, params, options):
+        """
+        Computes the key of a stage from its inputs, parameters and code.
+
+        Args:
+            stage (str): Name of the stage.
+            params (dict): Pipeline parameters.
+            options (dict): Options of the run (e.g. events).
+
+        Returns:
+            str: Hex digest identifying the outputs of the stage.
+        """
+        spec = STAGE_SPECS[stage]
+        inputs = {}
+        for name, path in self.inputPaths(stage, options).items():
+            # Missing optional inputs are part of the key too, as an empty set of files
+            inputs[name] = {os.path.relpath(f, path) if f != path else "": self.hashes.fileHash(f) for f in listFiles(path)}
+        code = {name: self.hashes.fileHash(os.path.join(CODE_ROOT, name)) for name in spec["code"]}
+        used = {name: params.get(name) for name in spec["params"]}
+        return hashlib.sha256(json.dumps([stage, inputs, used, code], sort_keys=True).encode()).hexdigest()
+
+    def outputPaths(self, stage):
+        """
+        Lists the files and folders a stage writes.
+
+        Args:
+            stage (str): Name of the stage.
+
+        Returns:
+            List[str]: Paths of the outputs, with {event} replaced by every event in WI/nodes.
+        """
+        paths = []
+        for name in STAGE_SPECS[stage]["outputs"]:
+            if "{event}" not in name:
+                paths.append(os.path.join(self.network, name))
+                continue
+            from util.pipeline import listEvents
+            folder = os.path.join(self.network, "WI", "nodes")
+            events = listEvents(folder) if os.path.isdir(folder) else []
+            paths.extend(os.path.join(self.network, name.format(event=eventName)) for eventName in events)
+        return paths
+
+    def manifestPath(self, stage, key):
+        return os.path.join(self.cacheDir, stage, f"{key}.json")
+
+    def objectPath(self, digest):
+        return os.path.join(self.cacheDir, "objects", digest[:2], digest)
+
+    def restore(self, stage, key):
+        """
+        Restores the outputs of a stage from the cache.
+
+        Args:
+            stage (str): Name of the stage.
+            key (str): Key of the stage.
+
+        Returns:
+            bool: Whether the outputs were in the cache.
+        """
+        path = self.manifestPath(stage, key)
+        if not os.path.isfile(path):
+            return False
+        with open(path) as f:
+            manifest = json.load(f)
+        if not all(os.path.isfile(self.objectPath(digest)) for digest in manifest["outputs"].values()):
+            return False
+        for name, digest in manifest["outputs"].items():
+            target = os.path.join(self.network, name)
+            # Only the files that differ from the cached ones are copied
+            if os.path.isfile(target) and self.hashes.fileHash(target) == digest:
+                continue
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            shutil.copyfile(self.objectPath(digest), target)
+            self.hashes.fileHash(target)
+        # Files of the outputs left by another key, which the stage would not have written
+        for output in self.outputPaths(stage):
+            for file in listFiles(output):
+                if os.path.relpath(file, self.network) not in manifest["outputs"]:
+                    os.remove(file)
+        self.hashes.save()
+        return True
+
+    def store(self, stage, key):
+        """
+        Stores the outputs of a stage in the cache.
+
+        Args:
+            stage (str): Name of the stage.
+            key (str): Key of the stage.
+        """
+        outputs = {}
+        for output in self.outputPaths(stage):
+            for path in listFiles(output):
+                digest = self.hashes.fileHash(path)
+                objectPath = self.objectPath(digest)
+                if not os.path.isfile(objectPath):
+                    os.makedirs(os.path.dirname(objectPath), exist_ok=True)
+                    temporary = f"{objectPath}.{os.getpid()}"
+                    shutil.copyfile(path, temporary)
+                    os.replace(temporary, objectPath)
+                outputs[os.path.relpath(path, self.network)] = digest
+
+        path = self.manifestPath(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{os.getpid()}"
+        with open(temporary, "w") as f:
+            json.dump({"stage": stage, "key": key, "outputs": outputs}, f, indent=1)
+        # The manifest is written last, so a key is only present once all of its files are stored
+        os.replace(temporary, path)
+        self.hashes.save()
+
+def runCached(network, stages, params=None, events="32123.xlsx", force=False):
+    """
+    Runs stages of the pipeline for a network, skipping the stages whose inputs, parameters and code
+    did not change since they last produced their outputs.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        stages (List[str]): Stages to run, in the order of STAGE_SPECS.
+        params (dict or None): Pipeline parameters, defaults to defaultParameters().
+        events (str): Excel file of the weather events used by the weather stage.
+        force (bool): Run every stage even when its outputs are cached.
+
+    Returns:
+        List[dict]: Stage, key and whether it was "cached" or "ran", for every stage.
+    """
+    from util.pipeline import defaultParameters
+    from util.feederRunner import runStage
+
+    params = params or defaultParameters()
+    options = {"params": params, "events": events}
+    cache = StageCache(network)
+    status = []
+    for stage in [stage for stage in STAGE_SPECS if stage in stages]:
+        # The key is computed after the previous stages ran, since their outputs are its inputs
+        key = cache.key(stage, params, options)
+        if not force and cache.restore(stage, key):
+            status.append({"stage": stage, "key": key, "status": "cached"})
+            continue
+        runStage(network, stage, options)
+        cache.store(stage, key)
+        status.append({"stage": stage, "key": key, "status": "ran"})
+    return status
@@ -0,0 +1,313 @@
+import os
+import numpy as np
+
+# One pass statistics of the weather of every component. The weather is consumed in blocks of time
+# and only running values are kept for every component: min, max, sum, hours above thresholds and
+# the largest accumulation over rolling windows (with the last few samples carried over between
+# blocks). The memory used depends on the number of components, not on the length of the event,
+# and the min and max feed the weather impact stage directly.
+
+# Thresholds of the hours above which a variable is counted (rain in kg/m^2 per hour, wind in mph)
+DEFAULT_THRESHOLDS = {"rain": [2.5], "wind": [40.0]}
+
+# Length in samples of the rolling windows whose largest accumulation is kept (e.g. 3 hour rain)
+DEFAULT_WINDOWS = {"rain": [3], "wind": []}
+
+# Streaming Reducer Class keeping running statistics of one variable for every component
+class StreamingReducer:
+    def __init__(self, numComponents, thresholds=(), windows=(), step=1.0):
+        # Thresholds of the exceedance hours and lengths of the rolling windows
+        self.thresholds = list(thresholds)
+        self.windows = [int(w) for w in windows]
+
+        # Hours covered by every sample (e.g. 0.25 for 15 minute data)
+        self.step = step
+
+        self.min = np.full(numComponents, np.inf)
+        self.max = np.full(numComponents, -np.inf)
+        self.total = np.zeros(numComponents)
+        self.count = np.zeros(numComponents, dtype=np.int64)
+        self.samples = 0
+        self.above = np.zeros((numComponents, len(self.thresholds)))
+        self.windowMax = np.full((numComponents, len(self.windows)), -np.inf)
+        # Last (window - 1) samples of every window, the start of the windows ending in the next block
+        self.carry = [np.zeros((numComponents, 0)) for _ in self.windows]
+
+    def update(self, block):
+        """
+        Adds a block of samples.
+
+        Args:
+            block (np.ndarray): Values of every component (rows) for consecutive samples (columns). Missing values are NaN.
+        """
+        block = np.asarray(block, dtype=float)
+        if block.shape[1] == 0:
+            return
+        # fmin and fmax skip missing values like pandas
+        self.min = np.fmin(self.min, np.fmin.reduce(block, axis=1))
+        self.max = np.fmax(self.max, np.fmax.reduce(block, axis=1))
+        valid = ~np.isnan(block)
+        filled = np.where(valid, block, 0.0)
+        self.total += filled.sum(axis=1)
+        self.count += valid.sum(axis=1)
+        self.samples += block.shape[1]
+        for k, threshold in enumerate(self.thresholds):
+            self.above[:, k] += (block > threshold).sum(axis=1) * self.step
+
+        for k, window in enumerate(self.windows):
+            values = np.concatenate([self.carry[k], filled], axis=1)
+            if values.shape[1] >= window:
+                cumulative = np.concatenate([np.zeros((len(values), 1)), np.cumsum(values, axis=1)], axis=1)
+                self.windowMax[:, k] = np.fmax(self.windowMax[:, k], (cumulative[:, window:] - cumulative[:, :-window]).max(axis=1))
+            self.carry[k] = values[:, values.shape[1] - min(window - 1, values.shape[1]):]
+
+    def result(self, prefix):
+        """
+        Returns the statistics.
+
+        Args:
+            prefix (str): Name of the variable, used as the prefix of the columns.
+
+        Returns:
+            Dict[str, np.ndarray]: {prefix}Min, {prefix}Max, {prefix}Mean, {prefix}Above{threshold} (hours) and
+                {prefix}Max{window} (largest sum over the window, or the sum of the event when it is shorter).
+        """
+        empty = self.count == 0
+        stats = {
+            f"{prefix}Min": np.where(empty, np.nan, self.min),
+            f"{prefix}Max": np.where(empty, np.nan, self.max),
+            f"{prefix}Mean": np.where(empty, np.nan, self.total / np.maximum(self.count, 1)),
+        }
+        for k, threshold in enumerate(self.thresholds):
+            stats[f"{prefix}Above{threshold:g}"] = self.above[:, k]
+        for k, window in enumerate(self.windows):
+            stats[f"{prefix}Max{window}"] = self.windowMax[:, k] if self.samples >= window else self.total
+        return stats
+
+def reduceWeather(rainBlocks, windBlocks, numComponents, thresholds=None, windows=None, step=1.0):
+    """
+    Reduces the rain and wind of components given as blocks of time.
+
+    Args:
+        rainBlocks (Iterable[np.ndarray]), windBlocks (Iterable[np.ndarray]): Blocks of shape (components, samples).
+        numComponents (int): Number of components.
+        thresholds (Dict[str, List[float]] or None): Exceedance thresholds of rain and wind, DEFAULT_THRESHOLDS by default.
+        windows (Dict[str, List[int]] or None): Rolling windows of rain and wind, DEFAULT_WINDOWS by default.
+        step (float): Hours covered by every sample.
+
+    Returns:
+        pd.DataFrame: One row per component and one column per statistic (see StreamingReducer.result).
+    """
+    import pandas as pd
+
+    thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+    windows = DEFAULT_WINDOWS if windows is None else windows
+    reducers = {name: StreamingReducer(numComponents, thresholds.get(name, []), windows.get(name, []), step) for name in ["rain", "wind"]}
+    for rain, wind in zip(rainBlocks, windBlocks):
+        reducers["rain"].update(rain)
+        reducers["wind"].update(wind)
+    return pd.DataFrame({**reducers["rain"].result("rain"), **reducers["wind"].result("wind")})
+
+def reduceWeatherFile(path, prefix, thresholds=None, windows=None, chunkSize=10000):
+    """
+    Reduces one weather CSV written by the collection stage, reading blocks of components.
+
+    Args:
+        path (str): Weather CSV of an event (e.g. the rain of the nodes).
+        prefix (str): Name of the variable (e.g. rain), used for its thresholds, windows and columns.
+        thresholds (dict or None), windows (dict or None): See reduceWeather.
+        chunkSize (int): Number of components read at a time.
+
+    Returns:
+        pd.DataFrame: One row per component and one column per statistic (see StreamingReducer.result).
+    """
+    import pandas as pd
+
+    thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+    windows = DEFAULT_WINDOWS if windows is None else windows
+    frames = []
+    for block in pd.read_csv(path, chunksize=chunkSize):
+        block = block.drop(columns=[column for column in block.columns if column.startswith("Unnamed")])
+        reducer = StreamingReducer(len(block), thresholds.get(prefix, []), windows.get(prefix, []))
+        reducer.update(block.values)
+        frames.append(pd.DataFrame(reducer.result(prefix)))
+    return pd.concat(frames, ignore_index=True)
+
+def reduceWeatherFiles(rainPath, windPath, thresholds=None, windows=None, chunkSize=10000):
+    """
+    Reduces the rain and wind CSVs of an event, reading blocks of components.
+
+    Args:
+        rainPath (str), windPath (str): Rain and wind CSVs of an event.
+        thresholds (dict or None), windows (dict or None): See reduceWeather.
+        chunkSize (int): Number of components read at a time.
+
+    Returns:
+        pd.DataFrame: See reduceWeather.
+    """
+    import pandas as pd
+
+    return pd.concat([reduceWeatherFile(rainPath, "rain", thresholds, windows, chunkSize),
+                      reduceWeatherFile(windPath, "wind", thresholds, windows, chunkSize)], axis=1)
+
+def weatherMemmap(path, target, chunkSize=10000):
+    """
+    Copies a weather CSV to a binary file one block of components at a time and maps it, so that the
+    weather of any component can be gathered without holding the series of the event in memory.
+
+    Args:
+        path (str): Weather CSV of an event (e.g. the rain of the nodes).
+        target (str): Binary file written, e.g. in a temporary directory.
+        chunkSize (int): Number of components read at a time.
+
+    Returns:
+        np.memmap: Read-only weather of every component (rows) for every hour (columns).
+    """
+    import pandas as pd
+
+    hours = 0
+    with open(target, "wb") as f:
+        for block in pd.read_csv(path, chunksize=chunkSize):
+            block = block.drop(columns=[column for column in block.columns if column.startswith("Unnamed")])
+            hours = block.shape[1]
+            np.ascontiguousarray(block.values, dtype=np.float64).tofile(f)
+    if os.path.getsize(target) == 0:
+        return np.zeros((0, hours))
+    return np.memmap(target, dtype=np.float64, mode="r").reshape(-1, hours)
+
+def reduceNodeAndEdgeWeather(values, source, target, prefix, thresholds=None, windows=None, chunkHours=24):
+    """
+    Reduces the weather of the nodes and of the edges (the average of their two nodes, as in
+    collectEdgeWeather) from the series of the nodes, one block of hours at a time, without
+    holding or writing the series of the edges.
+
+    Args:
+        values (np.ndarray): Weather of every node (rows) for every hour (columns), e.g. from weatherMemmap.
+        source (np.ndarray), target (np.ndarray): End nodes of every edge.
+        prefix (str): Name of the variable (e.g. rain), used for its thresholds, windows and columns.
+        thresholds (dict or None), windows (dict or None): See reduceWeather.
+        chunkHours (int): Number of hours of the edges derived at a time.
+
+    Returns:
+        nodeStats (pd.DataFrame), edgeStats (pd.DataFrame): See reduceWeather.
+    """
+    import pandas as pd
+    from util.pipeline import edgeWeather
+
+    thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+    windows = DEFAULT_WINDOWS if windows is None else windows
+    nodes = StreamingReducer(len(values), thresholds.get(prefix, []), windows.get(prefix, []))
+    edges = StreamingReducer(len(source), thresholds.get(prefix, []), windows.get(prefix, []))
+    for start in range(0, values.shape[1], chunkHours):
+        block = np.asarray(values[:, start:start + chunkHours], dtype=float)
+        nodes.update(block)
+        edges.update(edgeWeather(block, source, target))
+    return pd.DataFrame(nodes.result(prefix)), pd.DataFrame(edges.result(prefix))
+
+def reduceGriddedEvent(ds, lon, lat, source, target, begin, end, method="bilinear", rainScale=1.0, chunkHours=24, thresholds=None, windows=None, hazards=None):
+    """
+    Samples the weather of every node from a grid one block of hours at a time and reduces the weather
+    of the nodes and edges (the average of their two nodes) without holding the series of the event.
+
+    Args:
+        ds (xr.Dataset): Dataset from openGrid.
+        lon (np.ndarray), lat (np.ndarray): Coordinates of the nodes.
+        source (np.ndarray), target (np.ndarray): End nodes of every edge.
+        begin (pd.Timestamp), end (pd.Timestamp): First and last hour of the event.
+        method (str): "bilinear" or "nearest".
+        rainScale (float): Factor converting the precipitation of the grid to kg/m^2 per hour.
+        chunkHours (int): Number of hours read at a time.
+        thresholds (dict or None), windows (dict or None): See reduceWeather.
+        hazards (List[str] or None): Hazards to reduce besides the rain and wind (see util/hazards.py).
+
+    Returns:
+        nodeStats (pd.DataFrame), edgeStats (pd.DataFrame): See reduceWeather, with the columns of every hazard.
+    """
+    import pandas as pd
+    from util.gridWeather import readWindow, interpolate
+    from util.hazards import hazardSeries, hazardVariables
+    from util.pipeline import edgeWeather
+
+    bbox = (np.min(lon), np.min(lat), np.max(lon), np.max(lat))
+    hazards = ["rain", "wind"] + [hazard for hazard in hazards or [] if hazard not in ["rain", "wind"]]
+    variables = hazardVariables(hazards)
+
+    def blocks():
+        start = begin
+        while start <= end:
+            stop = min(start + pd.Timedelta(hours=chunkHours - 1), end)
+            grids, gridLon, gridLat, _ = readWindow(ds, variables, bbox, start, stop)
+            values = {name: interpolate(grid, gridLon, gridLat, lon, lat, method) for name, grid in grids.items()}
+            if "prcp" in values:
+                values["prcp"] = values["prcp"] * rainScale
+            yield hazardSeries(values, hazards)
+            start = stop + pd.Timedelta(hours=1)
+
+    thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+    windows = DEFAULT_WINDOWS if windows is None else windows
+    nodes = {name: StreamingReducer(len(lon), thresholds.get(name, []), windows.get(name, [])) for name in hazards}
+    edges = {name: StreamingReducer(len(source), thresholds.get(name, []), windows.get(name, [])) for name in hazards}
+    for series in blocks():
+        for name, values in series.items():
+            nodes[name].update(values)
+            # The weather of an edge is the average of its two nodes, as in collectEdgeWeather
+            edges[name].update(edgeWeather(values, source, target))
+    nodeStats = pd.DataFrame({column: values for name in hazards for column, values in nodes[name].result(name).items()})
+    edgeStats = pd.DataFrame({column: values for name in hazards for column, values in edges[name].result(name).items()})
+    return nodeStats, edgeStats
+
+def weatherStatsPath(network, eventName, component="nodes"):
+    return f"{network}/Stats/{component}/{eventName}"
+
+def weatherWindowsPath(network):
+    return f"{network}/Stats/windows.csv"
+
+def collectGriddedStats(network, gridPath, eventFile="32123.xlsx", method="bilinear", rainScale=1.0, chunkHours=24, hazards=None):
+    """
+    Streaming version of collectGriddedWeather followed by collectEdgeWeather: saves the statistics of
+    the weather of every node and edge for every event to {network}/Stats/nodes and {network}/Stats/edges,
+    without writing or holding the hourly series. The impact stage reads them when the series are missing.
+    The first and last hour of every event are saved to {network}/Stats/windows.csv for the load at risk.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        gridPath (str): Path to the gridded weather file.
+        eventFile (str): Excel file of the weather events.
+        method (str): "bilinear" or "nearest".
+        rainScale (float): Factor converting the precipitation of the grid to kg/m^2 per hour.
+        chunkHours (int): Number of hours read at a time.
+        hazards (List[str] or None): Hazards to reduce besides the rain and wind.
+
+    Returns:
+        fileNames (List[str]): Names of the files that were written.
+    """
+    import pandas as pd
+    from util.gridWeather import openGrid
+    from util.pipeline import eventWindow, nodePositions
+
+    nodes = pd.read_csv(f"{network}/nodeList.csv", usecols=["coords"])
+    coords = np.array(list(nodePositions(nodes).values()), dtype=float)
+    edges = pd.read_csv(f"{network}/edgeList.csv", usecols=["source", "target"])
+    weatherEvents = pd.read_excel(eventFile)
+
+    os.makedirs(f"{network}/Stats/nodes", exist_ok=True)
+    os.makedirs(f"{network}/Stats/edges", exist_ok=True)
+    fileNames = []
+    windows = {}
+    with openGrid(gridPath) as ds:
+        for j in weatherEvents.index:
+            begin, end = [pd.Timestamp(pd.to_datetime(value, format="%Y-%m-%d %H%M"), tz="UTC") for value in eventWindow(weatherEvents, j)]
+            nodeStats, edgeStats = reduceGriddedEvent(ds, coords[:, 0], coords[:, 1], edges["source"].values, edges["target"].values,
+                                                      begin, end, method, rainScale, chunkHours, hazards=hazards)
+            name = f"weatherEvent{j+1}.csv"
+            pd.DataFrame.to_csv(nodeStats, weatherStatsPath(network, name, "nodes"))
+            pd.DataFrame.to_csv(edgeStats, weatherStatsPath(network, name, "edges"))
+            fileNames.append(name)
+            windows[name] = {"begin": begin, "end": end}
+
+    # Windows of the events collected before are kept
+    path = weatherWindowsPath(network)
+    previous = pd.read_csv(path, index_col=0) if os.path.isfile(path) else pd.DataFrame(columns=["begin", "end"])
+    previous = previous.drop(index=[name for name in windows if name in previous.index])
+    pd.DataFrame.to_csv(pd.concat([previous, pd.DataFrame.from_dict(windows, orient="index")]), path)
+    return fileNames
@@ -0,0 +1,233 @@
+import numpy as np
+
+# What-if evaluation of switching configurations. The fragility of every component only depends on
+# the weather and the component itself, so it is computed once per event for the edges in service
+# and for the open lines of {network}/switchList.csv, and every candidate configuration (a set of
+# lines opened and closed) only changes which edges connect the nodes to the substation. The tree
+# of a configuration is rebuilt ignoring the direction of the edges (power may flow the other way
+# after a transfer), and when it is radial the probabilities are propagated again only through the
+# subtrees of the nodes whose path to the substation changed. Configurations with loops fall back
+# to the connectivity model of util/reliability.py, still with the same fragility results.
+
+def loadSwitches(network):
+    """
+    Reads the lines that are open in the circuit, written by importNetwork.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+
+    Returns:
+        pd.DataFrame: Open lines with the columns of the edge list, empty when the network has none.
+    """
+    import os
+    import pandas as pd
+
+    if os.path.isfile(f"{network}/switchList.csv"):
+        return pd.read_csv(f"{network}/switchList.csv", index_col=0)
+    return pd.DataFrame(columns=["source", "target", "name", "vegetation", "length"])
+
+def configurationTopology(source, target, enabled, numNodes, roots=(0,)):
+    """
+    Builds the breadth first tree of the edges in service of a configuration, in either direction.
+
+    Args:
+        source (np.ndarray), target (np.ndarray): End nodes of every edge that can be switched.
+        enabled (np.ndarray): Whether every edge is in service.
+        numNodes (int): Number of nodes in the network.
+        roots (Iterable[int]): Source nodes (substations).
+
+    Returns:
+        topology (Topology): The tree, with the indices of the edges in source and target.
+        radial (bool): Whether the edges in service reaching the roots form a tree. The lines between
+            nodes cut off from the roots do not matter, those nodes are out anyway.
+    """
+    from util.topology import Topology
+
+    ids = np.nonzero(enabled)[0]
+    ends = np.concatenate([source[ids], target[ids]]), np.concatenate([target[ids], source[ids]])
+    tree = Topology.fromEdges(*ends, numNodes, roots)
+    # Both directions of an edge map back to its index
+    parentEdge = np.where(tree.parentEdge >= 0, ids[tree.parentEdge % max(len(ids), 1)], -1)
+    reached = np.zeros(numNodes, dtype=bool)
+    reached[tree.order] = True
+    radial = np.count_nonzero(reached[source[ids]]) == len(tree.order) - len(np.unique(np.asarray(roots)))
+    return Topology(numNodes, tree.parent, parentEdge, tree.order, tree.levelStarts), radial
+
+def switchWeatherImpact(network, eventName, params, switches):
+    """
+    Weather impact of the open lines, which computeWeatherImpact does not score. Their weather is
+    derived from the series of their end nodes like the other edges. When only the statistics of the
+    nodes were collected, the min and max of a line are bounded by the average of the min and max of
+    its end nodes.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        params (dict): Pipeline parameters.
+        switches (pd.DataFrame): Open lines from loadSwitches.
+
+    Returns:
+        Dict[str, np.ndarray]: Low and high weather impact of every open line for each edge feature, shape (lines, 2).
+    """
+    import os
+    import pandas as pd
+    from util.hazards import DEFAULT_HAZARDS, alphaMatrix, hazardExtremes, hazardFolder, hazardLevels, weatherImpactMatrix
+    from util.streamingStats import weatherStatsPath
+
+    hazards = params.get("hazards", DEFAULT_HAZARDS)
+    features = params["edgeFeatures"]
+    severityLevels = hazardLevels(params, hazards)
+    source, target = switches["source"].values, switches["target"].values
+    statsPath = weatherStatsPath(network, eventName, "nodes")
+    stats = pd.read_csv(statsPath, index_col=0) if os.path.isfile(statsPath) else None
+    mins, maxs = [], []
+    for hazard in hazards:
+        if os.path.isfile(f"{network}/{hazardFolder(hazard)}/nodes/{eventName}"):
+            low, high = hazardExtremes(network, eventName, [hazard], source, target)["edges"]
+            mins.append(low[0])
+            maxs.append(high[0])
+        elif stats is not None and f"{hazard}Min" in stats:
+            low, high = stats[f"{hazard}Min"].values, stats[f"{hazard}Max"].values
+            mins.append((low[source] + low[target]) / 2)
+            maxs.append((high[source] + high[target]) / 2)
+        else:
+            # The series or statistics of the edges in service do not cover the open lines
+            raise ValueError(f"The weather of the open lines is derived from the nodes, but neither the series nor the "
+                             f"statistics of the {hazard} of the nodes were collected for {eventName}")
+    events = weatherImpactMatrix(alphaMatrix(params, features, hazards), features, np.array(mins), np.array(maxs), severityLevels)
+    return {feature: np.array(events[feature].tolist(), dtype=float).reshape(len(switches), 2) for feature in features}
+
+# Switching Study Class holding the fragility results of an event to score many switching configurations
+class SwitchingStudy:
+    def __init__(self, network, eventName="weatherEvent1.csv", params=None):
+        import pandas as pd
+        from util.correlatedFragility import fragilityProbs
+        from util.loadAtRisk import eventHours, loadShapeEnergy, readLoads, readLoadShapes
+        from util.mainHelper import findLevels
+        from util.pipeline import defaultParameters, evaluateOutageModel, loadNetwork, prepareOutageModel, readWeatherImpact
+
+        self.network = network
+        self.eventName = eventName
+        self.params = params or defaultParameters()
+        self.sources = self.params.get("sources", [0])
+        nodes, edges = loadNetwork(network)
+        switches = loadSwitches(network)
+
+        # Fragility of the nodes and of the edges in service, as computed by the outage command
+        model = prepareOutageModel(nodes, edges, self.params)
+        base = evaluateOutageModel(model, readWeatherImpact(f"{network}/WI/nodes/{eventName}", self.params["nodeFeatures"]),
+                                   readWeatherImpact(f"{network}/WI/edges/{eventName}", self.params["edgeFeatures"]))
+        self.probNodes = base["probNodes"]
+        probEdges = base["probEdges"]
+        if len(switches):
+            # The open lines use the severity levels of the edges in service
+            features = self.params["edgeFeatures"]
+            levels = {feature: findLevels(switches[feature.split()[0]].values, feature, model["forecastedRange"], self.params["numOfBins"]) for feature in features}
+            probSwitches, _ = fragilityProbs(levels, switchWeatherImpact(network, eventName, self.params, switches), features,
+                                             model["meanRange"], model["stdRange"], self.params.get("correlation"))
+            probEdges = np.concatenate([probEdges, probSwitches])
+        self.probEdges = probEdges
+
+        # Every line that can be switched: the edges in service followed by the open lines
+        self.nodes = nodes
+        self.lines = pd.concat([edges, switches], ignore_index=True)
+        self.source = self.lines["source"].values.astype(np.int64)
+        self.target = self.lines["target"].values.astype(np.int64)
+        self.baseEnabled = np.arange(len(self.lines)) < len(edges)
+        self.index = {name: i for i, name in enumerate(self.lines["name"])}
+
+        # Loads and their energy during the event, for the load at risk of every configuration
+        self.loads = readLoads(network, nodes)
+        hours = eventHours(network, eventName)
+        self.hoursPerLoad = None if hours is None else loadShapeEnergy(readLoadShapes(network), self.loads, hours)
+
+        # Base configuration, the reference of the incremental updates when it is radial
+        self.base = self.evaluate()
+
+    def configuration(self, opened=(), closed=()):
+        """
+        Finds the edges in service after switching operations on the base configuration.
+
+        Args:
+            opened (Iterable[str or int]): Names or indices of the lines to open.
+            closed (Iterable[str or int]): Names or indices of the lines to close.
+
+        Returns:
+            np.ndarray: Whether every line is in service.
+        """
+        enabled = self.baseEnabled.copy()
+        for state, lines in [(False, opened), (True, closed)]:
+            for line in lines:
+                i = self.index.get(line, line)
+                if not isinstance(i, (int, np.integer)) or not 0 <= i < len(enabled):
+                    raise ValueError(f"Unknown line {line}")
+                enabled[i] = state
+        return enabled
+
+    def evaluate(self, opened=(), closed=()):
+        """
+        Computes the probability of an outage of every node after switching operations.
+
+        Args:
+            opened (Iterable[str or int]): Names or indices of the lines to open.
+            closed (Iterable[str or int]): Names or indices of the lines to close.
+
+        Returns:
+            results (dict): Dictionary with the following keys
+                - prob (np.ndarray): Low and high probability of an outage of every node, shape (nodes, 2).
+                - probError (np.ndarray or None): Error bound of prob when the configuration has loops.
+                - enabled (np.ndarray): Whether every line is in service.
+                - topology (Topology): Breadth first tree of the configuration.
+                - radial (bool): Whether the configuration is radial.
+                - affected (np.ndarray): Whether the probability of every node was recomputed.
+                - loadAtRisk (Dict[str, List[float]]): Low, high and mean totals of expectedKW, expectedCustomers and eens.
+        """
+        from util.loadAtRisk import computeLoadAtRisk
+
+        enabled = self.configuration(opened, closed)
+        topology, radial = configurationTopology(self.source, self.target, enabled, len(self.nodes), self.sources)
+        reached = np.zeros(len(self.nodes), dtype=bool)
+        reached[topology.order] = True
+
+        probError = None
+        base = getattr(self, "base", None)
+        if radial and base is not None and base["radial"]:
+            # Only the subtrees of the nodes that moved, or were reached or cut off, are propagated again
+            changed = (topology.parent != base["topology"].parent) | (topology.parentEdge != base["topology"].parentEdge)
+            prob, affected = topology.propagateSubtrees(self.probNodes, self.probEdges, base["prob"], changed)
+        elif radial:
+            prob, affected = topology.propagate(self.probNodes, self.probEdges), reached.copy()
+        else:
+            from util.reliability import Reliability
+            reliability = Reliability(len(self.nodes), self.source, self.target, self.sources, enabled)
+            prob, probError = reliability.outage(self.probNodes, self.probEdges, self.params.get("reliabilitySamples", 10000))
+            affected = np.ones(len(self.nodes), dtype=bool)
+        # Nodes without a path to a substation are out
+        prob[~reached] = 1
+
+        _, loadAtRisk = computeLoadAtRisk(topology, prob, self.probNodes, self.probEdges, self.loads, self.hoursPerLoad)
+        return {"prob": prob, "probError": probError, "enabled": enabled, "topology": topology, "radial": radial,
+                "affected": affected, "loadAtRisk": loadAtRisk}
+
+    def compare(self, candidates):
+        """
+        Scores switching configurations against the base configuration.
+
+        Args:
+            candidates (List[dict]): Configurations with the keys name, open and close (lists of line names or indices).
+
+        Returns:
+            pd.DataFrame: One row per configuration, the base first, with the mean probability of an
+                outage of the nodes, the expected kW interrupted, the number of nodes recomputed and the
+                change of the expected kW from the base.
+        """
+        import pandas as pd
+
+        rows = []
+        for name, results in [("base", self.base)] + [(c["name"], self.evaluate(c.get("open", ()), c.get("close", ()))) for c in candidates]:
+            low, high, mean = results["loadAtRisk"]["expectedKW"]
+            rows.append({"configuration": name, "radial": results["radial"], "meanProb": float(results["prob"].mean()),
+                         "expectedKW": mean, "expectedKW low": low, "expectedKW high": high, "recomputedNodes": int(results["affected"].sum())})
+        df = pd.DataFrame(rows)
+        df["deltaKW"] = df["expectedKW"] - df["expectedKW"].iloc[0]
+        return df
@@ -0,0 +1,245 @@
+import os
+import numpy as np
+
+# Precomputed map tiles of the outage results of an event, for map clients that zoom over large
+# territories. The nodes and the edge midpoints are binned into the cells of slippy map tiles (Web
+# Mercator, z/x/y) at the deepest zoom, and every cell holds the number of components, the max and
+# mean probability of an outage, the load and the expected load interrupted (load-weighted risk).
+# The shallower zooms are built bottom-up by merging every 2x2 block of cells into one, so each
+# level only sorts the occupied cells of the level below. Every tile is a small file with the fields
+# of its cells as little endian float32 (and a PNG of the max probability), so reading any zoom is
+# one file read. The values binned last are kept, so a rebuild only rewrites the tiles of the
+# components whose probability, load or position changed.
+
+# Fields of every cell, in the order of the first axis of a tile
+TILE_FIELDS = ["count", "max", "mean", "kW", "expectedKW"]
+
+# Web Mercator does not reach the poles
+MAX_LATITUDE = 85.05112878
+
+def mercatorCells(lon, lat, zoom, tileSize):
+    """
+    Finds the cell of the slippy map pyramid holding every point.
+
+    Args:
+        lon (np.ndarray), lat (np.ndarray): Longitude and latitude of the points.
+        zoom (int): Zoom level.
+        tileSize (int): Number of cells along each side of a tile.
+
+    Returns:
+        x (np.ndarray), y (np.ndarray): Column and row of the cell of every point over the whole world.
+    """
+    n = (1 << zoom) * tileSize
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float), -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lon, dtype=float) + 180) / 360 * n
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+def aggregateCells(x, y, count, total, maximum, kW, risk):
+    """
+    Merges the values of the entries falling in the same cell.
+
+    Args:
+        x (np.ndarray), y (np.ndarray): Cell of every entry.
+        count, total, maximum, kW, risk (np.ndarray): Number of components, sum and max of their
+            probability, sum of their load and of their load times their probability, for every entry.
+
+    Returns:
+        tuple: The same arrays with one entry per occupied cell, sorted by cell.
+    """
+    if len(x) == 0:
+        return (x, y, count, total, maximum, kW, risk)
+    # Sort by x then y so that the entries of every cell are contiguous
+    order = np.lexsort((y, x))
+    x, y = x[order], y[order]
+    starts = np.flatnonzero(np.r_[True, (x[1:] != x[:-1]) | (y[1:] != y[:-1])])
+    values = [np.add.reduceat(count[order], starts), np.add.reduceat(total[order], starts), np.maximum.reduceat(maximum[order], starts),
+              np.add.reduceat(kW[order], starts), np.add.reduceat(risk[order], starts)]
+    return (x[starts], y[starts], *values)
+
+def componentValues(network, eventName, layer):
+    """
+    Reads the position, probability and load of every component from the results of an event.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        layer (str): "nodes" or "edges".
+
+    Returns:
+        lon (np.ndarray), lat (np.ndarray): Position of every node or edge midpoint.
+        prob (np.ndarray): Mean probability of an outage of every component.
+        kW (np.ndarray): Load of every node, or load downstream of every edge, zero when the load at risk was not saved.
+    """
+    import pandas as pd
+    from util.pipeline import outageResultsPath
+    from util.spatialIndex import SpatialIndex
+
+    index = SpatialIndex.forNetwork(network)
+    nodeResults = pd.read_csv(outageResultsPath(network, eventName), index_col=0)
+    if layer == "nodes":
+        kW = nodeResults["kW"].values if "kW" in nodeResults else np.zeros(len(nodeResults))
+        return index.lon, index.lat, nodeResults["mean"].values, kW
+
+    edges = pd.read_csv(f"{network}/edgeList.csv", usecols=["source", "target"])
+    prob = pd.read_csv(outageResultsPath(network, eventName, "edges"), index_col=0)["mean"].values
+    kW = np.zeros(len(edges))
+    if "downstreamKW" in nodeResults:
+        # The downstream end of an edge has the smaller subtree, its load is lost when the edge is out
+        downstream = nodeResults["downstreamKW"].values
+        kW = np.minimum(downstream[edges["source"].values], downstream[edges["target"].values])
+    return index.edgeLon, index.edgeLat, prob, kW
+
+def tilePath(folder, layer, zoom, x, y, extension="bin"):
+    """
+    Returns the path of a tile.
+
+    Args:
+        folder (str): Folder of the pyramid.
+        layer (str): "nodes" or "edges".
+        zoom (int), x (int), y (int): Tile coordinates.
+        extension (str): "bin" for the fields or "png" for the image.
+
+    Returns:
+        str: The path.
+    """
+    return f"{folder}/{layer}/{zoom}/{x}/{y}.{extension}"
+
+def writeTile(folder, layer, zoom, x, y, cells, tileSize, png):
+    """
+    Writes the fields (and image) of a tile, or removes its files when it has no component.
+
+    Args:
+        folder (str): Folder of the pyramid.
+        layer (str): "nodes" or "edges".
+        zoom (int), x (int), y (int): Tile coordinates.
+        cells (tuple or None): Row and column of the occupied cells in the tile followed by the values of TILE_FIELDS.
+        tileSize (int): Number of cells along each side of a tile.
+        png (bool): Also write a PNG of the max probability.
+    """
+    path = tilePath(folder, layer, zoom, x, y)
+    if cells is None:
+        for extension in ["bin", "png"]:
+            if os.path.isfile(tilePath(folder, layer, zoom, x, y, extension)):
+                os.remove(tilePath(folder, layer, zoom, x, y, extension))
+        return
+
+    rows, cols, *values = cells
+    tile = np.zeros((len(TILE_FIELDS), tileSize, tileSize), dtype="<f4")
+    tile[:, rows, cols] = values
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tile.tofile(path)
+
+    if png:
+        from PIL import Image
+        # Same colors as plotTreeWithProb, transparent where there is no component
+        rgba = np.zeros((tileSize, tileSize, 4), dtype=np.uint8)
+        level = np.clip(tile[1], 0, 1)
+        rgba[..., 0] = np.round(level * 255)
+        rgba[..., 1] = np.round((1 - level) * 128)
+        rgba[..., 3] = np.where(tile[0] > 0, 255, 0)
+        Image.fromarray(rgba, "RGBA").save(tilePath(folder, layer, zoom, x, y, "png"))
+
+def buildOutageTiles(network, eventName="weatherEvent1.csv", folder=None, maxZoom=16, minZoom=0, tileSize=64,
+                     layers=("nodes", "edges"), png=True, incremental=True):
+    """
+    Builds the tile pyramid of the outage results of an event, saved by the outage command.
+
+    Args:
+        network (str): Folder name corresponding to the network data.
+        eventName (str): Name of the event file.
+        folder (str or None): Folder of the pyramid (default: {network}/Outage/tiles/{event}).
+        maxZoom (int), minZoom (int): Deepest and shallowest zoom levels.
+        tileSize (int): Number of cells along each side of a tile.
+        layers (Iterable[str]): Components to tile, "nodes" and/or "edges".
+        png (bool): Also write a PNG of the max probability of every tile.
+        incremental (bool): Only rewrite the tiles of the components that changed since the last build
+            with the same zoom levels and tile size.
+
+    Returns:
+        Dict[str, int]: Number of tiles written or removed for every layer.
+    """
+    import json
+
+    if folder is None:
+        folder = f"{network}/Outage/tiles/{os.path.splitext(eventName)[0]}"
+    os.makedirs(folder, exist_ok=True)
+
+    written = {}
+    for layer in layers:
+        lon, lat, prob, kW = componentValues(network, eventName, layer)
+        x, y = mercatorCells(lon, lat, maxZoom, tileSize)
+        prob, kW = prob.astype("<f4"), kW.astype("<f4")
+
+        # Tiles of the deepest zoom to rewrite, all of them unless the last build can be compared
+        statePath = f"{folder}/{layer}/state.npz"
+        settings = np.array([maxZoom, minZoom, tileSize, len(prob)])
+        changedTiles = None
+        if incremental and os.path.isfile(statePath):
+            state = np.load(statePath)
+            if np.array_equal(state["settings"], settings):
+                changed = (state["x"] != x) | (state["y"] != y) | (state["prob"] != prob) | (state["kW"] != kW)
+                # A component that moved changes the tiles it left and the tiles it entered
+                changedTiles = np.concatenate([np.column_stack([x[changed], y[changed]]),
+                                               np.column_stack([state["x"][changed], state["y"][changed]])]) // tileSize
+
+        if changedTiles is None and os.path.isdir(f"{folder}/{layer}"):
+            import shutil
+            # Tiles of other zoom levels or tile sizes must not be left behind
+            shutil.rmtree(f"{folder}/{layer}")
+
+        # Values of the occupied cells of the deepest zoom, then of every shallower zoom
+        valid = ~np.isnan(prob)
+        cells = aggregateCells(x[valid], y[valid], np.ones(valid.sum()), prob[valid].astype(float), prob[valid].astype(float),
+                               kW[valid].astype(float), (prob[valid] * kW[valid]).astype(float))
+        count = 0
+        for zoom in range(maxZoom, minZoom - 1, -1):
+            if zoom < maxZoom:
+                cells = aggregateCells(cells[0] // 2, cells[1] // 2, *cells[2:])
+            cx, cy, cellCount, total, maximum, load, risk = cells
+            tx, ty = cx // tileSize, cy // tileSize
+            # The cells of a tile are not contiguous in the order of the cells, so sort them by tile
+            order = np.lexsort((ty, tx))
+            tx, ty = tx[order], ty[order]
+            starts = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])]) if len(tx) else np.array([], dtype=np.int64)
+            stops = np.r_[starts[1:], len(tx)]
+            fields = np.stack([cellCount, maximum, total / cellCount, load, risk])[:, order]
+            rows, cols = cy[order] % tileSize, cx[order] % tileSize
+            tiles = {}
+            for start, stop in zip(starts, stops):
+                tiles[(int(tx[start]), int(ty[start]))] = (rows[start:stop], cols[start:stop], *fields[:, start:stop])
+
+            if changedTiles is None:
+                targets = list(tiles)
+            else:
+                targets = [tuple(tile) for tile in np.unique(changedTiles >> (maxZoom - zoom), axis=0).tolist()]
+            for tile in targets:
+                writeTile(folder, layer, zoom, *tile, tiles.get(tile), tileSize, png)
+            count += len(targets)
+        written[layer] = count
+        np.savez(statePath, settings=settings, x=x, y=y, prob=prob, kW=kW)
+
+    # Everything a client needs to read the tiles
+    with open(f"{folder}/tiles.json", "w") as f:
+        json.dump({"minZoom": minZoom, "maxZoom": maxZoom, "tileSize": tileSize, "fields": TILE_FIELDS, "dtype": "<f4",
+                   "layers": list(layers), "path": "{layer}/{z}/{x}/{y}.bin"}, f, indent=1)
+    return written
+
+def readTile(folder, layer, zoom, x, y):
+    """
+    Reads a tile of a pyramid built by buildOutageTiles.
+
+    Args:
+        folder (str): Folder of the pyramid.
+        layer (str): "nodes" or "edges".
+        zoom (int), x (int), y (int): Tile coordinates.
+
+    Returns:
+        np.ndarray or None: Fields of the cells of the tile, shape (fields, tileSize, tileSize), None when it has no component.
+    """
+    path = tilePath(folder, layer, zoom, x, y)
+    if not os.path.isfile(path):
+        return None
+    tile = np.fromfile(path, dtype="<f4")
+    size = int(round(np.sqrt(len(tile) / len(TILE_FIELDS))))
+    return tile.reshape(len(TILE_FIELDS), size, size)
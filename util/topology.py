@@ -0,0 +1,181 @@
+import numpy as np
+
+# Compact Tree Class used to propagate outage probabilities with arrays instead of graph traversals
+class Topology:
+    def __init__(self, numNodes, parent, parentEdge, order, levelStarts):
+        # Number of nodes in the network
+        self.numNodes = numNodes
+
+        # Parent node of every node (-1 for the roots and nodes that cannot be reached)
+        self.parent = parent
+
+        # Index of the edge connecting every node to its parent (-1 when there is no parent)
+        self.parentEdge = parentEdge
+
+        # Reachable nodes in breadth first order, starting with the roots
+        self.order = order
+
+        # order[levelStarts[d]:levelStarts[d+1]] holds the nodes at depth d
+        self.levelStarts = levelStarts
+
+    @classmethod
+    def fromEdges(cls, source, target, numNodes, roots=(0,)):
+        """
+        Builds the breadth first tree of a radial network from its edge list.
+
+        Args:
+            source (numpy.ndarray): Source node of every edge.
+            target (numpy.ndarray): Target node of every edge.
+            numNodes (int): Number of nodes in the network.
+            roots (Iterable[int]): Nodes where the search starts (the substation is node 0).
+
+        Returns:
+            Topology: The compact tree.
+        """
+        source = np.asarray(source, dtype=np.int64)
+        target = np.asarray(target, dtype=np.int64)
+
+        # Sort the edges by source to get the children of every node as a contiguous slice
+        edgeOrder = np.argsort(source, kind="stable")
+        children = target[edgeOrder]
+        indptr = np.zeros(numNodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=numNodes), out=indptr[1:])
+
+        parent = np.full(numNodes, -1, dtype=np.int64)
+        parentEdge = np.full(numNodes, -1, dtype=np.int64)
+        visited = np.zeros(numNodes, dtype=bool)
+
+        frontier = np.unique(np.asarray(roots, dtype=np.int64))
+        visited[frontier] = True
+        levels = [frontier]
+        while frontier.size:
+            # Gather the slices of children of every node in the frontier
+            starts = indptr[frontier]
+            counts = indptr[frontier + 1] - starts
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            nextNodes = children[offsets]
+            nextParents = np.repeat(frontier, counts)
+            nextEdges = edgeOrder[offsets]
+
+            # Keep the first edge reaching every node that has not been visited yet
+            nextNodes, first = np.unique(nextNodes, return_index=True)
+            keep = ~visited[nextNodes]
+            nextNodes, first = nextNodes[keep], first[keep]
+            visited[nextNodes] = True
+            parent[nextNodes] = nextParents[first]
+            parentEdge[nextNodes] = nextEdges[first]
+
+            if nextNodes.size:
+                levels.append(nextNodes)
+            frontier = nextNodes
+
+        levelStarts = np.zeros(len(levels) + 1, dtype=np.int64)
+        np.cumsum([len(level) for level in levels], out=levelStarts[1:])
+        return cls(numNodes, parent, parentEdge, np.concatenate(levels), levelStarts)
+
+    def levels(self):
+        """
+        Iterates over the nodes of every depth, starting with the roots.
+
+        Returns:
+            Iterator[numpy.ndarray]: Nodes at each depth.
+        """
+        for d in range(len(self.levelStarts) - 1):
+            yield self.order[self.levelStarts[d]:self.levelStarts[d + 1]]
+
+    def propagate(self, probN, probE, out=None):
+        """
+        Array version of probOfNodeAndParent. A node is out when it, or any node or edge on its path
+        to the root, is out. Every depth is processed in a single vectorized step.
+
+        Args:
+            probN (numpy.ndarray): Probability of an outage of every node, shape (nodes,) or (nodes, bounds).
+            probE (numpy.ndarray): Probability of an outage of every edge, shape (edges,) or (edges, bounds).
+            out (numpy.ndarray or None): Optional array (e.g. a memory map) receiving the result.
+
+        Returns:
+            numpy.ndarray: Probability of an outage of every node taking into account its path to the root.
+        """
+        # Work with the probability of every node staying energized, in place when an output is given
+        probN = np.asarray(probN, dtype=float)
+        survive = np.subtract(1, probN) if out is None else np.subtract(1, probN, out=out)
+        probE = np.asarray(probE, dtype=float)
+        for level in list(self.levels())[1:]:
+            survive[level] *= survive[self.parent[level]] * (1 - probE[self.parentEdge[level]])
+        return np.subtract(1, survive, out=survive)
+
+    def propagateSubtrees(self, probN, probE, prob, changed):
+        """
+        Updates the result of propagate for the subtrees of some nodes only, e.g. the nodes whose path
+        to the root changed after a switching operation. The other nodes keep their probability in prob.
+
+        Args:
+            probN (numpy.ndarray): Probability of an outage of every node, shape (nodes,) or (nodes, bounds).
+            probE (numpy.ndarray): Probability of an outage of every edge, shape (edges,) or (edges, bounds).
+            prob (numpy.ndarray): Result of propagate before the change, with the shape of probN.
+            changed (numpy.ndarray): Whether the path of every node to the root changed.
+
+        Returns:
+            prob (numpy.ndarray): Updated copy of prob.
+            affected (numpy.ndarray): Whether every node was recomputed (the changed nodes and everything downstream of them).
+        """
+        probN = np.asarray(probN, dtype=float)
+        probE = np.asarray(probE, dtype=float)
+        survive = 1 - np.asarray(prob, dtype=float)
+        affected = np.array(changed, dtype=bool)
+        levels = list(self.levels())
+        roots = levels[0][affected[levels[0]]]
+        survive[roots] = 1 - probN[roots]
+        for level in levels[1:]:
+            # A node is recomputed when it changed or its parent was recomputed
+            affected[level] |= affected[self.parent[level]]
+            nodes = level[affected[level]]
+            survive[nodes] = (1 - probN[nodes]) * survive[self.parent[nodes]] * (1 - probE[self.parentEdge[nodes]])
+        return 1 - survive, affected
+
+    def propagateGradient(self, probN, probE, gradN, gradE):
+        """
+        propagate along with the derivatives of the result with respect to parameters, by the product
+        rule along the path of every node to the root, one depth at a time.
+
+        Args:
+            probN (numpy.ndarray): Probability of an outage of every node, shape (nodes, ...).
+            probE (numpy.ndarray): Probability of an outage of every edge, shape (edges, ...).
+            gradN (numpy.ndarray): Derivatives of probN, shape (nodes, ..., parameters).
+            gradE (numpy.ndarray): Derivatives of probE, shape (edges, ..., parameters).
+
+        Returns:
+            prob (numpy.ndarray): Probability of an outage of every node taking into account its path to the root.
+            grad (numpy.ndarray): Derivatives of prob, shape (nodes, ..., parameters).
+        """
+        probE = np.asarray(probE, dtype=float)
+        gradE = np.asarray(gradE, dtype=float)
+        survive = 1 - np.asarray(probN, dtype=float)
+        dSurvive = -np.asarray(gradN, dtype=float)
+        for level in list(self.levels())[1:]:
+            parent, edge = self.parent[level], self.parentEdge[level]
+            # Probability of the path above the node staying energized and its derivatives
+            works = 1 - probE[edge]
+            path = survive[parent] * works
+            dPath = dSurvive[parent] * works[..., None] - survive[parent][..., None] * gradE[edge]
+            dSurvive[level] = dSurvive[level] * path[..., None] + survive[level][..., None] * dPath
+            survive[level] = survive[level] * path
+        return 1 - survive, -dSurvive
+
+    def subtreeSum(self, values):
+        """
+        Sums a value over the subtree of every node (the node and everything downstream of it) by
+        accumulating the deepest level into its parents first. Runs in linear time.
+
+        Args:
+            values (numpy.ndarray): Value of every node, shape (nodes,) or (nodes, columns).
+
+        Returns:
+            numpy.ndarray: Sum of the values over the subtree of every node.
+        """
+        total = np.array(values, dtype=float)
+        levels = list(self.levels())
+        for level in reversed(levels[1:]):
+            # Every node has a single parent, but siblings share it, so use an unbuffered add
+            np.add.at(total, self.parent[level], total[level])
+        return total